@@ -0,0 +1,1062 @@
+"""Performance benchmarks for Retro Khaata.
+
+Usage:
+    python bench.py startup     # import-time regression guard for headless commands
+    python bench.py concurrency # N writer processes sharing one data directory
+    python bench.py ids         # invoice number allocation rate
+    python bench.py pdf         # layout template vs the hand-written InvoicePDF
+    python bench.py lines       # one invoice with thousands of line items
+    python bench.py rates       # INR conversion of a whole invoice history
+    python bench.py queue       # prompt latency of create-invoice, inline vs queued PDF
+    python bench.py suite       # storage, listing and PDF paths at 1k/10k/100k invoices
+    python bench.py snapshot    # load time and memory of JSON vs binary snapshots
+    python bench.py billing     # one batched billing run vs creating invoices one by one
+    python bench.py archive     # startup and save time before and after archiving old years
+    python bench.py gst         # GST on a whole history, and its GSTR-1 summary in one pass
+
+`suite` writes machine-readable results with --output and checks them
+against an earlier run with --baseline, failing on regressions.
+"""
+
+import argparse
+import multiprocessing
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from itertools import islice
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MAIN = os.path.join(HERE, "main.py")
+
+# --- STARTUP ---
+
+# Cumulative `import main` budget, measured with `python -X importtime`.
+STARTUP_BUDGET_MS = 60
+# Modules a headless command must never pay for at import time.
+STARTUP_FORBIDDEN = ("fpdf", "rich", "concurrent.futures")
+
+
+def import_times(module="main"):
+    """Return {module: cumulative_us} for everything `import module` loads."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def bench_startup(args):
+    # Best of several runs: the first one also pays for cold .pyc/disk caches.
+    times = min((import_times() for _ in range(args.runs)), key=lambda t: t["main"])
+    total_ms = times["main"] / 1000
+    forbidden = sorted(
+        name
+        for name in times
+        if any(name == f or name.startswith(f + ".") for f in STARTUP_FORBIDDEN)
+    )
+
+    print(f"import main: {total_ms:.1f} ms (budget {STARTUP_BUDGET_MS} ms)")
+    heaviest = sorted(times.items(), key=lambda kv: kv[1], reverse=True)[1:6]
+    for name, us in heaviest:
+        print(f"  {us / 1000:7.1f} ms  {name}")
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        runs = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            subprocess.run(
+                [sys.executable, MAIN, "list-clients"],
+                cwd=data_dir,
+                capture_output=True,
+                check=True,
+            )
+            runs.append((time.perf_counter() - start) * 1000)
+    print(f"`main.py list-clients` wall time: median {statistics.median(runs):.1f} ms")
+
+    failed = False
+    if forbidden:
+        print(f"FAIL: headless import pulls in {', '.join(forbidden)}")
+        failed = True
+    if total_ms > STARTUP_BUDGET_MS:
+        print(f"FAIL: import main exceeds the {STARTUP_BUDGET_MS} ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+# --- CONCURRENCY ---
+
+STRESS_CLIENT = {
+    "id": 1,
+    "name": "Stress Client",
+    "address": "",
+    "type": "Indian",
+    "country": "India",
+    "currency": "INR",
+    "gst_id": "",
+}
+
+
+def stress_writer(job):
+    """One writer process: add invoices and stamp its own field on the client."""
+    data_dir, backend, worker, count, start_at = job
+    os.chdir(data_dir)
+    import main
+
+    store = main.open_store(backend)
+    main.RevenueReport(store)
+    main.SearchIndex(store)
+    time.sleep(max(0.0, start_at - time.time()))
+
+    retries = 0
+    for i in range(count):
+        store.add_invoice(
+            {
+                "id": f"INV-W{worker:03d}-{i:05d}",
+                "client_id": STRESS_CLIENT["id"],
+                "client_name": STRESS_CLIENT["name"],
+                "currency": "INR",
+                "date": "2026-04-01",
+                "services": [{"desc": f"job {i}", "rate": 100, "qty": 1}],
+                "reimbursements": [],
+                "total": 100.0,
+            }
+        )
+        # Every writer edits the same client, each touching its own field,
+        # so every update races the others and has to be merged.
+        base = store.get_client(STRESS_CLIENT["id"])
+        client = dict(base, **{f"w{worker}": i})
+        while True:
+            try:
+                store.update_client(client, base)
+                break
+            except main.ConflictError:
+                retries += 1
+                base = store.get_client(STRESS_CLIENT["id"])
+                client = dict(base, **{f"w{worker}": i})
+    store.close()
+    return retries
+
+
+def bench_concurrency(args):
+    sys.path.insert(0, HERE)
+    import main
+
+    failed = False
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.chdir(data_dir)
+        store = main.open_store(args.backend)
+        store.add_client(dict(STRESS_CLIENT))
+        store.close()
+
+        start_at = time.time() + 0.5
+        jobs = [
+            (data_dir, args.backend, w, args.records, start_at)
+            for w in range(args.writers)
+        ]
+        with multiprocessing.Pool(args.writers) as pool:
+            retries = sum(pool.map(stress_writer, jobs))
+        elapsed = time.time() - start_at
+        writes = args.writers * args.records * 2
+        print(
+            f"{args.writers} writers x {args.records} records ({args.backend}): "
+            f"{elapsed:.2f} s, {writes / elapsed:.0f} writes/s, {retries} retries"
+        )
+
+        # Check from a fresh process state, straight from disk
+        store = main.open_store(args.backend)
+        ids = [inv["id"] for inv in store.invoices()]
+        expected = args.writers * args.records
+        if len(ids) != expected or len(set(ids)) != expected:
+            print(f"FAIL: {len(set(ids))} distinct of {len(ids)} invoices, expected {expected}")
+            failed = True
+
+        client = store.get_client(STRESS_CLIENT["id"])
+        lost = [w for w in range(args.writers) if client.get(f"w{w}") != args.records - 1]
+        if lost:
+            print(f"FAIL: client updates lost for writers {lost}")
+            failed = True
+        if client["version"] != expected + 1:
+            print(f"FAIL: client version {client['version']}, expected {expected + 1}")
+            failed = True
+
+        report = main.RevenueReport(store).load()
+        index = main.SearchIndex(store).load()
+        if report["invoices"] != expected or index["counts"]["inv"] != expected:
+            print("FAIL: report or search index out of step with the store")
+            failed = True
+        store.close()
+        os.chdir(HERE)
+
+    if not failed:
+        print("OK: no lost or duplicated writes")
+    return 1 if failed else 0
+
+
+# --- IDS ---
+
+
+def bench_ids(args):
+    sys.path.insert(0, HERE)
+    import main
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.chdir(data_dir)
+        ids = main.IdAllocator(main.open_store("json"), dict(main.DEFAULT_CONFIG))
+
+        start = time.perf_counter()
+        single = [ids.next_invoice_id("2026-04-01") for _ in range(args.single)]
+        single_rate = args.single / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ids.batch():
+            batched = [ids.next_invoice_id("2026-04-01") for _ in range(args.batched)]
+        batch_rate = args.batched / (time.perf_counter() - start)
+        os.chdir(HERE)
+
+    print(f"one at a time: {single_rate:,.0f} ids/s (lock + fsync per id)")
+    print(f"batched:       {batch_rate:,.0f} ids/s")
+    issued = single + batched
+    if len(set(issued)) != len(issued):
+        print("FAIL: duplicate ids issued")
+        return 1
+    print(f"last id: {issued[-1]}")
+    return 0
+
+
+# --- PDF ---
+
+
+def sample_invoices(count, lines):
+    client = {
+        "id": 1,
+        "name": "Acme Corp",
+        "address": "12 MG Road, Bengaluru",
+        "country": "India",
+        "type": "Indian",
+        "currency": "INR",
+        "gst_id": "29ABCDE1234F1Z5",
+    }
+    invoices = [
+        {
+            "id": f"INV/2026-27/{n:05d}",
+            "date": "2026-04-01",
+            "services": [
+                {"desc": f"Consulting block {i}", "rate": 2500, "qty": 1 + i % 8}
+                for i in range(lines)
+            ],
+            "reimbursements": [{"desc": "Travel", "rate": 1200, "qty": 1}],
+        }
+        for n in range(count)
+    ]
+    return client, invoices
+
+
+def bench_pdf(args):
+    sys.path.insert(0, HERE)
+    import main
+    from invoice_pdf import InvoicePDF
+    from invoice_template import InvoiceTemplate
+
+    config = dict(main.DEFAULT_CONFIG)
+    client, invoices = sample_invoices(args.invoices, args.lines)
+
+    def legacy(inv):
+        pdf = InvoicePDF(client, inv, config)
+        pdf.generate()
+        return pdf.output()
+
+    def template(inv):
+        layout = InvoiceTemplate.for_config(main.invoice_layout_path(), config)
+        return layout.render(client, inv).output()
+
+    rates = {}
+    for name, render in (("InvoicePDF", legacy), ("template", template)):
+        render(invoices[0])  # warm up imports and the template's layers
+        start = time.perf_counter()
+        for inv in invoices:
+            render(inv)
+        rates[name] = len(invoices) / (time.perf_counter() - start)
+        print(f"{name:>10}: {rates[name]:7.1f} invoices/s")
+    print(f"speed-up: {rates['template'] / rates['InvoicePDF']:.2f}x")
+    return 0
+
+
+def bench_lines(args):
+    sys.path.insert(0, HERE)
+    import main
+    from invoice_template import InvoiceTemplate
+
+    config = dict(main.DEFAULT_CONFIG)
+    layout = InvoiceTemplate.for_config(main.invoice_layout_path(), config)
+    client, (invoice,) = sample_invoices(1, 1)
+    layout.render(client, invoice).output()  # warm up the static layers
+
+    failed = False
+    per_line = []
+    for lines in (args.lines // 10, args.lines):
+        client, (invoice,) = sample_invoices(1, lines)
+        start = time.perf_counter()
+        pdf = layout.render(client, invoice)
+        size = len(pdf.output())
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        layout.render(client, invoice).output()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        per_line.append((elapsed / lines, peak / lines))
+        print(
+            f"{lines:>6} lines: {pdf.page_no()} pages, {elapsed:.2f} s, "
+            f"{size / 1e6:.1f} MB PDF, peak {peak / 1e6:.1f} MB"
+        )
+
+    # Both costs should grow linearly: the per-line figures of the small
+    # and the large invoice should stay in the same range.
+    (small_t, small_m), (large_t, large_m) = per_line
+    print(
+        f"per line: {small_t * 1e6:.0f} -> {large_t * 1e6:.0f} us, "
+        f"{small_m / 1e3:.1f} -> {large_m / 1e3:.1f} kB"
+    )
+    if large_t > 2 * small_t or large_m > 2 * small_m:
+        print("FAIL: rendering cost grows faster than the line count")
+        failed = True
+    return 1 if failed else 0
+
+
+# --- RATES ---
+
+
+def bench_rates(args):
+    sys.path.insert(0, HERE)
+    from datetime import date, timedelta
+
+    from rates import RateTable
+
+    start_day = date(2020, 4, 1)
+    currencies = ("USD", "EUR", "GBP", "JPY", "CAD", "AUD")
+    with tempfile.TemporaryDirectory() as data_dir:
+        # Five years of weekday rates in the RBI layout
+        with open(os.path.join(data_dir, "rbi.csv"), "w") as f:
+            f.write("Date," + ",".join(f"INR / 1 {c}" for c in currencies) + "\n")
+            for n in range(5 * 365):
+                day = start_day + timedelta(days=n)
+                if day.weekday() < 5:
+                    rates = ",".join(f"{80 + i + n % 97 / 100:.4f}" for i in range(6))
+                    f.write(f"{day:%d-%m-%Y},{rates}\n")
+        start = time.perf_counter()
+        table = RateTable.load(data_dir)
+        load_s = time.perf_counter() - start
+
+    history = [
+        (
+            (("INR",) + currencies)[n % 7],
+            (start_day + timedelta(days=n * 7 % (5 * 365))).isoformat(),
+            100000 + n,
+        )
+        for n in range(args.invoices)
+    ]
+    currency_col, date_col, amount_col = (list(c) for c in zip(*history))
+
+    start = time.perf_counter()
+    inr, unconverted = table.to_inr_column(currency_col, date_col, amount_col)
+    column_s = time.perf_counter() - start
+
+    table.rate.cache_clear()
+    start = time.perf_counter()
+    one_by_one = [table.to_inr(c, d, a) for c, d, a in history]
+    row_s = time.perf_counter() - start
+
+    print(f"load rate files: {load_s * 1000:.0f} ms")
+    print(f"column pass:     {args.invoices / column_s:,.0f} invoices/s")
+    print(f"per invoice:     {args.invoices / row_s:,.0f} invoices/s (LRU lookups)")
+    if list(inr) != one_by_one or any(unconverted):
+        print("FAIL: column and per-invoice conversions disagree")
+        return 1
+    return 0
+
+
+# --- QUEUE ---
+
+
+def bench_queue(args):
+    sys.path.insert(0, HERE)
+    import main
+
+    config = dict(main.DEFAULT_CONFIG)
+    client, invoices = sample_invoices(2 * args.invoices, args.lines)
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.chdir(data_dir)
+        os.makedirs(main.INVOICE_DIR)
+        store = main.open_store("json")
+        store.add_client(dict(client))
+        queue = main.RenderQueue()
+
+        def inline(inv):
+            cache = main.RenderCache()
+            cache.render(client, inv, config)
+            cache.save()
+
+        def queued(inv):
+            queue.submit([inv["id"]])
+
+        latencies = {}
+        batches = (invoices[: args.invoices], invoices[args.invoices :])
+        for (name, finish), batch in zip((("inline", inline), ("queued", queued)), batches):
+            runs = []
+            for inv in batch:
+                start = time.perf_counter()
+                store.add_invoice(dict(inv, client_id=client["id"], client_name=client["name"]))
+                finish(inv)
+                runs.append((time.perf_counter() - start) * 1000)
+            latencies[name] = statistics.median(runs)
+            print(f"{name:>7}: median {latencies[name]:.1f} ms from last line item to prompt")
+
+        # Let the workers drain the queue before the directory goes away
+        deadline = time.time() + 60
+        while queue.load() and time.time() < deadline:
+            time.sleep(0.2)
+        left = len(queue.load())
+        rendered = len(os.listdir(main.INVOICE_DIR))
+        store.close()
+        os.chdir(HERE)
+
+    if left or rendered != len(invoices):
+        print(f"FAIL: {left} jobs left, {rendered} of {len(invoices)} PDFs written")
+        return 1
+    print(f"OK: background workers rendered all {args.invoices} queued PDFs")
+    return 0
+
+
+# --- SUITE ---
+
+# Word lists for synthetic client names and line items
+FIRST_NAMES = ("Acme", "Globex", "Initech", "Umbrella", "Stark", "Wayne", "Tata", "Infosys")
+LAST_NAMES = ("Corp", "Labs", "Systems", "Traders", "Consulting", "Ventures", "Exports")
+CITIES = {
+    "India": ("Bengaluru", "Mumbai", "Pune", "Chennai", "Delhi", "Hyderabad"),
+    "USA": ("New York", "Austin", "Seattle"),
+    "Germany": ("Berlin", "Munich"),
+    "UK": ("London", "Leeds"),
+    "Japan": ("Tokyo", "Osaka"),
+    "Canada": ("Toronto", "Vancouver"),
+    "Australia": ("Sydney", "Melbourne"),
+}
+COUNTRY_CURRENCY = {
+    "USA": "USD",
+    "Germany": "EUR",
+    "UK": "GBP",
+    "Japan": "JPY",
+    "Canada": "CAD",
+    "Australia": "AUD",
+}
+WORK = (
+    "API integration",
+    "Code review",
+    "Kubernetes migration",
+    "Data pipeline",
+    "Security audit",
+    "Performance tuning",
+    "On-call support",
+    "Dashboard redesign",
+)
+EXPENSES = ("Travel", "Hotel", "Cloud credits", "Software licence", "Courier")
+
+
+def synthetic_dataset(invoices, seed=42):
+    """Deterministic clients and invoices: the same seed always gives the same data.
+
+    About 60% of clients are Indian (INR, GSTIN) and the rest foreign in
+    the six supported currencies; invoices spread over three fiscal years
+    and have 1-12 service lines, a few long retainers with 40-80, and
+    reimbursements on roughly every third invoice.
+    """
+    sys.path.insert(0, HERE)
+    from money import InvoiceTotals
+
+    rng = random.Random(seed)
+    clients = []
+    for cid in range(1, max(10, invoices // 50) + 1):
+        country = "India" if rng.random() < 0.6 else rng.choice(sorted(COUNTRY_CURRENCY))
+        client = {
+            "id": cid,
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {cid}",
+            "address": f"{rng.randint(1, 999)} Main Road, {rng.choice(CITIES[country])}",
+            "country": country,
+            "version": 1,
+        }
+        if country == "India":
+            client.update(type="Indian", currency="INR", gst_id=f"29ABCDE{cid:04d}F1Z5")
+        else:
+            client.update(
+                type="Foreign", currency=COUNTRY_CURRENCY[country], vat_id=f"VAT{cid:06d}"
+            )
+        clients.append(client)
+
+    # Rates per hour in each currency, roughly comparable in value
+    hourly = {"INR": 2500, "USD": 60, "EUR": 55, "GBP": 48, "JPY": 9000, "CAD": 80, "AUD": 90}
+    records = []
+    days = sorted(rng.randrange(3 * 365) for _ in range(invoices))
+    sequences = {}
+    for n, day in enumerate(days):
+        client = rng.choice(clients)
+        year, day_of_year = 2023 + day // 365, day % 365
+        month, dom = 1 + day_of_year // 31 % 12, 1 + day_of_year % 28
+        date = f"{year}-{month:02d}-{dom:02d}"
+        start = year if month >= 4 else year - 1
+        fy = f"{start}-{(start + 1) % 100:02d}"
+        sequences[fy] = sequences.get(fy, 0) + 1
+        lines = rng.randint(40, 80) if rng.random() < 0.02 else rng.randint(1, 12)
+        rate = hourly[client["currency"]]
+        services = [
+            {
+                "desc": f"{rng.choice(WORK)} ({rng.choice(('week', 'sprint', 'phase'))} {i + 1})",
+                "rate": round(rate * rng.uniform(0.8, 1.5), 2),
+                "qty": rng.choice((1, 2, 4, 8, 16, 24, 40)),
+            }
+            for i in range(lines)
+        ]
+        reimbursements = []
+        if rng.random() < 0.3:
+            amount = round(rate * rng.uniform(1, 20), 2)
+            reimbursements.append({"desc": rng.choice(EXPENSES), "rate": amount, "qty": 1})
+        records.append(
+            {
+                "id": f"INV/{fy}/{sequences[fy]:05d}",
+                "client_id": client["id"],
+                "client_name": client["name"],
+                "currency": client["currency"],
+                "date": date,
+                "services": services,
+                "reimbursements": reimbursements,
+                "total": float(InvoiceTotals(services, reimbursements).total),
+                "version": 1,
+            }
+        )
+    return clients, records
+
+
+def _best_ms(func, repeat):
+    """Fastest of ``repeat`` timed runs after a warm-up one.
+
+    Noise on a shared machine only ever adds time, so the minimum is the
+    most repeatable figure to compare against a baseline (as timeit does).
+    """
+    func()  # lazy imports, caches, the store's first sync
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append((time.perf_counter() - start) * 1000)
+    return min(runs)
+
+
+def suite_scale(main, scale, backend, args):
+    """Results ``{metric: ms}`` for one dataset size and storage backend."""
+    import io
+
+    from rich.console import Console
+
+    clients, invoices = synthetic_dataset(scale, args.seed)
+    rng = random.Random(args.seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.chdir(data_dir)
+        os.makedirs(main.INVOICE_DIR)
+        main.DataManager.save(main.DATA_FILE_CLIENTS, clients)
+        main.DataManager.save(main.DATA_FILE_INVOICES, invoices)
+        if backend == "sqlite":
+            store = main.open_store("sqlite")
+            store.add_clients(clients)
+            store.add_invoices(invoices)
+            store.close()
+
+        if backend == "json":
+            results["datamanager.load"] = _best_ms(
+                lambda: main.DataManager.load(main.DATA_FILE_INVOICES), args.repeat
+            )
+            results["datamanager.save"] = _best_ms(
+                lambda: main.DataManager.save(main.DATA_FILE_INVOICES, invoices), args.repeat
+            )
+
+        # A fresh interpreter each time: imports, store open and config load
+        startup = [
+            sys.executable,
+            "-c",
+            "import time; t = time.perf_counter(); import main; main.RetroShell(); "
+            "print((time.perf_counter() - t) * 1000)",
+        ]
+        env = dict(os.environ, PYTHONPATH=HERE, KHAATA_BACKEND=backend, KHAATA_METRICS="0")
+        results["shell.startup"] = min(
+            float(subprocess.run(startup, env=env, capture_output=True, check=True).stdout)
+            for _ in range(args.repeat)
+        )
+
+        main.STORAGE_BACKEND = backend
+        main.LazyConsole._console = Console(file=io.StringIO(), width=100)
+        shell = main.RetroShell()
+        results["list_invoices.latest_page"] = _best_ms(
+            lambda: shell.do_list_invoices(["--sort", "date", "--desc", "--limit", "50"]),
+            args.repeat,
+        )
+        main.LazyConsole._console = None
+
+        listing = argparse.Namespace(
+            client=None,
+            date_from=None,
+            date_to=None,
+            sort=None,
+            desc=False,
+            limit=None,
+            offset=0,
+            format="tsv",
+        )
+        stdout = sys.stdout
+
+        def list_all():
+            sys.stdout = io.StringIO()
+            try:
+                shell.cli_list_invoices(listing)
+            finally:
+                sys.stdout = stdout
+
+        results["list_invoices.all_tsv"] = _best_ms(list_all, args.repeat)
+        # One client's history, through the client index
+        listing.client = rng.choice(clients)["name"]
+        results["list_invoices.client_tsv"] = _best_ms(list_all, args.repeat)
+
+        # Payments touch one invoice's balance; aging reads only the open ones
+        unpaid = iter(rng.sample(invoices, min(len(invoices), 10 * (args.repeat + 1))))
+        today = date.today().isoformat()
+
+        def record_payments():
+            for invoice in islice(unpaid, 10):
+                shell.receivables.record(invoice["id"], 1, today, shell.ids)
+
+        results["receivables.record_payment"] = _best_ms(record_payments, args.repeat) / 10
+        results["receivables.aging"] = _best_ms(shell.receivables.aging, args.repeat)
+
+        wanted = [rng.choice(invoices)["id"] for _ in range(args.lookups)]
+        results["get_invoice.per_lookup"] = _best_ms(
+            lambda: [shell.store.get_invoice(i) for i in wanted], args.repeat
+        ) / len(wanted)
+
+        sample = [rng.choice(invoices) for _ in range(args.pdfs)]
+        by_id = {c["id"]: c for c in clients}
+        config = dict(main.DEFAULT_CONFIG)
+        main.render_invoice_pdf(by_id[sample[0]["client_id"]], sample[0], config)  # warm-up
+
+        def render_all():
+            for inv in sample:
+                main.render_invoice_pdf(by_id[inv["client_id"]], inv, config)
+
+        per_invoice = _best_ms(render_all, args.repeat) / len(sample)
+        results["pdf.render_output.per_invoice"] = per_invoice
+        shell.store.close()
+        os.chdir(HERE)
+    return results
+
+
+def bench_suite(args):
+    sys.path.insert(0, HERE)
+    import main
+
+    scales = [int(s) for s in args.scales.split(",")]
+    backends = ["json", "sqlite"] if args.backend == "both" else [args.backend]
+    report = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    for scale in scales:
+        for backend in backends:
+            start = time.perf_counter()
+            for metric, ms in suite_scale(main, scale, backend, args).items():
+                report["results"][f"{scale}/{backend}/{metric}"] = round(ms, 4)
+            elapsed = time.perf_counter() - start
+            print(f"{scale:>7} invoices, {backend}: {elapsed:.1f} s", file=sys.stderr)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    print(f"{'metric':<55} {'ms':>12}" + (f" {'baseline':>12} {'change':>8}" if baseline else ""))
+    regressions = []
+    for key, ms in report["results"].items():
+        line = f"{key:<55} {ms:>12.3f}"
+        if baseline and key in baseline:
+            change = ms / baseline[key] - 1 if baseline[key] else 0.0
+            line += f" {baseline[key]:>12.3f} {change:>+8.1%}"
+            # Sub-millisecond jitter is noise however large it is relative
+            if change > args.threshold and ms - baseline[key] > args.min_ms:
+                regressions.append(key)
+                line += "  REGRESSION"
+        print(line)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.output}", file=sys.stderr)
+    if regressions:
+        print(f"FAIL: {len(regressions)} metrics regressed by over {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+# --- SNAPSHOT ---
+
+# Loads one snapshot in a fresh process; prints load ms and peak RSS growth
+SNAPSHOT_CHILD = """
+import json, resource, sys, time
+sys.path.insert(0, sys.argv[1])
+import main
+
+def peak_kb():
+    # ru_maxrss survives exec on Linux, so it would report the parent's peak
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(l.split()[1]) for l in f if l.startswith("VmHWM:"))
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+before = peak_kb()
+start = time.perf_counter()
+records = main.DataManager.load(main.DATA_FILE_INVOICES)
+ms = (time.perf_counter() - start) * 1000
+peak = peak_kb() - before
+print(json.dumps({"ms": ms, "rss_kb": peak, "records": len(records)}))
+"""
+
+
+def bench_snapshot(args):
+    sys.path.insert(0, HERE)
+    import main
+
+    _, invoices = synthetic_dataset(args.invoices)
+    results = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.chdir(data_dir)
+        env = dict(os.environ, KHAATA_METRICS="0")
+        for name, binary in (("json", False), ("binary", True)):
+            start = time.perf_counter()
+            main.DataManager.compact(main.DATA_FILE_INVOICES, invoices, binary)
+            write_ms = (time.perf_counter() - start) * 1000
+            if main.DataManager.load(main.DATA_FILE_INVOICES) != invoices:
+                print(f"FAIL: {name} snapshot did not load back the same records")
+                return 1
+            runs = [
+                json.loads(
+                    subprocess.run(
+                        [sys.executable, "-c", SNAPSHOT_CHILD, HERE],
+                        env=env,
+                        capture_output=True,
+                        check=True,
+                    ).stdout
+                )
+                for _ in range(args.repeat)
+            ]
+            results[name] = {
+                "size": os.path.getsize(main.DATA_FILE_INVOICES),
+                "write_ms": write_ms,
+                "load_ms": min(r["ms"] for r in runs),
+                "rss_kb": min(r["rss_kb"] for r in runs),
+            }
+        os.chdir(HERE)
+
+    print(f"{args.invoices:,} invoices")
+    print(f"{'format':<8} {'file MB':>9} {'write ms':>10} {'load ms':>10} {'peak RSS MB':>12}")
+    for name, r in results.items():
+        print(
+            f"{name:<8} {r['size'] / 1e6:>9.1f} {r['write_ms']:>10.0f} "
+            f"{r['load_ms']:>10.0f} {r['rss_kb'] / 1024:>12.0f}"
+        )
+    old, new = results["json"], results["binary"]
+    print(
+        f"binary loads {old['load_ms'] / new['load_ms']:.1f}x faster in "
+        f"{new['rss_kb'] / old['rss_kb']:.0%} of the memory, "
+        f"from a {new['size'] / old['size']:.0%} size file"
+    )
+    return 0
+
+
+# --- BILLING ---
+
+
+def bench_billing(args):
+    sys.path.insert(0, HERE)
+    import main
+
+    config = dict(main.DEFAULT_CONFIG)
+    clients, _ = synthetic_dataset(args.plans * 50)
+    clients = clients[: args.plans]
+    items = [{"desc": "Retainer {month}", "rate": 1500.0, "qty": 1.0}]
+    through = main.add_months(date(2025, 4, 1), args.months - 1).isoformat()
+    results = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        for mode in ("one by one", "run-billing"):
+            os.chdir(tempfile.mkdtemp(dir=data_dir))
+            store = main.open_store("json")
+            store.add_clients(dict(c) for c in clients)
+            ids = main.IdAllocator(store, config)
+            billing = main.RecurringBilling()
+            for client in clients:
+                plan = {"client_id": client["id"], "cadence": "monthly", "start": "2025-04-01"}
+                billing.add(dict(plan, services=items, reimbursements=[]), ids)
+
+            start = time.perf_counter()
+            if mode == "run-billing":
+                created, _ = billing.run(store, ids, through)
+                again, _ = billing.run(store, ids, through)
+                if again:
+                    print(f"FAIL: a repeated run issued {len(again)} more invoices")
+                    return 1
+            else:
+                # What create-invoice does for each invoice
+                created = []
+                for plan, client, on in billing.due(store, through):
+                    invoice = main.RetroShell._new_invoice(client, items, [], on)
+                    with ids.batch():
+                        invoice["id"] = ids.next_invoice_id(on)
+                        store.add_invoice(invoice)
+                    created.append(invoice)
+            results[mode] = time.perf_counter() - start
+            numbers = sorted(int(i["id"].rsplit("/", 1)[1]) for i in created)
+            if numbers != list(range(1, len(created) + 1)):
+                print(f"FAIL: {mode} numbers are not consecutive")
+                return 1
+            print(f"{mode:>12}: {len(created)} invoices in {results[mode]:.2f} s")
+            store.close()
+            os.chdir(HERE)
+    print(f"run-billing is {results['one by one'] / results['run-billing']:.1f}x faster")
+    return 0
+
+
+def bench_archive(args):
+    sys.path.insert(0, HERE)
+    import main
+
+    clients, invoices = synthetic_dataset(args.invoices)
+    years = sorted({main.fiscal_year(i["date"]) for i in invoices})
+    oldest = next(i["id"] for i in invoices if main.fiscal_year(i["date"]) == years[0])
+    # Startup, then one lookup in the oldest year, in a fresh interpreter
+    probe = [
+        sys.executable,
+        "-c",
+        "import time; t = time.perf_counter(); import main; shell = main.RetroShell(); "
+        "print((time.perf_counter() - t) * 1000); t = time.perf_counter(); "
+        f"shell.store.get_invoice({oldest!r}); print((time.perf_counter() - t) * 1000)",
+    ]
+    env = dict(os.environ, PYTHONPATH=HERE, KHAATA_METRICS="0")
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.chdir(data_dir)
+        os.makedirs(main.INVOICE_DIR)
+        main.DataManager.save(main.DATA_FILE_CLIENTS, clients)
+        main.DataManager.save(main.DATA_FILE_INVOICES, invoices)
+        for archived in (False, True):
+            store = main.open_store("json")
+            if archived:
+                start = time.perf_counter()
+                moved = store.archive_years(years[:-1])
+                print(
+                    f"archived {sum(moved.values())} invoices of {len(moved)} fiscal years "
+                    f"in {time.perf_counter() - start:.2f} s"
+                )
+            runs = [
+                subprocess.run(probe, env=env, capture_output=True, check=True, text=True)
+                for _ in range(args.runs)
+            ]
+            startup, lookup = (min(float(r.stdout.split()[n]) for r in runs) for n in (0, 1))
+            save = _best_ms(
+                lambda: main.DataManager.compact(main.DATA_FILE_INVOICES, store._invoices),
+                args.runs,
+            )
+            size = os.path.getsize(main.DATA_FILE_INVOICES) / 1e6
+            label = f"{len(years) - 1} years archived" if archived else "all hot"
+            print(
+                f"{label:>18}: startup {startup:.0f} ms, save {save:.0f} ms, "
+                f"lookup of {oldest} {lookup:.0f} ms, {main.DATA_FILE_INVOICES} {size:.1f} MB"
+            )
+        os.chdir(HERE)
+    return 0
+
+
+def bench_gst(args):
+    sys.path.insert(0, HERE)
+    from datetime import timedelta
+
+    import main
+    from gst import Gstr1, invoice_tax, state_of
+    from money import InvoiceTotals, to_minor
+    from rates import RateError, RateTable
+
+    config = dict(main.DEFAULT_CONFIG, gstin="29ABCDE1234F1Z5", lut="AD2903260001234")
+    clients, invoices = synthetic_dataset(args.invoices)
+    # Spread the Indian clients over home-state, other-state and unregistered
+    for client in clients:
+        if client["type"] == "Indian" and client["id"] % 3:
+            client["gst_id"] = ("07" + client["gst_id"][2:], "ABCDE1234F")[client["id"] % 3 - 1]
+            client["state_code"] = "27"
+    by_id = {c["id"]: c for c in clients}
+
+    start = time.perf_counter()
+    for invoice in invoices:
+        invoice["tax"] = invoice_tax(config, by_id[invoice["client_id"]], invoice["services"])
+        invoice["total"] = float(InvoiceTotals.of(invoice).total)
+    tax_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as rates_dir:
+        currencies = sorted(set(COUNTRY_CURRENCY.values()))
+        with open(os.path.join(rates_dir, "rbi.csv"), "w") as f:
+            f.write("Date," + ",".join(f"INR / 1 {c}" for c in currencies) + "\n")
+            day = date(2023, 1, 1)
+            while day < date(2026, 12, 31):
+                if day.weekday() < 5:
+                    f.write(f"{day:%d-%m-%Y}," + ",".join("80.5" for _ in currencies) + "\n")
+                day += timedelta(days=1)
+        rates = RateTable.load(rates_dir)
+
+    first, last = min(i["date"] for i in invoices), max(i["date"] for i in invoices)
+    start = time.perf_counter()
+    report = Gstr1.from_invoices(invoices, rates, config["gstin"], first, last)
+    totals = report.totals()
+    batched_s = time.perf_counter() - start
+    start = time.perf_counter()
+    report.to_dict()
+    return_s = time.perf_counter() - start
+
+    # The same section totals walked invoice by invoice, converting one at a time
+    start = time.perf_counter()
+    values = {}
+    for invoice in invoices:
+        tax = invoice["tax"]
+        if tax["regime"] == "export":
+            section = "exp"
+        elif state_of(tax.get("ctin")):
+            section = "b2b"
+        elif tax["regime"] == "inter" and to_minor(invoice["total"]) > 10_000_000:
+            section = "b2cl"
+        else:
+            section = "b2cs"
+        try:
+            value = rates.to_inr(invoice["currency"], invoice["date"], to_minor(invoice["total"]))
+        except RateError:
+            value = 0
+        values[section] = values.get(section, 0) + value
+    naive_s = time.perf_counter() - start
+
+    print(f"tax {len(invoices)} invoices: {len(invoices) / tax_s:,.0f} invoices/s")
+    print(f"section totals, batched:    {batched_s * 1000:.0f} ms")
+    print(f"section values one by one:  {naive_s * 1000:.0f} ms (cross-check)")
+    print(f"full return JSON:           {return_s * 1000:.0f} ms")
+    if any(values.get(name, 0) != cell[1] for name, cell in totals.items()):
+        print("FAIL: batched and per-invoice section values disagree")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("startup", help="guard headless import time")
+    p.add_argument("--runs", type=int, default=5, help="samples per measurement")
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("concurrency", help="stress concurrent writer processes")
+    p.add_argument("--writers", type=int, default=8, help="writer processes")
+    p.add_argument("--records", type=int, default=50, help="invoices per writer")
+    p.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    p.set_defaults(func=bench_concurrency)
+
+    p = sub.add_parser("ids", help="measure id allocation throughput")
+    p.add_argument("--single", type=int, default=200, help="ids allocated one by one")
+    p.add_argument("--batched", type=int, default=20000, help="ids allocated in a batch")
+    p.set_defaults(func=bench_ids)
+
+    p = sub.add_parser("pdf", help="compare PDF rendering throughput")
+    p.add_argument("--invoices", type=int, default=300, help="invoices to render")
+    p.add_argument("--lines", type=int, default=5, help="service lines per invoice")
+    p.set_defaults(func=bench_pdf)
+
+    p = sub.add_parser("lines", help="render one very long invoice")
+    p.add_argument("--lines", type=int, default=10000, help="service lines")
+    p.set_defaults(func=bench_lines)
+
+    p = sub.add_parser("rates", help="convert an invoice history to INR")
+    p.add_argument("--invoices", type=int, default=100000, help="invoices to convert")
+    p.set_defaults(func=bench_rates)
+
+    p = sub.add_parser("queue", help="compare inline and queued PDF rendering latency")
+    p.add_argument("--invoices", type=int, default=20, help="invoices per mode")
+    p.add_argument("--lines", type=int, default=20, help="service lines per invoice")
+    p.set_defaults(func=bench_queue)
+
+    p = sub.add_parser("gst", help="tax an invoice history and summarise it as a GSTR-1")
+    p.add_argument("--invoices", type=int, default=50000, help="invoices to tax")
+    p.set_defaults(func=bench_gst)
+
+    p = sub.add_parser("suite", help="storage, listing and PDF benchmarks at several scales")
+    p.add_argument("--scales", default="1000,10000", help="comma-separated invoice counts")
+    p.add_argument("--backend", choices=("json", "sqlite", "both"), default="json")
+    p.add_argument("--repeat", type=int, default=5, help="runs per measurement (best of)")
+    p.add_argument("--seed", type=int, default=42, help="synthetic data seed")
+    p.add_argument("--lookups", type=int, default=200, help="get_invoice calls per run")
+    p.add_argument("--pdfs", type=int, default=10, help="PDFs rendered per run")
+    p.add_argument("--output", help="write results as JSON to this file")
+    p.add_argument("--baseline", help="results JSON of an earlier run to compare with")
+    p.add_argument(
+        "--threshold", type=float, default=0.25, help="slowdown that counts as a regression"
+    )
+    p.add_argument(
+        "--min-ms",
+        type=float,
+        default=1.0,
+        help="ignore slowdowns smaller than this many milliseconds",
+    )
+    p.set_defaults(func=bench_suite)
+
+    p = sub.add_parser("snapshot", help="load time and memory of JSON vs binary snapshots")
+    p.add_argument("--invoices", type=int, default=100000, help="invoices in the history")
+    p.add_argument("--repeat", type=int, default=3, help="loads per format (best of)")
+    p.set_defaults(func=bench_snapshot)
+
+    p = sub.add_parser("billing", help="batched billing run vs one invoice at a time")
+    p.add_argument("--plans", type=int, default=200, help="monthly retainer plans")
+    p.add_argument("--months", type=int, default=12, help="months to bill")
+    p.set_defaults(func=bench_billing)
+
+    p = sub.add_parser("archive", help="startup and save cost before and after archiving")
+    p.add_argument("--invoices", type=int, default=60000, help="invoices over four fiscal years")
+    p.add_argument("--runs", type=int, default=3, help="samples per measurement")
+    p.set_defaults(func=bench_archive)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
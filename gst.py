@@ -0,0 +1,393 @@
+"""GST on invoices, and the GSTR-1 summary of a return period.
+
+The supplier's GSTIN (``config["gstin"]``) fixes its state; without one no
+GST is charged at all. The rule set of an invoice follows from the client
+and the place of supply:
+
+- ``intra``: a client in the supplier's state pays CGST and SGST at half the
+  rate each;
+- ``inter``: a client in another state pays IGST at the full rate;
+- ``export``: services to a Foreign client are zero-rated, supplied under a
+  Letter of Undertaking without payment of IGST.
+
+The place of supply of a client is the state code of its GSTIN, else its
+``state_code``, else the supplier's own state. Only service lines are taxed;
+reimbursements are recovered as a pure agent. Each line carries an HSN/SAC
+code and a rate (config defaults when it has none). With ``line`` rounding
+every tax on every line is rounded half-up to the paisa and the invoice tax
+is the sum of the lines; with ``invoice`` rounding the taxable values are
+summed per code and rate first and each sum is taxed and rounded once.
+Amounts are integer minor units throughout.
+"""
+
+import re
+from decimal import Decimal, InvalidOperation
+
+from money import LineItem, from_minor, to_minor
+
+GSTIN_RE = re.compile(r"(\d{2})[A-Z]{5}\d{4}[A-Z][1-9A-Z]Z[0-9A-Z]")
+HSN_SAC_RE = re.compile(r"\d{4}(?:\d{2}){0,2}")
+RATE_UNITS = 1000  # rates are held in thousandths of a percent: 18% is 18000
+REGIMES = ("intra", "inter", "export")
+ROUNDING = ("line", "invoice")
+EXPORT_PLACE = "96"  # "Other Countries" in GST returns
+B2CL_LIMIT = 10_000_000  # paise; larger inter-state B2C invoices are reported one by one
+
+STATES = {
+    "01": "Jammu and Kashmir",
+    "02": "Himachal Pradesh",
+    "03": "Punjab",
+    "04": "Chandigarh",
+    "05": "Uttarakhand",
+    "06": "Haryana",
+    "07": "Delhi",
+    "08": "Rajasthan",
+    "09": "Uttar Pradesh",
+    "10": "Bihar",
+    "11": "Sikkim",
+    "12": "Arunachal Pradesh",
+    "13": "Nagaland",
+    "14": "Manipur",
+    "15": "Mizoram",
+    "16": "Tripura",
+    "17": "Meghalaya",
+    "18": "Assam",
+    "19": "West Bengal",
+    "20": "Jharkhand",
+    "21": "Odisha",
+    "22": "Chhattisgarh",
+    "23": "Madhya Pradesh",
+    "24": "Gujarat",
+    "26": "Dadra and Nagar Haveli and Daman and Diu",
+    "27": "Maharashtra",
+    "29": "Karnataka",
+    "30": "Goa",
+    "31": "Lakshadweep",
+    "32": "Kerala",
+    "33": "Tamil Nadu",
+    "34": "Puducherry",
+    "35": "Andaman and Nicobar Islands",
+    "36": "Telangana",
+    "37": "Andhra Pradesh",
+    "38": "Ladakh",
+    "97": "Other Territory",
+    EXPORT_PLACE: "Other Countries",
+}
+
+
+def state_of(gstin):
+    """Two-digit state code of a GSTIN, or None if ``gstin`` is not a GSTIN."""
+    match = GSTIN_RE.fullmatch((gstin or "").strip().upper())
+    return match.group(1) if match and match.group(1) in STATES else None
+
+
+def place_name(code):
+    return f"{code}-{STATES.get(code, 'Unknown')}"
+
+
+def rate_units(rate):
+    """A percentage (18, "2.5") as an int of RATE_UNITS, checked to be a usable rate."""
+    try:
+        units = Decimal(str(rate)) * RATE_UNITS
+    except InvalidOperation:
+        raise ValueError(f"not a GST rate: '{rate}'")
+    if units != units.to_integral_value() or not 0 <= units <= 100 * RATE_UNITS:
+        raise ValueError(f"not a GST rate: '{rate}'")
+    return int(units)
+
+
+def percent(units):
+    """A rate in RATE_UNITS back as a percentage: 18 or 2.5."""
+    whole, rest = divmod(units, RATE_UNITS)
+    return units / RATE_UNITS if rest else whole
+
+
+def _share(minor, units, parts=1):
+    """``1/parts`` of ``units`` percent of ``minor``, rounded half-up (away from zero)."""
+    scale = 100 * RATE_UNITS * parts
+    tax, rest = divmod(abs(minor) * units, scale)
+    tax += 2 * rest >= scale
+    return tax if minor >= 0 else -tax
+
+
+def line_tax(regime, units, taxable):
+    """``(cgst, sgst, igst)`` on ``taxable`` minor units at ``units`` under ``regime``."""
+    if regime == "intra":
+        half = _share(taxable, units, 2)
+        return half, half, 0
+    if regime == "inter":
+        return 0, 0, _share(taxable, units)
+    return 0, 0, 0
+
+
+def supply(config, client):
+    """``(regime, place of supply)`` of an invoice, or None when no GST is charged."""
+    home = state_of(config.get("gstin"))
+    if home is None:
+        return None
+    if client.get("type") == "Foreign":
+        return "export", EXPORT_PLACE
+    place = state_of(client.get("gst_id")) or str(client.get("state_code") or home)
+    return ("intra" if place == home else "inter"), place
+
+
+def invoice_tax(config, client, services):
+    """The tax breakdown stored on an invoice as ``tax``, or None when untaxed.
+
+    Service lines without ``sac`` / ``gst_rate`` get the config defaults
+    written into them, so the invoice records what it was taxed at.
+    """
+    rule = supply(config, client)
+    if rule is None:
+        return None
+    regime, place = rule
+    rounding = config.get("gst_rounding") or "line"
+    if rounding not in ROUNDING:
+        raise ValueError(f"gst_rounding must be one of {', '.join(ROUNDING)}")
+
+    groups = {}
+    for item in services:
+        sac = str(item.setdefault("sac", str(config.get("sac") or ""))).strip()
+        if not HSN_SAC_RE.fullmatch(sac):
+            raise ValueError(f"not an HSN/SAC code: '{sac}' on '{item['desc']}'")
+        units = rate_units(item.get("gst_rate", config.get("gst_rate", 18)))
+        item["gst_rate"] = percent(units)
+        taxable = to_minor(LineItem.from_dict(item).amount)
+        cell = groups.get((sac, units))
+        if cell is None:
+            cell = groups[(sac, units)] = [0, 0, 0, 0]
+        cell[0] += taxable
+        if rounding == "line":
+            for i, tax in enumerate(line_tax(regime, units, taxable), 1):
+                cell[i] += tax
+    if rounding == "invoice":
+        for (sac, units), cell in groups.items():
+            cell[1:] = line_tax(regime, units, cell[0])
+
+    sums = [sum(c[i] for c in groups.values()) for i in (1, 2, 3)]
+    block = {"regime": regime, "place": place}
+    ctin = (client.get("gst_id") or "").strip().upper()
+    if state_of(ctin):
+        block["ctin"] = ctin
+    if regime == "export" and config.get("lut"):
+        block["lut"] = config["lut"]
+    block["rounding"] = rounding
+    block["groups"] = [
+        {
+            "sac": sac,
+            "rate": percent(units),
+            "taxable": float(from_minor(cell[0])),
+            "cgst": float(from_minor(cell[1])),
+            "sgst": float(from_minor(cell[2])),
+            "igst": float(from_minor(cell[3])),
+        }
+        for (sac, units), cell in groups.items()
+    ]
+    for name, value in zip(("cgst", "sgst", "igst"), sums):
+        block[name] = float(from_minor(value))
+    block["total"] = float(from_minor(sum(sums)))
+    return block
+
+
+def summary_fields(tax):
+    """Fields for the PDF: the rule set, place and labelled tax amounts of a ``tax`` block."""
+    if not tax:
+        return {}
+    rates = sorted({g["rate"] for g in tax["groups"]})
+    half = f" @ {rates[0] / 2:g}%" if len(rates) == 1 else ""
+    whole = f" @ {rates[0]:g}%" if len(rates) == 1 else ""
+    return {
+        "regime": tax["regime"],
+        "place": place_name(tax["place"]),
+        "sac": ", ".join(dict.fromkeys(g["sac"] for g in tax["groups"])),
+        "cgst_label": f"CGST{half}",
+        "sgst_label": f"SGST{half}",
+        "igst_label": f"IGST{whole}",
+        "cgst": Decimal(str(tax["cgst"])),
+        "sgst": Decimal(str(tax["sgst"])),
+        "igst": Decimal(str(tax["igst"])),
+        "lut": tax.get("lut", ""),
+    }
+
+
+# --- GSTR-1 ---
+
+
+def _minor(amount):
+    # Stored tax amounts are already whole paise, so no Decimal rounding is needed
+    return round(amount * 100)
+
+
+def _rupees(minor):
+    return minor / 100
+
+
+def _return_date(iso):
+    """YYYY-MM-DD as the DD-MM-YYYY of GST returns."""
+    return f"{iso[8:10]}-{iso[5:7]}-{iso[:4]}"
+
+
+class Gstr1:
+    """Outward supplies of a period in the sections of a GSTR-1 return.
+
+    ``b2b`` (registered clients, by GSTIN), ``b2cl`` (large inter-state
+    invoices to unregistered clients), ``b2cs`` (other unregistered supplies,
+    by place and rate), ``exp`` (exports, in INR at invoice-date rates),
+    ``hsn`` (per HSN/SAC code and rate) and ``doc_issue``.
+
+    Invoices are read in one pass, and the columns are then built with
+    bulk comprehensions over the whole period: one row per invoice and one
+    per (code, rate) group. Foreign-currency amounts are converted with a
+    single ``to_inr_column`` call per column, each invoice is assigned its
+    section once, and every section is grouped from the columns.
+    """
+
+    def __init__(self, gstin, date_from, date_to, invoices):
+        self.gstin = gstin
+        self.date_from = date_from
+        self.date_to = date_to
+        taxed = [i for i in invoices if i.get("tax")]
+        self.untaxed = len(invoices) - len(taxed)
+        blocks = [i["tax"] for i in taxed]
+        # One row per taxed invoice
+        self.ids = [i["id"] for i in taxed]
+        self.dates = [i["date"] for i in taxed]
+        self.currencies = [i.get("currency") or "INR" for i in taxed]
+        self.values = [_minor(i["total"]) for i in taxed]
+        self.regimes = [b["regime"] for b in blocks]
+        self.places = [b["place"] for b in blocks]
+        self.ctins = [b.get("ctin") for b in blocks]
+        # One row per (code, rate) group of an invoice
+        groups = [g for b in blocks for g in b["groups"]]
+        self.group_rows = [row for row, b in enumerate(blocks) for _ in b["groups"]]
+        self.codes = [g["sac"] for g in groups]
+        self.rates = [g["rate"] for g in groups]
+        self.taxable = [_minor(g["taxable"]) for g in groups]
+        self.cgst = [_minor(g["cgst"]) for g in groups]
+        self.sgst = [_minor(g["sgst"]) for g in groups]
+        self.igst = [_minor(g["igst"]) for g in groups]
+        self.sections = []
+        self.unconverted = []
+
+    @classmethod
+    def from_invoices(cls, invoices, rates, gstin, date_from, date_to):
+        report = cls(gstin, date_from, date_to, list(invoices))
+        report.convert(rates)
+        return report
+
+    def convert(self, rates):
+        """Turn values and taxable amounts into INR paise, noting invoices without a rate."""
+        self.values, missing = rates.to_inr_column(self.currencies, self.dates, self.values)
+        self.unconverted = [i for i, flag in zip(self.ids, missing) if flag]
+        self.taxable, _ = rates.to_inr_column(
+            [self.currencies[r] for r in self.group_rows],
+            [self.dates[r] for r in self.group_rows],
+            self.taxable,
+        )
+        self.sections = [self._section(row) for row in range(len(self.ids))]
+
+    def _section(self, row):
+        regime = self.regimes[row]
+        if regime == "export":
+            return "exp"
+        if self.ctins[row]:
+            return "b2b"
+        if regime == "inter" and self.values[row] > B2CL_LIMIT:
+            return "b2cl"
+        return "b2cs"
+
+    def _invoice(self, row, items):
+        return {
+            "inum": self.ids[row],
+            "idt": _return_date(self.dates[row]),
+            "val": _rupees(self.values[row]),
+            "itms": items,
+        }
+
+    def to_dict(self):
+        sections = self.sections
+        items = [[] for _ in self.ids]
+        b2cs, hsn = {}, {}
+        for g, row in enumerate(self.group_rows):
+            amounts = (self.taxable[g], self.igst[g], self.cgst[g], self.sgst[g])
+            detail = {"rt": self.rates[g], "txval": _rupees(amounts[0])}
+            if sections[row] != "exp":
+                detail.update(
+                    iamt=_rupees(amounts[1]), camt=_rupees(amounts[2]), samt=_rupees(amounts[3])
+                )
+            detail["csamt"] = 0
+            items[row].append(detail)
+            if sections[row] == "b2cs":
+                kind = "INTRA" if self.regimes[row] == "intra" else "INTER"
+                cell = b2cs.setdefault((kind, self.places[row], self.rates[g]), [0, 0, 0, 0])
+                for i, amount in enumerate(amounts):
+                    cell[i] += amount
+            cell = hsn.setdefault((self.codes[g], self.rates[g]), [0, 0, 0, 0])
+            for i, amount in enumerate(amounts):
+                cell[i] += amount
+
+        b2b, b2cl, exp = {}, {}, []
+        for row, section in enumerate(sections):
+            if section == "exp":
+                exp.append(self._invoice(row, items[row]))
+                continue
+            numbered = [{"num": n, "itm_det": d} for n, d in enumerate(items[row], 1)]
+            if section == "b2b":
+                entry = self._invoice(row, numbered)
+                entry.update(pos=self.places[row], rchrg="N", inv_typ="R")
+                b2b.setdefault(self.ctins[row], []).append(entry)
+            elif section == "b2cl":
+                b2cl.setdefault(self.places[row], []).append(self._invoice(row, numbered))
+
+        def amounts(cell):
+            return {
+                "txval": _rupees(cell[0]),
+                "iamt": _rupees(cell[1]),
+                "camt": _rupees(cell[2]),
+                "samt": _rupees(cell[3]),
+                "csamt": 0,
+            }
+
+        ids = sorted(self.ids)
+        return {
+            "gstin": self.gstin,
+            "from": self.date_from,
+            "to": self.date_to,
+            "b2b": [{"ctin": ctin, "inv": inv} for ctin, inv in sorted(b2b.items())],
+            "b2cl": [{"pos": pos, "inv": inv} for pos, inv in sorted(b2cl.items())],
+            "b2cs": [
+                {"sply_ty": kind, "pos": pos, "typ": "OE", "rt": rate, **amounts(cell)}
+                for (kind, pos, rate), cell in sorted(b2cs.items())
+            ],
+            "exp": [{"exp_typ": "WOPAY", "inv": exp}] if exp else [],
+            "hsn": {
+                "data": [
+                    {"num": n, "hsn_sc": code, "uqc": "NA", "qty": 0, "rt": rate, **amounts(cell)}
+                    for n, ((code, rate), cell) in enumerate(sorted(hsn.items()), 1)
+                ]
+            },
+            "doc_issue": {
+                "from": ids[0] if ids else "",
+                "to": ids[-1] if ids else "",
+                "totnum": len(ids),
+                "cancel": 0,
+                "net_issue": len(ids),
+            },
+            "untaxed": self.untaxed,
+            "unconverted": self.unconverted,
+        }
+
+    def totals(self):
+        """Per section: invoices, value, taxable, IGST, CGST and SGST in INR paise."""
+        sections = self.sections
+        totals = {name: [0] * 6 for name in ("b2b", "b2cl", "b2cs", "exp")}
+        for row, section in enumerate(sections):
+            totals[section][0] += 1
+            totals[section][1] += self.values[row]
+        for g, row in enumerate(self.group_rows):
+            cell = totals[sections[row]]
+            cell[2] += self.taxable[g]
+            cell[3] += self.igst[g]
+            cell[4] += self.cgst[g]
+            cell[5] += self.sgst[g]
+        return totals
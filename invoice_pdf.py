@@ -0,0 +1,133 @@
+from fpdf import FPDF
+
+from money import InvoiceTotals
+
+
+class InvoicePDF(FPDF):
+    """Custom PDF Generator handling Invoice Layout."""
+
+    def __init__(self, client, invoice_data, config):
+        super().__init__()
+        self.client = client
+        self.invoice_data = invoice_data
+        self.config = config
+        self.currency_code = client.get("currency", "INR")
+        self.set_auto_page_break(auto=True, margin=15)
+
+    def header(self):
+        # Header
+        self.set_font("Courier", "B", 20)
+        self.cell(0, 10, "INVOICE", 0, 1, "R")
+        self.ln(5)
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font("Courier", "I", 8)
+        self.cell(0, 10, f"Page {self.page_no()}", 0, 0, "C")
+
+    def generate(self):
+        self.add_page()
+
+        # --- SENDER DETAILS (From Config) ---
+        self.set_font("Courier", "B", 12)
+        self.cell(0, 5, self.config.get("name", "Unknown"), 0, 1)
+        self.set_font("Courier", "", 10)
+
+        # Handle multi-line address
+        addr_lines = self.config.get("address", "").split("\n")
+        for line in addr_lines:
+            self.cell(0, 5, line, 0, 1)
+
+        self.cell(0, 5, f"PAN: {self.config.get('pan', 'N/A')}", 0, 1)
+        self.ln(10)
+
+        # --- BILL TO & INFO ---
+        y_start = self.get_y()
+
+        # Left side: Client
+        self.set_font("Courier", "B", 11)
+        self.cell(100, 5, "BILL TO:", 0, 1)
+        self.set_font("Courier", "", 10)
+        self.cell(100, 5, self.client["name"], 0, 1)
+        self.cell(100, 5, self.client["address"], 0, 1)
+        self.cell(100, 5, f"{self.client['country']}", 0, 1)
+
+        if self.client["type"] == "Foreign":
+            self.cell(100, 5, f"VAT ID: {self.client.get('vat_id', 'N/A')}", 0, 1)
+        else:
+            self.cell(100, 5, f"GSTIN: {self.client.get('gst_id', 'N/A')}", 0, 1)
+
+        # Right side: Invoice Meta
+        self.set_xy(120, y_start)
+        self.cell(0, 5, f"Invoice #: {self.invoice_data['id']}", 0, 1, "R")
+        self.set_x(120)
+        self.cell(0, 5, f"Date: {self.invoice_data['date']}", 0, 1, "R")
+        self.set_x(120)
+        self.cell(0, 5, f"Currency: {self.currency_code}", 0, 1, "R")
+
+        self.ln(20)
+
+        # --- TABLE HEADERS ---
+        self._draw_table_header()
+
+        # --- ITEMS ---
+        totals = InvoiceTotals.of(self.invoice_data)
+
+        # Services
+        if totals.services:
+            self.set_font("Courier", "B", 10)
+            self.cell(0, 10, "Professional Services", 0, 1)
+            self.set_font("Courier", "", 10)
+
+            for item in totals.services:
+                desc = f"{item.desc} ({item.qty} hrs @ {item.rate})"
+                self.cell(110, 8, desc, 1)
+                self.cell(30, 8, str(item.qty), 1, 0, "C")
+                self.cell(50, 8, f"{item.amount:.2f}", 1, 0, "R")
+                self.ln()
+
+        # Reimbursements
+        if totals.reimbursements:
+            self.set_font("Courier", "B", 10)
+            self.cell(0, 10, "Reimbursements", 0, 1)
+            self.set_font("Courier", "", 10)
+
+            for item in totals.reimbursements:
+                self.cell(110, 8, item.desc, 1)
+                self.cell(30, 8, "-", 1, 0, "C")
+                self.cell(50, 8, f"{item.amount:.2f}", 1, 0, "R")
+                self.ln()
+
+        # --- TOTAL ---
+        self.ln(5)
+        self.set_font("Courier", "B", 12)
+        self.set_fill_color(220, 220, 220)
+        self.cell(140, 12, "TOTAL AMOUNT DUE:", 1, 0, "R", True)
+        self.cell(50, 12, f"{self.currency_code} {totals.total:.2f}", 1, 1, "R", True)
+
+        # --- BANK DETAILS ---
+        self.ln(20)
+        self.set_font("Courier", "B", 10)
+        self.cell(0, 5, "Payment Information:", 0, 1)
+        self.set_font("Courier", "", 10)
+        self.cell(0, 5, f"Beneficiary: {self.config.get('account_name', '')}", 0, 1)
+        self.cell(0, 5, f"Bank: {self.config.get('bank_name', '')}", 0, 1)
+        self.cell(0, 5, f"Account No: {self.config.get('account_number', '')}", 0, 1)
+
+        if self.client["type"] == "Foreign":
+            self.cell(0, 5, f"SWIFT/BIC: {self.config.get('swift_bic', '')}", 0, 1)
+        else:
+            self.cell(0, 5, f"IFSC: {self.config.get('ifsc', '')}", 0, 1)
+
+        self.cell(
+            0, 5, f"Branch Address: {self.config.get('branch_address', '')}", 0, 1
+        )
+
+    def _draw_table_header(self):
+        self.set_font("Courier", "B", 10)
+        self.set_fill_color(0, 0, 0)
+        self.set_text_color(255, 255, 255)
+        self.cell(110, 8, "Description", 1, 0, "C", True)
+        self.cell(30, 8, "Qty/Hrs", 1, 0, "C", True)
+        self.cell(50, 8, "Amount", 1, 1, "C", True)
+        self.set_text_color(0, 0, 0)
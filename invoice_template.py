@@ -0,0 +1,325 @@
+"""Declarative invoice layouts with pre-rendered static layers.
+
+A layout (``invoice_layout.json``) is a list of blocks whose rows are
+``str.format`` templates over ``config``, ``client``, ``invoice``,
+``totals``, ``tax`` (see ``gst.summary_fields``), ``currency`` and, inside
+table sections, ``item``. Blocks
+marked ``static`` may only use ``config``: each is drawn once per config
+version into a PDF content-stream fragment and stamped onto every invoice
+where it lands, so bulk rendering only lays out the per-invoice fields.
+
+Stamping writes into fpdf2's page buffer and relies on its font numbering;
+every document of a template registers the same fonts in the same order
+so that ``/F<n>`` in a fragment means the same font wherever it is used.
+"""
+
+import hashlib
+import json
+import re
+
+from fpdf import FPDF, XPos, YPos
+from fpdf.enums import MethodReturnValue, PDFResourceType
+
+from gst import summary_fields
+from money import ZERO, InvoiceTotals
+
+FONT_REF = re.compile(rb"/F(\d+) ")
+
+
+class Fields(dict):
+    """Record exposed to templates as ``{client.name}``; missing keys are blank."""
+
+    def __getattr__(self, name):
+        return self.get(name, "")
+
+
+class ConfigOnly(dict):
+    """Namespace of static blocks, which must not depend on the invoice."""
+
+    def __missing__(self, name):
+        raise ValueError(f"static layout blocks can only use config, not '{name}'")
+
+
+class Layer:
+    """A static block drawn once at y=0: its content stream and height."""
+
+    __slots__ = ("stream", "height", "fonts")
+
+    def __init__(self, stream, height):
+        self.stream = stream
+        self.height = height
+        self.fonts = {int(i) for i in FONT_REF.findall(stream)}
+
+
+class InvoiceTemplate:
+    """A parsed layout bound to one config, with its static layers cached."""
+
+    _cache = {}
+
+    def __init__(self, layout, config):
+        self.layout = layout
+        self.config = Fields(config)
+        self.font = layout.get("font", "Courier")
+        self.size = layout.get("size", 10)
+        self.styles = sorted(set(self._styles(layout)))
+        # Table headers are static blocks too; build them once so their
+        # identity, and so their cached layer, is stable.
+        self.table_heads = {
+            id(block): self._table_head(block)
+            for block in layout["blocks"]
+            if "table" in block
+        }
+        self.layers = {}
+
+    @classmethod
+    def for_config(cls, path, config):
+        """Template for the layout at ``path`` and ``config``, reused while neither changes."""
+        with open(path, "rb") as f:
+            raw = f.read()
+        blob = json.dumps(config, sort_keys=True).encode("utf-8")
+        key = hashlib.sha256(raw + b"\0" + blob).hexdigest()
+        template = cls._cache.get(key)
+        if template is None:
+            if len(cls._cache) >= 8:
+                cls._cache.clear()
+            template = cls._cache[key] = cls(json.loads(raw), config)
+        return template
+
+    @staticmethod
+    def _styles(node):
+        if isinstance(node, dict):
+            yield node.get("style", "")
+            for value in node.values():
+                yield from InvoiceTemplate._styles(value)
+        elif isinstance(node, list):
+            for value in node:
+                yield from InvoiceTemplate._styles(value)
+
+    @staticmethod
+    def _table_head(block):
+        head = block.get("head", {})
+        cells = [
+            {"text": c["title"], "w": c["w"], "align": head.get("align", "C")}
+            for c in block["columns"]
+        ]
+        return {"static": True, "rows": [dict(head, border=1, cells=cells)]}
+
+    def render(self, client, invoice_data):
+        """Lay out one invoice; returns the fpdf document, ready for ``output``."""
+        totals = InvoiceTotals.of(invoice_data)
+        pdf = LayoutPDF(
+            self,
+            {
+                "config": self.config,
+                "client": Fields(client),
+                "invoice": Fields(invoice_data),
+                "totals": totals,
+                "tax": Fields(summary_fields(invoice_data.get("tax"))),
+                "currency": client.get("currency", "INR"),
+            },
+        )
+        pdf.add_page()
+        for block in self.layout["blocks"]:
+            if "table" in block:
+                pdf.draw_table(block, totals)
+            else:
+                pdf.draw_block(block)
+        return pdf
+
+    def layer(self, block, rows):
+        """The static layer of ``block`` showing ``rows``, drawn on first use."""
+        key = (id(block), tuple(id(r) for r in rows))
+        layer = self.layers.get(key)
+        if layer is None:
+            scratch = LayoutPDF(self, ConfigOnly(config=self.config), decorate=False)
+            scratch.add_page()
+            scratch.set_y(0)
+            contents = scratch.pages[scratch.page].contents
+            start = len(contents)
+            scratch.draw_rows(block, rows)
+            layer = Layer(bytes(contents[start:]), scratch.get_y())
+            self.layers[key] = layer
+        return layer
+
+
+class LayoutPDF(FPDF):
+    """One document drawn from an InvoiceTemplate."""
+
+    def __init__(self, template, fields, decorate=True):
+        super().__init__()
+        self.template = template
+        self.fields = fields
+        self.decorate = decorate
+        self.block_top = 0
+        self.set_auto_page_break(auto=True, margin=template.layout.get("margin", 15))
+        for style in template.styles:
+            self.set_font(template.font, style, template.size)
+
+    def header(self):
+        block = self.template.layout.get("header")
+        if self.decorate and block:
+            self.draw_block(block)
+
+    def footer(self):
+        block = self.template.layout.get("footer")
+        if self.decorate and block:
+            self.set_y(block.get("y", -15))
+            self.draw_rows(block, block["rows"], page=self.page_no())
+
+    def _format(self, text, **extra):
+        fields = type(self.fields)(self.fields, **extra) if extra else self.fields
+        return text.format_map(fields)
+
+    def _shown(self, row):
+        """Check a row's ``when`` / ``unless`` field conditions."""
+        for key, expected in (("when", True), ("unless", False)):
+            for path, value in row.get(key, {}).items():
+                scope, _, name = path.partition(".")
+                if (self.fields[scope].get(name) == value) != expected:
+                    return False
+        return True
+
+    def _style(self, node):
+        self.set_font(
+            self.template.font, node.get("style", ""), node.get("size", self.template.size)
+        )
+        self.set_text_color(*node.get("color", (0, 0, 0)))
+        if "fill" in node:
+            self.set_fill_color(*node["fill"])
+
+    def draw_block(self, block):
+        rows = [r for r in block["rows"] if self._shown(r)]
+        top = self.get_y()
+        if block.get("beside"):
+            # Runs next to the previous block; continue below the taller one
+            self.set_y(self.block_top)
+        if block.get("static"):
+            self.stamp(self.template.layer(block, rows))
+        else:
+            self.draw_rows(block, rows)
+        if block.get("beside"):
+            self.set_y(max(top, self.get_y()))
+        else:
+            self.block_top = top
+
+    def draw_rows(self, block, rows, **extra):
+        x = block.get("x", self.l_margin)
+        for row in rows:
+            if "gap" in row:
+                self.ln(row["gap"])
+                continue
+            self._style(row)
+            h = row.get("h", 5)
+            border = row.get("border", 0)
+            fill = "fill" in row
+            if "cells" in row:
+                self.set_x(x)
+                for cell in row["cells"]:
+                    text = self._format(cell["text"], **extra)
+                    self.cell(cell["w"], h, text, border, align=cell.get("align", "L"), fill=fill)
+                self.ln(h)
+                continue
+            for line in self._format(row["text"], **extra).split("\n"):
+                self.set_x(x)
+                self.cell(
+                    block.get("w", 0),
+                    h,
+                    line,
+                    border,
+                    align=row.get("align", "L"),
+                    fill=fill,
+                    new_x=XPos.LMARGIN,
+                    new_y=YPos.NEXT,
+                )
+
+    def draw_table(self, block, totals):
+        """Stream the item rows, wrapping long cells and breaking pages by hand.
+
+        Each row is measured before it is drawn. When it would not fit above
+        the carry row, the running total is carried forward, a new page is
+        started with the table head repeated and the total brought forward.
+        Rows are formatted and drawn one at a time, so time and memory grow
+        linearly with the number of lines.
+        """
+        head = self.template.table_heads[id(block)]
+        columns = block["columns"]
+        h = block.get("row_h", 8)
+        line_h = block.get("line_h", 5)
+        title = block.get("section_title", {})
+        title_h = title.get("h", h)
+        body = block.get("body", {})
+        carry = block.get("carry")
+        carry_h = carry["h"] if carry else 0
+        fields = dict(self.fields)
+        carried = ZERO
+
+        def page_break():
+            if carry:
+                self.draw_rows(block, [carry["out"]], carried=carried)
+            self.add_page()
+            self.draw_block(head)
+            if carry:
+                self.draw_rows(block, [carry["in"]], carried=carried)
+
+        self.draw_block(head)
+        for section in block["sections"]:
+            items = getattr(totals, section["items"])
+            if not items:
+                continue
+            # Keep the section title with its first row
+            if self.get_y() + title_h + h + carry_h > self.page_break_trigger:
+                page_break()
+            self._style(title)
+            self.cell(
+                0, title_h, self._format(section["title"]), new_x=XPos.LMARGIN, new_y=YPos.NEXT
+            )
+            self._style(body)
+            for item in items:
+                fields["item"] = item
+                texts = [text.format_map(fields) for text in section["cells"]]
+                lines = [self._wrap(c["w"], text, line_h) for c, text in zip(columns, texts)]
+                row_h = max(h, line_h * max(len(cell) for cell in lines))
+                if self.get_y() + row_h + carry_h > self.page_break_trigger:
+                    page_break()
+                    self._style(body)
+                if row_h == h:
+                    for column, text in zip(columns, texts):
+                        self.cell(column["w"], h, text, 1, align=column.get("align", "L"))
+                else:
+                    self._draw_wrapped(columns, lines, row_h, line_h)
+                self.ln(row_h)
+                carried += item.amount
+
+    def _wrap(self, w, text, line_h):
+        """``text`` as the lines it takes in a ``w`` wide cell."""
+        if "\n" not in text and self.get_string_width(text) <= w - 2 * self.c_margin:
+            return (text,)
+        return self.multi_cell(
+            w, line_h, text, dry_run=True, output=MethodReturnValue.LINES
+        )
+
+    def _draw_wrapped(self, columns, lines, row_h, line_h):
+        x, y = self.get_x(), self.get_y()
+        for column, cell_lines in zip(columns, lines):
+            self.rect(x, y, column["w"], row_h)
+            for i, line in enumerate(cell_lines):
+                self.set_xy(x, y + i * line_h)
+                self.cell(column["w"], line_h, line, align=column.get("align", "L"))
+            x += column["w"]
+        self.set_xy(self.l_margin, y)
+
+    def stamp(self, layer):
+        """Paint a pre-rendered layer at the current position."""
+        if self.get_y() + layer.height > self.page_break_trigger and not self.in_footer:
+            self.add_page()
+        for font in layer.fonts:
+            self._resource_catalog.add(PDFResourceType.FONT, font, self.page)
+        # Shift the layer down to the cursor; it was drawn assuming fpdf's
+        # initial black colours and line width, so restate those first.
+        self._out(
+            b"q 1 0 0 1 0 %.2f cm 0 g 0 G %.2f w\n"
+            % (-self.get_y() * self.k, self.line_width * self.k)
+            + layer.stream
+            + b"\nQ"
+        )
+        self.set_y(self.get_y() + layer.height)
@@ -1,30 +1,100 @@
 import argparse
+import bisect
+import csv
+import gzip
+import hashlib
+import heapq
 import json
+import math
 import os
+import re
 import shlex
+import sqlite3
 import sys
 import time
-from datetime import datetime
-
-from fpdf import FPDF
-from rich import box
-from rich.align import Align
-from rich.console import Console
-from rich.layout import Layout
-from rich.live import Live
-from rich.panel import Panel
-from rich.prompt import Confirm, FloatPrompt, IntPrompt, Prompt
-from rich.table import Table
-from rich.text import Text
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from itertools import chain, count, groupby, islice
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, run one instance at a time
+    fcntl = None
+
+import snapshot
+from gst import EXPORT_PLACE, STATES, Gstr1, invoice_tax, place_name, state_of
+from money import InvoiceColumns, InvoiceTotals, from_minor, to_minor
+from rates import MAX_RATE_AGE_DAYS, RATE_SCALE, RateError, RateTable
+
+# fpdf and the rich widgets are imported where they are first used, so
+# headless commands that never draw a table or a PDF start fast.
 
 # --- CONFIGURATION ---
 DATA_FILE_CLIENTS = "clients.json"
 DATA_FILE_INVOICES = "invoices.json"
 DATA_FILE_CONFIG = "config.json"
+DATA_FILE_DB = "khaata.db"
 INVOICE_DIR = "invoices"
+RENDER_MANIFEST = "render_manifest.json"
+REPORT_FILE = "report_aggregates.json"
+SEARCH_INDEX_FILE = "search_index.json"
+LOCK_FILE = "khaata.lock"
+SEQUENCE_FILE = "id_sequences.json"
+RENDER_QUEUE = "render_queue.json"
+RENDER_WORKER_LOCK = "render_worker.{slot}.lock"
+RENDER_MAX_ATTEMPTS = 3
+RENDER_RETRY_DELAY = 2  # seconds before the first retry, doubling after that
+# One JSON line of timings and counters per command; KHAATA_METRICS=0 disables
+METRICS_FILE = "metrics.jsonl"
+METRICS_MAX_BYTES = 5 * 1024 * 1024  # then rotated to metrics.jsonl.1
+PROFILE_DIR = "profiles"
+# Recurring invoice definitions billed by `run-billing`
+RECURRING_FILE = "recurring.json"
+# Cadence: (months, days) between billing dates
+CADENCES = {"weekly": (0, 7), "monthly": (1, 0), "quarterly": (3, 0), "yearly": (12, 0)}
+# Payments and credit notes, and the open balances derived from them
+PAYMENTS_FILE = "payments.json"
+RECEIVABLES_FILE = "receivables.json"
+AGING_BUCKETS = (30, 60, 90)  # days since the invoice date; older is "90+"
+# Invoices of closed fiscal years, one gzip segment per year (JSON backend)
+ARCHIVE_DIR = "archive"
+# Exchange-rate CSVs (e.g. RBI reference rates) for INR conversion
+RATES_DIR = "rates"
+RENDER_LAYOUT_VERSION = 5  # bump when the PDF renderer's output changes
+# Looked up in the data directory first, then next to this script
+INVOICE_LAYOUT = "invoice_layout.json"
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_COMPACT_THRESHOLD = 500
+
+# Storage backend: "json" (default) or "sqlite" (run `migrate-db` first)
+STORAGE_BACKEND = os.environ.get("KHAATA_BACKEND", "json")
+
+
+
+class LazyConsole:
+    """Stands in for the rich Console, creating it on first use."""
+
+    _console = None
+
+    def get(self):
+        if LazyConsole._console is None:
+            from rich.console import Console
+
+            LazyConsole._console = Console()
+        return LazyConsole._console
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def print(self, *args, **kwargs):
+        with Metrics.phase("console.print"):
+            self.get().print(*args, **kwargs)
+
 
 # Initialize Rich Console
-console = Console()
+console = LazyConsole()
+
+FOREIGN_CURRENCIES = ["USD", "EUR", "GBP", "JPY", "CAD", "AUD"]
 
 # --- DEFAULT CONFIGURATION ---
 DEFAULT_CONFIG = {
@@ -39,6 +109,19 @@ DEFAULT_CONFIG = {
     "ifsc": "asdjalskjdoqij",
     "swift_bic": "klsadjaslkdj",
     "branch_code": "aslkdalksjdaslkjd",
+    # {fy} is the fiscal year (2026-27), {year} the calendar year, {seq} the
+    # running number, which restarts whenever the rest of the number changes
+    "invoice_number_format": "INV/{fy}/{seq:05d}",
+    # What deleting a client with invoices does: refuse, cascade (delete the
+    # invoices too) or archive (keep the client for its invoices, hidden)
+    "client_delete_policy": "refuse",
+    # Your GSTIN; leave it empty when not registered and no GST is charged.
+    # Its state code decides between CGST+SGST and IGST for each client.
+    "gstin": "",
+    "sac": "998314",  # HSN/SAC code of service lines that do not name one
+    "gst_rate": 18,  # GST rate (%) of service lines that do not name one
+    "gst_rounding": "line",  # round GST per line, or per "invoice" and rate
+    "lut": "",  # Letter of Undertaking ARN for zero-rated exports
 }
 
 # --- UTILITY CLASSES ---
@@ -47,12 +130,21 @@ DEFAULT_CONFIG = {
 class RetroUI:
     """Handles the Retro Gaming / Terminal UI aesthetics."""
 
+    # Set while a headless command runs, whose stdout is its output
+    headless = False
+
     @staticmethod
     def clear_screen():
-        os.system("cls" if os.name == "nt" else "clear")
+        # ANSI clear + home instead of spawning a `clear` subprocess
+        sys.stdout.write("\033[2J\033[H")
+        sys.stdout.flush()
 
     @staticmethod
     def print_banner():
+        from rich import box
+        from rich.align import Align
+        from rich.panel import Panel
+
         RetroUI.clear_screen()
         title = """
         /$$$$$$$  /$$$$$$$$ /$$$$$$$$ /$$$$$$$   /$$$$$$        /$$   /$$ /$$   /$$  /$$$$$$   /$$$$$$  /$$$$$$$$ /$$$$$$
@@ -76,6 +168,9 @@ class RetroUI:
 
     @staticmethod
     def boot_sequence():
+        from rich.live import Live
+        from rich.text import Text
+
         RetroUI.clear_screen()
         steps = [
             "Initializing Memory...",
@@ -84,7 +179,7 @@ class RetroUI:
             "Checking Peripherals...",
             "System Ready.",
         ]
-        with Live(console=console, refresh_per_second=10) as live:
+        with Live(console=console.get(), refresh_per_second=10) as live:
             for step in steps:
                 time.sleep(0.1)
                 live.update(Text(f">>> {step} [OK]", style="bold green"))
@@ -102,450 +197,4369 @@ class RetroUI:
     def info(msg):
         console.print(f"[bold cyan]>> INFO: {msg}[/bold cyan]")
 
-
-class InvoicePDF(FPDF):
-    """Custom PDF Generator handling Invoice Layout."""
-
-    def __init__(self, client, invoice_data, config):
-        super().__init__()
-        self.client = client
-        self.invoice_data = invoice_data
-        self.config = config
-        self.currency_code = client.get("currency", "INR")
-        self.set_auto_page_break(auto=True, margin=15)
-
-    def header(self):
-        # Header
-        self.set_font("Courier", "B", 20)
-        self.cell(0, 10, "INVOICE", 0, 1, "R")
-        self.ln(5)
-
-    def footer(self):
-        self.set_y(-15)
-        self.set_font("Courier", "I", 8)
-        self.cell(0, 10, f"Page {self.page_no()}", 0, 0, "C")
-
-    def generate(self):
-        self.add_page()
-
-        # --- SENDER DETAILS (From Config) ---
-        self.set_font("Courier", "B", 12)
-        self.cell(0, 5, self.config.get("name", "Unknown"), 0, 1)
-        self.set_font("Courier", "", 10)
-
-        # Handle multi-line address
-        addr_lines = self.config.get("address", "").split("\n")
-        for line in addr_lines:
-            self.cell(0, 5, line, 0, 1)
-
-        self.cell(0, 5, f"PAN: {self.config.get('pan', 'N/A')}", 0, 1)
-        self.ln(10)
-
-        # --- BILL TO & INFO ---
-        y_start = self.get_y()
-
-        # Left side: Client
-        self.set_font("Courier", "B", 11)
-        self.cell(100, 5, "BILL TO:", 0, 1)
-        self.set_font("Courier", "", 10)
-        self.cell(100, 5, self.client["name"], 0, 1)
-        self.cell(100, 5, self.client["address"], 0, 1)
-        self.cell(100, 5, f"{self.client['country']}", 0, 1)
-
-        if self.client["type"] == "Foreign":
-            self.cell(100, 5, f"VAT ID: {self.client.get('vat_id', 'N/A')}", 0, 1)
-        else:
-            self.cell(100, 5, f"GSTIN: {self.client.get('gst_id', 'N/A')}", 0, 1)
-
-        # Right side: Invoice Meta
-        self.set_xy(120, y_start)
-        self.cell(0, 5, f"Invoice #: {self.invoice_data['id']}", 0, 1, "R")
-        self.set_x(120)
-        self.cell(0, 5, f"Date: {self.invoice_data['date']}", 0, 1, "R")
-        self.set_x(120)
-        self.cell(0, 5, f"Currency: {self.currency_code}", 0, 1, "R")
-
-        self.ln(20)
-
-        # --- TABLE HEADERS ---
-        self._draw_table_header()
-
-        # --- ITEMS ---
-        total = 0
-        services = self.invoice_data.get("services", [])
-        reimbursements = self.invoice_data.get("reimbursements", [])
-
-        # Services
-        if services:
-            self.set_font("Courier", "B", 10)
-            self.cell(0, 10, "Professional Services", 0, 1)
-            self.set_font("Courier", "", 10)
-
-            for item in services:
-                line_total = item["rate"] * item["qty"]
-                total += line_total
-                desc = f"{item['desc']} ({item['qty']} hrs @ {item['rate']})"
-                self.cell(110, 8, desc, 1)
-                self.cell(30, 8, str(item["qty"]), 1, 0, "C")
-                self.cell(50, 8, f"{line_total:.2f}", 1, 0, "R")
-                self.ln()
-
-        # Reimbursements
-        if reimbursements:
-            self.set_font("Courier", "B", 10)
-            self.cell(0, 10, "Reimbursements", 0, 1)
-            self.set_font("Courier", "", 10)
-
-            for item in reimbursements:
-                line_total = item["rate"] * item["qty"]
-                total += line_total
-                self.cell(110, 8, item["desc"], 1)
-                self.cell(30, 8, "-", 1, 0, "C")
-                self.cell(50, 8, f"{line_total:.2f}", 1, 0, "R")
-                self.ln()
-
-        # --- TOTAL ---
-        self.ln(5)
-        self.set_font("Courier", "B", 12)
-        self.set_fill_color(220, 220, 220)
-        self.cell(140, 12, "TOTAL AMOUNT DUE:", 1, 0, "R", True)
-        self.cell(50, 12, f"{self.currency_code} {total:.2f}", 1, 1, "R", True)
-
-        # --- BANK DETAILS ---
-        self.ln(20)
-        self.set_font("Courier", "B", 10)
-        self.cell(0, 5, "Payment Information:", 0, 1)
-        self.set_font("Courier", "", 10)
-        self.cell(0, 5, f"Beneficiary: {self.config.get('account_name', '')}", 0, 1)
-        self.cell(0, 5, f"Bank: {self.config.get('bank_name', '')}", 0, 1)
-        self.cell(0, 5, f"Account No: {self.config.get('account_number', '')}", 0, 1)
-
-        if self.client["type"] == "Foreign":
-            self.cell(0, 5, f"SWIFT/BIC: {self.config.get('swift_bic', '')}", 0, 1)
+    @staticmethod
+    def warn(msg):
+        """A problem worked around on the way, kept out of headless output."""
+        if RetroUI.headless:
+            print(f"retro-khaata: warning: {msg}", file=sys.stderr)
         else:
-            self.cell(0, 5, f"IFSC: {self.config.get('ifsc', '')}", 0, 1)
-
-        self.cell(
-            0, 5, f"Branch Address: {self.config.get('branch_address', '')}", 0, 1
-        )
+            RetroUI.error(msg)
 
-    def _draw_table_header(self):
-        self.set_font("Courier", "B", 10)
-        self.set_fill_color(0, 0, 0)
-        self.set_text_color(255, 255, 255)
-        self.cell(110, 8, "Description", 1, 0, "C", True)
-        self.cell(30, 8, "Qty/Hrs", 1, 0, "C", True)
-        self.cell(50, 8, "Amount", 1, 1, "C", True)
-        self.set_text_color(0, 0, 0)
 
+class Metrics:
+    """Per-command timings and counters, appended as JSON lines to METRICS_FILE.
 
-# --- DATA MANAGERS ---
+    ``command`` opens a record; while it is open, ``phase`` adds the time
+    spent in a named step and ``count`` bumps a counter. Outside a command
+    both do nothing, so any code can be instrumented unconditionally. Phases
+    may nest, so their times can add up to more than the command's.
+    """
 
+    _record = None
 
-class DataManager:
     @staticmethod
-    def load(filename, default=None):
-        if default is None:
-            default = []
-        if os.path.exists(filename):
-            try:
-                with open(filename, "r") as f:
-                    return json.load(f)
-            except:
-                return default
-        return default
+    @contextmanager
+    def command(name, profile=False):
+        record = {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "command": name,
+            "pid": os.getpid(),
+            "phases": {},
+            "counters": {},
+        }
+        outer, Metrics._record = Metrics._record, record
+        profiler = None
+        if profile:
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+        ok = False
+        start = time.perf_counter()
+        try:
+            yield record
+            ok = True
+        finally:
+            record["ms"] = round((time.perf_counter() - start) * 1000, 3)
+            record["ok"] = ok
+            if profiler:
+                profiler.disable()
+                record["profile"] = Metrics._save_profile(profiler, name)
+            Metrics._record = outer
+            Metrics._write(record)
 
     @staticmethod
-    def save(filename, data):
-        with open(filename, "w") as f:
-            json.dump(data, f, indent=4)
+    @contextmanager
+    def phase(name):
+        record = Metrics._record
+        if record is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            cell = record["phases"].setdefault(name, [0.0, 0])
+            cell[0] += (time.perf_counter() - start) * 1000
+            cell[1] += 1
 
+    @staticmethod
+    def count(name, n=1):
+        if Metrics._record is not None:
+            counters = Metrics._record["counters"]
+            counters[name] = counters.get(name, 0) + n
 
-# --- COMMAND PROCESSOR ---
+    @staticmethod
+    def _write(record):
+        if os.environ.get("KHAATA_METRICS") == "0":
+            return
+        for cell in record["phases"].values():
+            cell[0] = round(cell[0], 3)
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        # One O_APPEND write per record, so concurrent sessions do not interleave
+        fd = os.open(METRICS_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > METRICS_MAX_BYTES:
+            os.replace(METRICS_FILE, METRICS_FILE + ".1")
 
+    @staticmethod
+    def _save_profile(profiler, name):
+        import pstats
 
-class RetroShell:
-    def __init__(self):
-        self.clients = DataManager.load(DATA_FILE_CLIENTS, [])
-        self.invoices = DataManager.load(DATA_FILE_INVOICES, [])
-        self.config = DataManager.load(DATA_FILE_CONFIG, DEFAULT_CONFIG)
-        if not os.path.exists(INVOICE_DIR):
-            os.makedirs(INVOICE_DIR)
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(
+            PROFILE_DIR, f"{name}-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.prof"
+        )
+        profiler.dump_stats(path)
+        stats = pstats.Stats(profiler, stream=sys.stderr)
+        stats.sort_stats("cumulative").print_stats(15)
+        print(f"Profile saved to {path} (open with `python -m pstats {path}`)", file=sys.stderr)
+        return path
 
-    # --- CLIENT COMMANDS ---
+    @staticmethod
+    def read(limit=None):
+        """The last ``limit`` records (all if None), oldest first."""
+        from collections import deque
 
-    def do_add_client(self):
-        console.print("[bold green]>> ADD NEW CLIENT <<[/bold green]")
-        name = Prompt.ask("[green]Company Name[/green]")
-        address = Prompt.ask("[green]Address[/green]")
+        try:
+            with open(METRICS_FILE, "r") as f:
+                lines = deque(f, maxlen=limit)
+        except FileNotFoundError:
+            return []
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                pass  # a line cut short by a crash
+        return records
 
-        console.print("1. Indian (Domestic)\n2. Foreign (International)")
-        choice = IntPrompt.ask("[green]Select Type[/green]", choices=["1", "2"])
-        client_type = "Indian" if choice == 1 else "Foreign"
+    @staticmethod
+    def summary(records):
+        """Per-command rows: runs, failures, median/p95/max and recent median ms,
+        mean ms per run of the slowest phases and counter totals."""
+        import statistics
 
-        extra_data = {}
-        if client_type == "Indian":
-            extra_data["gst_id"] = Prompt.ask("[green]GSTIN/PAN[/green]")
-            extra_data["currency"] = "INR"
-            extra_data["country"] = "India"
-        else:
-            extra_data["country"] = Prompt.ask("[green]Country[/green]")
-            extra_data["vat_id"] = Prompt.ask("[green]VAT ID[/green]")
-            currencies = ["USD", "EUR", "GBP", "JPY", "CAD", "AUD"]
-            for idx, c in enumerate(currencies, 1):
-                console.print(f"{idx}. {c}")
-            c_choice = IntPrompt.ask(
-                "[green]Currency[/green]",
-                choices=[str(i) for i in range(1, len(currencies) + 1)],
+        by_command = {}
+        for record in records:
+            by_command.setdefault(record["command"], []).append(record)
+        rows = []
+        for command in sorted(by_command):
+            runs = by_command[command]
+            times = sorted(r["ms"] for r in runs)
+            phases, counters = {}, {}
+            for r in runs:
+                for name, (ms, _) in r.get("phases", {}).items():
+                    phases[name] = phases.get(name, 0) + ms
+                for name, n in r.get("counters", {}).items():
+                    counters[name] = counters.get(name, 0) + n
+            slowest = sorted(phases.items(), key=lambda kv: kv[1], reverse=True)[:3]
+            rows.append(
+                {
+                    "command": command,
+                    "runs": len(runs),
+                    "failed": sum(1 for r in runs if not r.get("ok", True)),
+                    "median_ms": round(statistics.median(times), 1),
+                    "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))], 1),
+                    "max_ms": round(times[-1], 1),
+                    # Compare with the median to spot a regression
+                    "recent_ms": round(statistics.median(r["ms"] for r in runs[-10:]), 1),
+                    "phases": {name: round(ms / len(runs), 1) for name, ms in slowest},
+                    "counters": counters,
+                }
             )
-            extra_data["currency"] = currencies[c_choice - 1]
+        return rows
 
-        client = {
-            "id": int(time.time()),  # Unique ID based on timestamp
-            "name": name,
-            "address": address,
-            "type": client_type,
-            **extra_data,
-        }
-        self.clients.append(client)
-        DataManager.save(DATA_FILE_CLIENTS, self.clients)
-        RetroUI.success(f"Client '{name}' added.")
 
-    def do_list_clients(self):
-        table = Table(title="CLIENT DATABASE", border_style="green", box=box.SIMPLE)
-        table.add_column("ID", justify="right", style="cyan")
-        table.add_column("Name", style="green")
-        table.add_column("Type", style="magenta")
-        table.add_column("Currency", style="yellow")
+def invoice_pdf_path(client, invoice_data):
+    number = invoice_data["id"].replace("/", "-")  # INV/2026-27/00042
+    return f"{INVOICE_DIR}/{client['name'].replace(' ', '_')}_{number}.pdf"
 
-        for c in self.clients:
-            table.add_row(str(c["id"]), c["name"], c["type"], c["currency"])
-        console.print(table)
 
-    def do_update_client(self):
-        self.do_list_clients()
-        c_id = IntPrompt.ask("[green]Enter Client ID to update[/green]")
-        client = next((c for c in self.clients if c["id"] == c_id), None)
-        if not client:
-            RetroUI.error("Client not found.")
-            return
+def invoice_layout_path():
+    if os.path.exists(INVOICE_LAYOUT):
+        return INVOICE_LAYOUT
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), INVOICE_LAYOUT)
 
-        console.print(f"Updating: [bold]{client['name']}[/bold]")
-        if Confirm.ask("Update Name?"):
-            client["name"] = Prompt.ask("New Name", default=client["name"])
-        if Confirm.ask("Update Address?"):
-            client["address"] = Prompt.ask("New Address", default=client["address"])
 
-        # Specific fields
-        if client["type"] == "Foreign":
-            if Confirm.ask("Update VAT ID?"):
-                client["vat_id"] = Prompt.ask(
-                    "New VAT ID", default=client.get("vat_id", "")
-                )
-        else:
-            if Confirm.ask("Update GSTIN?"):
-                client["gst_id"] = Prompt.ask(
-                    "New GSTIN", default=client.get("gst_id", "")
-                )
+def render_invoice_pdf(client, invoice_data, config):
+    """Render and write one invoice PDF; module-level so worker processes can run it."""
+    with Metrics.phase("pdf.import"):
+        from invoice_template import InvoiceTemplate
 
-        DataManager.save(DATA_FILE_CLIENTS, self.clients)
-        RetroUI.success("Client updated.")
+    # Cached per process: static layers are laid out once per config version
+    template = InvoiceTemplate.for_config(invoice_layout_path(), config)
+    filename = invoice_pdf_path(client, invoice_data)
+    with Metrics.phase("pdf.layout"):
+        pdf = template.render(client, invoice_data)
+    with Metrics.phase("pdf.output"):
+        pdf.output(filename)
+    return filename
 
-    def do_delete_client(self):
-        self.do_list_clients()
-        c_id = IntPrompt.ask("[green]Enter Client ID to delete[/green]")
-        client = next((c for c in self.clients if c["id"] == c_id), None)
-        if not client:
-            RetroUI.error("Client not found.")
-            return
 
-        if Confirm.ask(f"[red]Are you sure you want to delete {client['name']}?[/red]"):
-            self.clients.remove(client)
-            DataManager.save(DATA_FILE_CLIENTS, self.clients)
-            RetroUI.success("Client deleted.")
+class RenderCache:
+    """Manifest of content hashes for PDFs already written to INVOICE_DIR.
 
-    # --- INVOICE COMMANDS ---
+    A PDF is rebuilt only when the fingerprint of what it prints (the
+    invoice, the layout and the client and config fields the layout refers
+    to) differs from the one recorded when it was last rendered.
+    """
 
-    def do_create_invoice(self, args):
-        # Parse args manually or simple logic
-        if not self.clients:
-            RetroUI.error("No clients found. Add a client first.")
-            return
+    _layouts = {}
 
-        # Find client (fuzzy match or list)
-        target_client_name = args[0] if args else None
-        client = None
+    def __init__(self, path=RENDER_MANIFEST):
+        self.path = path
+        self.entries = DataManager.load(path, {}, derived=True)
+        self.recorded = {}
 
-        if target_client_name:
-            # Simple fuzzy search
-            client = next(
-                (
-                    c
-                    for c in self.clients
-                    if target_client_name.lower() in c["name"].lower()
-                ),
-                None,
+    @staticmethod
+    def layout_info():
+        """(digest, client fields, config fields) of the invoice layout in use."""
+        path = invoice_layout_path()
+        key = (path, os.stat(path).st_mtime_ns)
+        info = RenderCache._layouts.get(key)
+        if info is None:
+            with open(path, "rb") as f:
+                raw = f.read()
+            refs = re.findall(r"\b(client|config)\.(\w+)", raw.decode("utf-8"))
+            info = (
+                hashlib.sha256(raw).hexdigest(),
+                # {currency} is the client's currency
+                sorted({name for scope, name in refs if scope == "client"} | {"currency"}),
+                sorted({name for scope, name in refs if scope == "config"}),
             )
+            RenderCache._layouts[key] = info
+        return info
 
-        if not client:
-            self.do_list_clients()
-            c_id = IntPrompt.ask("\n[green]Enter Client ID from list[/green]")
-            client = next((c for c in self.clients if c["id"] == c_id), None)
+    @staticmethod
+    def fingerprint(client, invoice_data, config):
+        layout, client_fields, config_fields = RenderCache.layout_info()
+        payload = {
+            "layout": RENDER_LAYOUT_VERSION,
+            "template": layout,
+            "invoice": invoice_data,
+            "client": {k: client.get(k) for k in client_fields},
+            "config": {k: config.get(k) for k in config_fields},
+        }
+        blob = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
 
-        if not client:
-            RetroUI.error("Invalid Client.")
-            return
+    def is_fresh(self, filename, digest):
+        return self.entries.get(filename) == digest and os.path.exists(filename)
 
-        # Generate Invoice
-        console.print(
-            f"\n[bold green]>> NEW INVOICE FOR: {client['name']} <<[/bold green]"
-        )
+    def record(self, filename, digest):
+        Metrics.count("pdfs_rendered")
+        self.entries[filename] = digest
+        self.recorded[filename] = digest
 
-        items_service = []
-        items_reimburse = []
+    def render(self, client, invoice_data, config, force=False):
+        """Render one PDF unless it is up to date; returns (filename, rendered)."""
+        filename = invoice_pdf_path(client, invoice_data)
+        digest = RenderCache.fingerprint(client, invoice_data, config)
+        if not force and self.is_fresh(filename, digest):
+            return filename, False
+        render_invoice_pdf(client, invoice_data, config)
+        self.record(filename, digest)
+        return filename, True
 
-        # Interactive Item Entry
-        while True:
-            console.print("\n[cyan]--- Add Service ---[/cyan]")
-            desc = Prompt.ask("[green]Description (or 'done')[/green]")
-            if desc.lower() == "done":
-                break
+    def save(self):
+        if self.recorded:
+            # Merge with what other processes rendered since we loaded
+            with DataManager.locked():
+                self.entries = DataManager.load(self.path, {}, derived=True)
+                self.entries.update(self.recorded)
+                DataManager.save(self.path, self.entries)
+            self.recorded = {}
 
-            # Simple wizard
-            is_hourly = Confirm.ask("Is this Hourly?")
-            rate = FloatPrompt.ask(f"Rate ({client['currency']})")
-            qty = FloatPrompt.ask("Hours" if is_hourly else "Quantity", default=1.0)
 
-            items_service.append({"desc": desc, "rate": rate, "qty": qty})
+# --- DATA MANAGERS ---
 
-        if Confirm.ask("\n[yellow]Add Reimbursements?[/yellow]"):
-            while True:
-                console.print("\n[cyan]--- Add Expense ---[/cyan]")
-                desc = Prompt.ask("[green]Description (or 'done')[/green]")
-                if desc.lower() == "done":
-                    break
-                amt = FloatPrompt.ask(f"Amount ({client['currency']})")
-                items_reimburse.append({"desc": desc, "rate": amt, "qty": 1.0})
 
-        if not items_service and not items_reimburse:
-            RetroUI.error("Empty invoice cancelled.")
-            return
+class DataManager:
+    """JSON snapshots backed by an append-only journal of mutations.
 
-        # Create Invoice Object
-        inv_number = f"INV-{int(time.time())}"
-        invoice_data = {
-            "id": inv_number,
-            "client_id": client["id"],
-            "client_name": client["name"],
-            "date": datetime.now().strftime("%Y-%m-%d"),
-            "services": items_service,
-            "reimbursements": items_reimburse,
-            "total": sum(i["rate"] * i["qty"] for i in items_service + items_reimburse),
-        }
+    ``save`` rewrites a whole document and is meant for small files such as
+    the config. Record collections go through ``add``/``put``/``delete``,
+    which append a single fsync'd line to ``<file>.journal`` so the cost of a
+    write depends on the record, not on the size of the history. ``load``
+    replays the journal over the snapshot, and the journal is folded back
+    into the snapshot every ``JOURNAL_COMPACT_THRESHOLD`` entries.
 
-        self.invoices.append(invoice_data)
-        DataManager.save(DATA_FILE_INVOICES, self.invoices)
+    Record snapshots are pretty-printed JSON or, once converted with
+    ``compact(..., binary=True)``, the compact columnar format of
+    ``snapshot``. ``load`` tells them apart by their first bytes and later
+    writes keep whichever format the file already has.
 
-        # Generate PDF
-        self._generate_pdf_file(client, invoice_data)
+    Several processes may share a data directory. Every write happens under
+    an exclusive ``flock`` on LOCK_FILE and reads under a shared one, and
+    ``refresh`` catches a long-lived copy up with what other processes
+    appended since this one last loaded or wrote the file.
+    """
 
-    def _generate_pdf_file(self, client, invoice_data):
-        try:
-            pdf = InvoicePDF(client, invoice_data, self.config)
-            pdf.generate()
-            filename = f"{INVOICE_DIR}/{client['name'].replace(' ', '_')}_{invoice_data['id']}.pdf"
-            pdf.output(filename)
-            RetroUI.success(f"Invoice Saved & PDF Generated: {filename}")
-        except Exception as e:
-            RetroUI.error(f"PDF Generation Failed: {e}")
+    _journal_sizes = {}
+    _stamps = {}
+    _lock_file = None
+    _lock_depth = 0
+    _lock_shared = False
 
-    def do_list_invoices(self, args):
-        table = Table(title="INVOICE HISTORY", border_style="green", box=box.SIMPLE)
-        table.add_column("INV #", style="cyan")
-        table.add_column("Date", style="dim")
-        table.add_column("Client", style="green")
-        table.add_column("Total", justify="right", style="bold yellow")
+    @staticmethod
+    @contextmanager
+    def locked(shared=False):
+        """Hold the data directory lock; re-entrant within a process."""
+        if DataManager._lock_depth == 0:
+            f = open(LOCK_FILE, "a")
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            DataManager._lock_file = f
+            DataManager._lock_shared = shared
+        elif DataManager._lock_shared and not shared:
+            raise RuntimeError("cannot write while holding a shared data lock")
+        DataManager._lock_depth += 1
+        try:
+            yield
+        finally:
+            DataManager._lock_depth -= 1
+            if DataManager._lock_depth == 0:
+                DataManager._lock_file.close()  # releases the flock
+                DataManager._lock_file = None
 
-        # Filter by client if arg provided
-        filter_name = args[0].lower() if args else None
+    @staticmethod
+    def load(filename, default=None, replay=None, derived=False):
+        """Load a snapshot and replay its journal.
 
-        for inv in self.invoices:
-            if filter_name and filter_name not in inv["client_name"].lower():
-                continue
-            table.add_row(
-                inv["id"], inv["date"], inv["client_name"], f"{inv['total']:.2f}"
-            )
+        ``replay(data, entries)`` defaults to the record-list semantics of
+        ``add``/``put``/``delete``; documents journaled through ``log`` pass
+        their own. A snapshot that cannot be read raises CorruptDataError,
+        so the next compaction never overwrites it with an empty list;
+        ``derived`` files, which are rebuilt from the store anyway, fall
+        back to ``default`` instead.
+        """
+        if default is None:
+            default = []
+        data = default
+        with DataManager.locked(shared=True), Metrics.phase("data.load"):
+            if os.path.exists(filename):
+                try:
+                    with open(filename, "rb") as f:
+                        raw = f.read()
+                    Metrics.count("bytes_read", len(raw))
+                    if raw.startswith(snapshot.MAGIC):
+                        data = snapshot.loads(raw)
+                    else:
+                        data = json.loads(raw)
+                except (OSError, ValueError) as e:
+                    if not derived:
+                        raise CorruptDataError(f"Cannot read {filename}: {e}")
+                    data = default
+            entries = DataManager._read_journal(filename)
+            DataManager._journal_sizes[filename] = len(entries)
+            DataManager._stamp(filename)
+        if entries:
+            data = (replay or DataManager._replay)(data, entries)
+        return data
 
-        console.print(table)
+    @staticmethod
+    def forget(filename):
+        """Make the next ``refresh`` of ``filename`` a full ``load``."""
+        DataManager._stamps.pop(filename, None)
 
-    def do_view_invoice(self, args):
-        if not args:
-            RetroUI.error("Usage: view-invoice <INV_NUM>")
-            return
+    @staticmethod
+    def changed(filename):
+        """True if the file was written by someone else since we last saw it."""
+        return DataManager._stamps.get(filename) != DataManager._stat(filename)
 
-        inv_id = args[0]
-        inv = next((i for i in self.invoices if i["id"] == inv_id), None)
-        if not inv:
-            RetroUI.error("Invoice not found.")
-            return
+    @staticmethod
+    def refresh(filename, data, default=None, replay=None, derived=False):
+        """Bring ``data``, loaded earlier from ``filename``, up to date.
 
-        console.print(
-            Panel(
-                json.dumps(inv, indent=2),
-                title=f"INVOICE {inv_id}",
-                border_style="green",
+        Only the journal entries appended since this process last loaded or
+        wrote the file are replayed; a new snapshot (another process
+        compacted or saved) means a full ``load``.
+        """
+        seen = DataManager._stamps.get(filename)
+        if data is not None and seen == DataManager._stat(filename):
+            return data
+        with DataManager.locked(shared=True):
+            ident, size = DataManager._stat(filename)
+            if data is None or seen is None or ident != seen[0] or size < seen[1]:
+                return DataManager.load(filename, default, replay, derived)
+            entries = DataManager._read_journal(filename, seen[1])
+            DataManager._journal_sizes[filename] = (
+                DataManager._journal_sizes.get(filename, 0) + len(entries)
             )
+            DataManager._stamp(filename)
+        return (replay or DataManager._replay)(data, entries) if entries else data
+
+    @staticmethod
+    def save(filename, data):
+        with DataManager.locked():
+            DataManager._write_atomic(filename, data)
+            DataManager._stamp(filename)
+
+    @staticmethod
+    def add(filename, records, record):
+        """Journal a newly appended record (``records`` already contains it)."""
+        DataManager._append(
+            filename, records, {"op": "add", "key": record["id"], "record": record}
         )
 
-    def do_delete_invoice(self, args):
-        if not args:
-            RetroUI.error("Usage: delete-invoice <INV_NUM>")
-            return
+    @staticmethod
+    def add_many(filename, records, new_records):
+        """Journal a batch of appended records with a single write and fsync."""
+        DataManager._append(
+            filename,
+            records,
+            *({"op": "add", "key": r["id"], "record": r} for r in new_records),
+        )
 
-        inv_id = args[0]
-        inv = next((i for i in self.invoices if i["id"] == inv_id), None)
+    @staticmethod
+    def log(filename, state, *entries):
+        """Journal free-form ``entries`` against a document with custom replay.
 
-        if inv:
-            if Confirm.ask(f"[red]Delete invoice {inv_id}?[/red]"):
-                self.invoices.remove(inv)
-                DataManager.save(DATA_FILE_INVOICES, self.invoices)
-                RetroUI.success("Invoice deleted.")
-        else:
-            RetroUI.error("Invoice not found.")
+        ``state`` must already reflect the entries; it becomes the snapshot
+        when the journal is compacted.
+        """
+        DataManager._append(filename, state, *entries)
 
-    def do_generate_pdf(self, args):
-        if not args:
-            RetroUI.error("Usage: generate-pdf <INV_NUM>")
-            return
+    @staticmethod
+    def put(filename, records, record):
+        """Journal an in-place update of the first record sharing its id."""
+        DataManager._append(
+            filename, records, {"op": "put", "key": record["id"], "record": record}
+        )
 
-        inv_id = args[0]
-        inv = next((i for i in self.invoices if i["id"] == inv_id), None)
-        if not inv:
-            RetroUI.error("Invoice not found.")
-            return
+    @staticmethod
+    def put_many(filename, records, changed):
+        """Journal in-place updates of several records with a single write and fsync."""
+        DataManager._append(
+            filename,
+            records,
+            *({"op": "put", "key": r["id"], "record": r} for r in changed),
+        )
 
-        client = next((c for c in self.clients if c["id"] == inv["client_id"]), None)
-        if not client:
-            RetroUI.error("Client associated with invoice no longer exists.")
-            return
+    @staticmethod
+    def delete(filename, records, key):
+        """Journal the removal of the first record with id ``key``."""
+        DataManager._append(filename, records, {"op": "del", "key": key})
 
-        self._generate_pdf_file(client, inv)
+    @staticmethod
+    def delete_many(filename, records, keys):
+        """Journal several removals with a single write and fsync."""
+        DataManager._append(filename, records, *({"op": "del", "key": k} for k in keys))
 
-    # --- CONFIG COMMANDS ---
+    @staticmethod
+    def compact(filename, records, binary=None):
+        """Write ``records`` as the new snapshot and truncate the journal.
 
-    def do_config(self):
-        table = Table(
-            title="SYSTEM CONFIGURATION", border_style="blue", box=box.ROUNDED
-        )
-        table.add_column("Key", style="cyan")
-        table.add_column("Value", style="white")
+        ``binary`` picks the snapshot format; by default the current one is
+        kept. Replaying the journal is idempotent (an ``add`` already present
+        in the snapshot is skipped), so a crash between the snapshot rename
+        and the truncate only means the entries get replayed once more.
+        """
+        with DataManager.locked():
+            DataManager._write_atomic(filename, records, binary)
+            open(filename + JOURNAL_SUFFIX, "w").close()
+            DataManager._journal_sizes[filename] = 0
+            DataManager._stamp(filename)
 
-        for k, v in self.config.items():
-            table.add_row(k.replace("_", " ").title(), str(v))
-        console.print(table)
+    @staticmethod
+    def _stat(filename):
+        """(snapshot identity, journal size) as seen on disk right now."""
+        try:
+            st = os.stat(filename)
+            ident = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            ident = None
+        try:
+            size = os.path.getsize(filename + JOURNAL_SUFFIX)
+        except FileNotFoundError:
+            size = 0
+        return ident, size
 
-    def do_update_config(self):
-        console.print(
+    @staticmethod
+    def _stamp(filename):
+        # Callers hold the lock and are up to date, so what is on disk now is
+        # exactly what this process has seen.
+        DataManager._stamps[filename] = DataManager._stat(filename)
+
+    @staticmethod
+    def _write_atomic(filename, data, binary=None):
+        if binary is None:
+            binary = snapshot.is_snapshot(filename)
+        binary = binary and snapshot.encodable(data)
+        # Unique per process: two writers must not share a temp file
+        tmp = f"{filename}.{os.getpid()}.tmp"
+        with Metrics.phase("data.save"):
+            with open(tmp, "wb" if binary else "w") as f:
+                if binary:
+                    f.write(snapshot.dumps(data))
+                else:
+                    json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+                Metrics.count("bytes_written", f.tell())
+            os.replace(tmp, filename)
+
+    @staticmethod
+    def _append(filename, records, *entries):
+        lines = "".join(json.dumps(e, separators=(",", ":")) + "\n" for e in entries)
+        Metrics.count("journal_entries", len(entries))
+        Metrics.count("bytes_written", len(lines))
+        with DataManager.locked(), Metrics.phase("data.append"):
+            with open(filename + JOURNAL_SUFFIX, "a") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            DataManager._stamp(filename)
+            size = DataManager._journal_sizes.get(filename, 0) + len(entries)
+            DataManager._journal_sizes[filename] = size
+            if size >= JOURNAL_COMPACT_THRESHOLD:
+                # The entries are durable already, so the write has succeeded
+                # even if compacting fails; it is tried again on the next append.
+                try:
+                    DataManager.compact(filename, records)
+                except OSError as e:
+                    RetroUI.warn(f"Could not compact {filename}: {e}")
+
+    @staticmethod
+    def _read_journal(filename, offset=0):
+        path = filename + JOURNAL_SUFFIX
+        if not os.path.exists(path):
+            return []
+        entries = []
+        good = offset
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                try:
+                    entries.append(json.loads(raw))
+                except ValueError:
+                    break
+                good += len(raw)
+            torn = f.tell() != good
+        Metrics.count("bytes_read", good - offset)
+        if torn:
+            # A crash mid-append leaves a partial last line; drop it so the
+            # next append starts on a clean line.
+            with open(path, "r+b") as f:
+                f.truncate(good)
+        return entries
+
+    @staticmethod
+    def _replay(records, entries):
+        records = list(records)
+        index = {}
+        for pos, record in enumerate(records):
+            index.setdefault(record.get("id"), pos)
+
+        for entry in entries:
+            key = entry["key"]
+            pos = index.get(key)
+            if entry["op"] == "add":
+                if pos is not None and records[pos] == entry["record"]:
+                    continue  # already folded into the snapshot
+                index.setdefault(key, len(records))
+                records.append(entry["record"])
+            elif entry["op"] == "put":
+                if pos is None:
+                    index[key] = len(records)
+                    records.append(entry["record"])
+                else:
+                    records[pos] = entry["record"]
+            elif entry["op"] == "del" and pos is not None:
+                records[pos] = None
+                del index[key]
+
+        return [r for r in records if r is not None]
+
+
+class ConflictError(Exception):
+    """A record was changed by another process in a way that cannot be merged."""
+
+
+class CorruptDataError(ValueError):
+    """A data file exists but cannot be decoded."""
+
+
+class ClientInUseError(Exception):
+    """A client still has invoices, so deleting it would orphan them."""
+
+
+CLIENT_DELETE_POLICIES = ("refuse", "cascade", "archive")
+
+
+def merge_record(base, mine, theirs):
+    """Three-way merge of an edited record against the one now stored.
+
+    ``mine`` is ``base`` (the record as it was read) plus local edits and
+    ``theirs`` is the stored record. If nobody else wrote in between, the
+    versions match and ``mine`` wins; otherwise fields only one side changed
+    are combined and a field both sides changed differently is a conflict.
+    Returns the record to store, with its version bumped.
+    """
+    version = theirs.get("version", 0)
+    if mine.get("version", 0) == version:
+        merged = dict(mine)
+    elif base is None or base.get("version", 0) != mine.get("version", 0):
+        raise ConflictError(f"{mine['id']} changed since it was read")
+    else:
+        merged = dict(theirs)
+        for key in (set(base) | set(mine)) - {"version"}:
+            if mine.get(key) == base.get(key):
+                continue
+            if theirs.get(key) not in (base.get(key), mine.get(key)):
+                raise ConflictError(f"{key!r} of {mine['id']} was changed elsewhere")
+            if key in mine:
+                merged[key] = mine[key]
+            else:
+                merged.pop(key, None)
+    merged["version"] = version + 1
+    return merged
+
+
+# --- STORAGE BACKENDS ---
+
+
+class StoreEvents:
+    """Fans store mutations out to derived indexes (reports, search, ...).
+
+    Every write is bracketed by ``before_write`` / ``after_write`` and each
+    record is reported through ``invoice_added``, ``invoice_deleted``,
+    ``client_added``, ``client_updated`` or ``client_deleted``. Listeners
+    implement only the hooks they need. ``after_write`` is not sent when the
+    write fails, so listeners should stage changes until they see it.
+
+    Writes hold the exclusive data lock from ``before_write`` to
+    ``after_write``, after the store has caught up with other processes.
+    New records start at ``version`` 1 and each update bumps it. Renaming a
+    client rewrites ``client_name`` on its invoices, which are reported as
+    deleted and added again.
+
+    ``delete_client`` applies one of CLIENT_DELETE_POLICIES to a client
+    with invoices: ``refuse`` raises ClientInUseError, ``cascade`` deletes
+    the invoices in the same write and ``archive`` keeps the client, marked
+    ``archived``, so its invoices stay valid but no new ones can be made.
+    """
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def _emit(self, event, record=None):
+        for listener in self.listeners:
+            hook = getattr(listener, event, None)
+            if hook:
+                hook() if record is None else hook(record)
+
+    def _emitting(self, event, records):
+        for record in records:
+            self._emit(event, record)
+            yield record
+
+    @staticmethod
+    def _versioned(records):
+        for record in records:
+            record.setdefault("version", 1)
+            yield record
+
+    def _sync(self):
+        pass
+
+    def _archive_client(self, c_id):
+        client = self.get_client(c_id)
+        if client is None:
+            return 0
+        if not client.get("archived"):
+            self.update_client(dict(client, archived=date.today().isoformat()), client)
+        return len(self.client_invoices(c_id))
+
+    @staticmethod
+    def _refuse(client, invoices):
+        if invoices:
+            raise ClientInUseError(
+                f"{client['name']} still has {len(invoices)} invoices "
+                f"({', '.join(i['id'] for i in invoices[:3])}"
+                f"{', ...' if len(invoices) > 3 else ''})"
+            )
+
+    @contextmanager
+    def _write(self):
+        with DataManager.locked():
+            self._sync()
+            self._emit("before_write")
+            yield
+            self._emit("after_write")
+
+
+class InvoiceArchive:
+    """Invoices of closed fiscal years, kept out of the hot invoice file.
+
+    Each archived fiscal year is one gzip-compressed ``snapshot`` segment in
+    ARCHIVE_DIR, described in ``index.json`` by its invoice count, date range
+    and invoices per client. Counts come from the index alone, and date and
+    client filters skip segments that cannot match; a segment is only read
+    (and then cached) when a query needs its records.
+    """
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        self.index = None
+        self._segments = {}
+
+    def load(self):
+        """{fiscal year: segment description}, re-read when another process changed it."""
+        index = DataManager.refresh(self.index_path, self.index, {})
+        if index is not self.index:
+            self.index = index
+            self._segments = {}
+        return index
+
+    def count(self):
+        return sum(s["invoices"] for s in self.load().values())
+
+    def client_count(self, c_id):
+        return sum(s["clients"].get(str(c_id), 0) for s in self.load().values())
+
+    def segment(self, fy):
+        """The archived invoices of one fiscal year, in stored order."""
+        records = self._segments.get(fy)
+        if records is None:
+            path = os.path.join(self.directory, self.load()[fy]["file"])
+            with Metrics.phase("archive.load"):
+                with open(path, "rb") as f:
+                    raw = f.read()
+                Metrics.count("bytes_read", len(raw))
+                records = self._segments[fy] = snapshot.loads(gzip.decompress(raw))
+        return records
+
+    def invoices(self, date_from=None, date_to=None, client_ids=None):
+        """Archived invoices, oldest year first, from the segments the filters allow."""
+        for fy, segment in sorted(self.load().items()):
+            if (date_from and segment["to"] < date_from) or (
+                date_to and segment["from"] > date_to
+            ):
+                continue
+            if client_ids is not None and not any(
+                str(c_id) in segment["clients"] for c_id in client_ids
+            ):
+                continue
+            yield from self.segment(fy)
+
+    def get(self, inv_id):
+        """An archived invoice, trying years named in its id (``INV/2024-25/...``) first."""
+        years = sorted(self.load(), reverse=True)
+        years.sort(key=lambda fy: fy[2:] not in inv_id)
+        for fy in years:
+            invoice = next((i for i in self.segment(fy) if i["id"] == inv_id), None)
+            if invoice:
+                return invoice
+        return None
+
+    def add(self, fy, invoices):
+        """Write ``invoices`` into the segment of ``fy``, replacing any with the same id."""
+        ids = {i["id"] for i in invoices}
+        kept = [i for i in self.segment(fy) if i["id"] not in ids] if fy in self.load() else []
+        records = kept + invoices
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"invoices-{fy}.gz"
+        path = os.path.join(self.directory, name)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with Metrics.phase("archive.save"):
+            data = gzip.compress(snapshot.dumps(records), compresslevel=6)
+            with open(tmp, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            Metrics.count("bytes_written", len(data))
+        clients = {}
+        for invoice in records:
+            key = str(invoice["client_id"])
+            clients[key] = clients.get(key, 0) + 1
+        dates = [i["date"] for i in records]
+        index = dict(self.load())
+        index[fy] = {
+            "file": name,
+            "invoices": len(records),
+            "from": min(dates),
+            "to": max(dates),
+            "bytes": len(data),
+            "clients": clients,
+        }
+        DataManager.save(self.index_path, index)
+        self.index = index
+        self._segments[fy] = records
+
+    def remove(self, fy):
+        index = dict(self.load())
+        segment = index.pop(fy)
+        DataManager.save(self.index_path, index)
+        self.index = index
+        self._segments.pop(fy, None)
+        os.remove(os.path.join(self.directory, segment["file"]))
+
+
+class JsonStore(StoreEvents):
+    """Clients and invoices held in memory and persisted through DataManager.
+
+    Only the hot invoices are loaded at startup; closed fiscal years moved to
+    the InvoiceArchive are read when a lookup or listing reaches them.
+    Archived invoices are read-only and keep the client name they were
+    issued with.
+    """
+
+    def __init__(self):
+        self.listeners = []
+        self._clients = DataManager.load(DATA_FILE_CLIENTS, [])
+        self._invoices = DataManager.load(DATA_FILE_INVOICES, [])
+        self._by_client = None
+        self._ordinal = 0
+        self.archive = InvoiceArchive()
+
+    def _sync(self):
+        """Pick up whatever other processes wrote since we last looked."""
+        self._clients = DataManager.refresh(DATA_FILE_CLIENTS, self._clients, [])
+        invoices = DataManager.refresh(DATA_FILE_INVOICES, self._invoices, [])
+        if invoices is not self._invoices:
+            self._invoices = invoices
+            self._by_client = None
+
+    def _client_index(self):
+        """{client_id: [(ordinal, invoice), ...]} in stored order, built on first use.
+
+        Our own writes keep it current; changes picked up from other
+        processes drop it, to be rebuilt on the next lookup. Ordinals follow
+        the invoice list, so merged per-client lists keep its order.
+        """
+        self._sync()
+        if self._by_client is None:
+            self._by_client = {}
+            self._ordinal = 0
+            for invoice in self._invoices:
+                self._index(invoice)
+        return self._by_client
+
+    def _index(self, invoice):
+        if self._by_client is not None:
+            entries = self._by_client.setdefault(invoice["client_id"], [])
+            entries.append((self._ordinal, invoice))
+            self._ordinal += 1
+
+    @contextmanager
+    def _rollback(self):
+        """Put the lists back as they were if the block fails.
+
+        Writes run their listener hooks before touching the lists or the
+        journal, so a failing listener or a failed write leaves nothing
+        behind, as the SQLite transaction does. Records the block edits in
+        place are registered as ``(record, copy)`` in the yielded list and
+        restored too. A block journals to two files at most; should the
+        second write fail, the next ``_sync`` reloads both from disk.
+        """
+        clients, invoices = list(self._clients), list(self._invoices)
+        edited = []
+        try:
+            yield edited
+        except Exception:
+            for record, before in reversed(edited):
+                record.clear()
+                record.update(before)
+            self._clients[:] = clients
+            self._invoices[:] = invoices
+            self._by_client = None
+            DataManager.forget(DATA_FILE_CLIENTS)
+            DataManager.forget(DATA_FILE_INVOICES)
+            raise
+
+    def _unindex(self, invoice):
+        entries = (self._by_client or {}).get(invoice["client_id"], [])
+        for pos, (_, indexed) in enumerate(entries):
+            if indexed is invoice:
+                del entries[pos]
+                return
+
+    # Clients
+
+    def clients(self):
+        self._sync()
+        return list(self._clients)
+
+    def count_clients(self):
+        self._sync()
+        return len(self._clients)
+
+    def get_client(self, c_id):
+        self._sync()
+        return next((c for c in self._clients if c["id"] == c_id), None)
+
+    def find_client(self, name):
+        """First client whose name contains ``name``, skipping archived ones."""
+        self._sync()
+        name = name.lower()
+        return next(
+            (c for c in self._clients if name in c["name"].lower() and not c.get("archived")),
+            None,
+        )
+
+    def add_client(self, client):
+        client.setdefault("version", 1)
+        with self._write():
+            self._emit("client_added", client)
+            with self._rollback():
+                self._clients.append(client)
+                DataManager.add(DATA_FILE_CLIENTS, self._clients, client)
+
+    def add_clients(self, clients):
+        with self._write():
+            clients = list(self._emitting("client_added", self._versioned(clients)))
+            with self._rollback():
+                self._clients.extend(clients)
+                DataManager.add_many(DATA_FILE_CLIENTS, self._clients, clients)
+        return len(clients)
+
+    def update_client(self, client, base=None):
+        """Store an edited copy of a client; ``base`` is the record it was read as.
+
+        Returns the stored record, merged with concurrent edits if needed.
+        """
+        with self._write():
+            current = self.get_client(client["id"])
+            if current is None:
+                raise ConflictError(f"{client['id']} was deleted elsewhere")
+            client = merge_record(base, client, current)
+            self._emit("client_updated", client)
+            with self._rollback() as edited:
+                renamed = []
+                if client["name"] != current["name"]:
+                    renamed = self._rename_invoices(client, edited)
+                self._clients[self._clients.index(current)] = client
+                DataManager.put(DATA_FILE_CLIENTS, self._clients, client)
+                if renamed:
+                    DataManager.put_many(DATA_FILE_INVOICES, self._invoices, renamed)
+        return client
+
+    def _rename_invoices(self, client, edited):
+        """Rename the client on its invoices; returns those that changed."""
+        renamed = []
+        for invoice in self.client_invoices(client["id"]):
+            if invoice.get("client_name") != client["name"]:
+                # Updated in place so the list and the index stay in step
+                self._emit("invoice_deleted", invoice)
+                edited.append((invoice, dict(invoice)))
+                invoice["client_name"] = client["name"]
+                invoice["version"] = invoice.get("version", 1) + 1
+                self._emit("invoice_added", invoice)
+                renamed.append(invoice)
+        return renamed
+
+    def delete_client(self, c_id, policy="refuse"):
+        """Delete a client under one of CLIENT_DELETE_POLICIES; returns its invoice count."""
+        if policy == "archive":
+            return self._archive_client(c_id)
+        with self._write():
+            client = self.get_client(c_id)
+            if not client:
+                return 0
+            archived = self.archive.client_count(c_id)
+            if archived:
+                raise ClientInUseError(
+                    f"{client['name']} has {archived} invoices in archived fiscal years; "
+                    "archive the client instead"
+                )
+            invoices = self.client_invoices(c_id)
+            if policy != "cascade":
+                self._refuse(client, invoices)
+            for invoice in invoices:
+                self._emit("invoice_deleted", invoice)
+            self._emit("client_deleted", client)
+            with self._rollback():
+                if invoices:
+                    doomed = {id(i) for i in invoices}
+                    self._invoices[:] = [i for i in self._invoices if id(i) not in doomed]
+                    self._by_client.pop(c_id, None)
+                    DataManager.delete_many(
+                        DATA_FILE_INVOICES, self._invoices, [i["id"] for i in invoices]
+                    )
+                self._clients.remove(client)
+                DataManager.delete(DATA_FILE_CLIENTS, self._clients, c_id)
+        return len(invoices)
+
+    # Invoices
+
+    def invoices(
+        self,
+        client_name=None,
+        date_from=None,
+        date_to=None,
+        sort=None,
+        descending=False,
+        limit=None,
+        offset=0,
+    ):
+        self._sync()
+        if client_name:
+            name = client_name.lower()
+            ids = {c["id"] for c in self._clients if name in c["name"].lower()}
+            index = self._client_index()
+            matches = [index.get(c_id, ()) for c_id in ids]
+            Metrics.count("records_scanned", sum(map(len, matches)))
+            archived = self.archive.invoices(date_from, date_to, ids)
+            invoices = chain(
+                (i for i in archived if i["client_id"] in ids),
+                (i for _, i in heapq.merge(*matches)),
+            )
+        else:
+            Metrics.count("records_scanned", len(self._invoices))
+            invoices = chain(self.archive.invoices(date_from, date_to), self._invoices)
+        if date_from:
+            invoices = (i for i in invoices if i["date"] >= date_from)
+        if date_to:
+            invoices = (i for i in invoices if i["date"] <= date_to)
+        if sort or limit is not None or offset:
+            field = INVOICE_SORT_KEYS[sort] if sort else None
+            invoices = paginate(invoices, field, descending, limit, offset)
+        return invoices
+
+    def count_invoices(self):
+        self._sync()
+        return len(self._invoices) + self.archive.count()
+
+    def client_invoices(self, c_id):
+        """The client's hot invoices in stored order, from the client index."""
+        return [i for _, i in self._client_index().get(c_id, ())]
+
+    def get_invoice(self, inv_id):
+        return self._hot_invoice(inv_id) or self.archive.get(inv_id)
+
+    def _hot_invoice(self, inv_id):
+        self._sync()
+        return next((i for i in self._invoices if i["id"] == inv_id), None)
+
+    def add_invoice(self, invoice):
+        invoice.setdefault("version", 1)
+        with self._write():
+            self._emit("invoice_added", invoice)
+            with self._rollback():
+                self._invoices.append(invoice)
+                self._index(invoice)
+                DataManager.add(DATA_FILE_INVOICES, self._invoices, invoice)
+
+    def add_invoices(self, invoices):
+        with self._write():
+            invoices = list(self._emitting("invoice_added", self._versioned(invoices)))
+            with self._rollback():
+                self._invoices.extend(invoices)
+                for invoice in invoices:
+                    self._index(invoice)
+                DataManager.add_many(DATA_FILE_INVOICES, self._invoices, invoices)
+        return len(invoices)
+
+    def delete_invoice(self, inv_id):
+        if not self._hot_invoice(inv_id) and self.archive.get(inv_id):
+            raise ValueError(f"{inv_id} is archived; restore its fiscal year first.")
+        with self._write():
+            inv = self._hot_invoice(inv_id)
+            if inv:
+                self._emit("invoice_deleted", inv)
+                with self._rollback():
+                    self._invoices.remove(inv)
+                    self._unindex(inv)
+                    DataManager.delete(DATA_FILE_INVOICES, self._invoices, inv_id)
+
+    def dedupe_ids(self, new_client_id):
+        """Give records that repeat an earlier id a new one; returns the counts."""
+        with self._write():
+            clients, invoices = dedupe_records(
+                self._clients, self._invoices, new_client_id
+            )
+            self._by_client = None
+            for records, changed, filename in (
+                (self._clients, clients, DATA_FILE_CLIENTS),
+                (self._invoices, invoices, DATA_FILE_INVOICES),
+            ):
+                for pos, record in changed.items():
+                    records[pos] = record
+                if changed:
+                    # Journal entries address records by id, which is exactly
+                    # what is ambiguous here, so rewrite the snapshot instead
+                    DataManager.compact(filename, records)
+        return len(clients), len(invoices)
+
+    def archive_years(self, years=None):
+        """Move the invoices of fiscal ``years`` (default: every closed year) to the archive.
+
+        Returns {year: invoices moved}. The invoices still exist, so no
+        events are sent and derived indexes stay valid. Segments are written
+        before the hot file shrinks; running it again after an interruption
+        replaces the copies already archived.
+        """
+        current = fiscal_year(date.today().isoformat())
+        moving = {}
+        with DataManager.locked():
+            self._sync()
+            for invoice in self._invoices:
+                fy = fiscal_year(invoice["date"])
+                if (fy in years) if years else (fy < current):
+                    moving.setdefault(fy, []).append(invoice)
+            for fy, invoices in sorted(moving.items()):
+                self.archive.add(fy, invoices)
+            if moving:
+                self._invoices = [
+                    i for i in self._invoices if fiscal_year(i["date"]) not in moving
+                ]
+                self._by_client = None
+                DataManager.compact(DATA_FILE_INVOICES, self._invoices)
+        return {fy: len(invoices) for fy, invoices in moving.items()}
+
+    def restore_year(self, fy):
+        """Move an archived fiscal year back into the hot file; returns its invoice count."""
+        with DataManager.locked():
+            self._sync()
+            hot = {i["id"] for i in self._invoices}
+            invoices = self.archive.segment(fy)
+            # Older than everything still hot, so they go first
+            self._invoices = [i for i in invoices if i["id"] not in hot] + self._invoices
+            self._by_client = None
+            DataManager.compact(DATA_FILE_INVOICES, self._invoices)
+            self.archive.remove(fy)
+        return len(invoices)
+
+    def compact(self, binary):
+        """Fold the journals into new binary or JSON snapshots; returns their sizes."""
+        sizes = []
+        with DataManager.locked():
+            self._sync()
+            for filename, records in (
+                (DATA_FILE_CLIENTS, self._clients),
+                (DATA_FILE_INVOICES, self._invoices),
+            ):
+                DataManager.compact(filename, records, binary)
+                sizes.append(os.path.getsize(filename))
+        return sizes
+
+    def close(self):
+        pass
+
+
+class SQLiteStore(StoreEvents):
+    """Clients and invoices in an indexed SQLite database.
+
+    Each record is stored as its JSON document next to the columns the shell
+    looks up and filters by, so commands run indexed queries and nothing is
+    read into memory until it is asked for. ``seq`` keeps insertion order and
+    tolerates the duplicate ids older data may contain.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS clients (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_clients_id ON clients (id);
+        CREATE INDEX IF NOT EXISTS idx_clients_name ON clients (name COLLATE NOCASE);
+
+        CREATE TABLE IF NOT EXISTS invoices (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL,
+            client_id INTEGER,
+            client_name TEXT,
+            date TEXT,
+            total REAL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_invoices_id ON invoices (id);
+        CREATE INDEX IF NOT EXISTS idx_invoices_client_id ON invoices (client_id);
+        CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices (date);
+        CREATE INDEX IF NOT EXISTS idx_invoices_client_name
+            ON invoices (client_name COLLATE NOCASE);
+    """
+
+    def __init__(self, path=DATA_FILE_DB):
+        self.listeners = []
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    def _one(self, sql, params):
+        row = self.conn.execute(sql, params).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @staticmethod
+    def _like(text):
+        escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return f"%{escaped}%"
+
+    # Clients
+
+    def clients(self):
+        rows = self.conn.execute("SELECT data FROM clients ORDER BY seq")
+        return [json.loads(r[0]) for r in rows]
+
+    def count_clients(self):
+        return self.conn.execute("SELECT COUNT(*) FROM clients").fetchone()[0]
+
+    def get_client(self, c_id):
+        return self._one(
+            "SELECT data FROM clients WHERE id = ? ORDER BY seq LIMIT 1", (c_id,)
+        )
+
+    def find_client(self, name):
+        return self._one(
+            "SELECT data FROM clients WHERE name LIKE ? ESCAPE '\\' "
+            "AND json_extract(data, '$.archived') IS NULL ORDER BY seq LIMIT 1",
+            (self._like(name),),
+        )
+
+    def add_client(self, client):
+        client.setdefault("version", 1)
+        with self._write(), self.conn:
+            self.conn.execute(
+                "INSERT INTO clients (id, name, data) VALUES (?, ?, ?)",
+                (client["id"], client["name"], json.dumps(client)),
+            )
+            self._emit("client_added", client)
+
+    def add_clients(self, clients):
+        before = self.conn.total_changes
+        with self._write(), self.conn:
+            self.conn.executemany(
+                "INSERT INTO clients (id, name, data) VALUES (?, ?, ?)",
+                (
+                    (c["id"], c["name"], json.dumps(c))
+                    for c in self._emitting("client_added", self._versioned(clients))
+                ),
+            )
+        return self.conn.total_changes - before
+
+    def update_client(self, client, base=None):
+        with self._write(), self.conn:
+            current = self.get_client(client["id"])
+            if current is None:
+                raise ConflictError(f"{client['id']} was deleted elsewhere")
+            client = merge_record(base, client, current)
+            self.conn.execute(
+                "UPDATE clients SET name = ?, data = ? WHERE seq = "
+                "(SELECT seq FROM clients WHERE id = ? ORDER BY seq LIMIT 1)",
+                (client["name"], json.dumps(client), client["id"]),
+            )
+            self._emit("client_updated", client)
+            if client["name"] != current["name"]:
+                self._rename_invoices(client)
+        return client
+
+    def _rename_invoices(self, client):
+        rows = self.conn.execute(
+            "SELECT seq, data FROM invoices WHERE client_id = ? AND client_name IS NOT ?",
+            (client["id"], client["name"]),
+        ).fetchall()
+        updates = []
+        for seq, data in rows:
+            invoice = json.loads(data)
+            renamed = dict(
+                invoice, client_name=client["name"], version=invoice.get("version", 1) + 1
+            )
+            self._emit("invoice_deleted", invoice)
+            self._emit("invoice_added", renamed)
+            updates.append((renamed["client_name"], json.dumps(renamed), seq))
+        self.conn.executemany(
+            "UPDATE invoices SET client_name = ?, data = ? WHERE seq = ?", updates
+        )
+
+    def delete_client(self, c_id, policy="refuse"):
+        """Delete a client under one of CLIENT_DELETE_POLICIES; returns its invoice count."""
+        if policy == "archive":
+            return self._archive_client(c_id)
+        with self._write(), self.conn:
+            client = self.get_client(c_id)
+            if not client:
+                return 0
+            invoices = self.client_invoices(c_id)
+            if policy != "cascade":
+                self._refuse(client, invoices)
+            for invoice in invoices:
+                self._emit("invoice_deleted", invoice)
+            self.conn.execute("DELETE FROM invoices WHERE client_id = ?", (c_id,))
+            self.conn.execute(
+                "DELETE FROM clients WHERE seq = "
+                "(SELECT seq FROM clients WHERE id = ? ORDER BY seq LIMIT 1)",
+                (c_id,),
+            )
+            self._emit("client_deleted", client)
+        return len(invoices)
+
+    # Invoices
+
+    def invoices(
+        self,
+        client_name=None,
+        date_from=None,
+        date_to=None,
+        sort=None,
+        descending=False,
+        limit=None,
+        offset=0,
+    ):
+        where, params = [], []
+        if client_name:
+            where.append(
+                "client_id IN (SELECT id FROM clients WHERE name LIKE ? ESCAPE '\\')"
+            )
+            params.append(self._like(client_name))
+        if date_from:
+            where.append("date >= ?")
+            params.append(date_from)
+        if date_to:
+            where.append("date <= ?")
+            params.append(date_to)
+        sql = "SELECT data FROM invoices"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if sort:
+            # Column names come from the INVOICE_SORT_KEYS whitelist
+            direction = "DESC" if descending else "ASC"
+            sql += f" ORDER BY {INVOICE_SORT_KEYS[sort]} {direction}, seq {direction}"
+        else:
+            sql += " ORDER BY seq"
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params += [-1 if limit is None else limit, offset]
+        rows = self.conn.execute(sql, params)
+        return (json.loads(r[0]) for r in rows)
+
+    def count_invoices(self):
+        return self.conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+
+    def client_invoices(self, c_id):
+        rows = self.conn.execute(
+            "SELECT data FROM invoices WHERE client_id = ? ORDER BY seq", (c_id,)
+        )
+        return [json.loads(r[0]) for r in rows]
+
+    def get_invoice(self, inv_id):
+        return self._one(
+            "SELECT data FROM invoices WHERE id = ? ORDER BY seq LIMIT 1", (inv_id,)
+        )
+
+    def add_invoice(self, invoice):
+        invoice.setdefault("version", 1)
+        with self._write(), self.conn:
+            self.conn.execute(
+                "INSERT INTO invoices (id, client_id, client_name, date, total, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                self._invoice_row(invoice),
+            )
+            self._emit("invoice_added", invoice)
+
+    def add_invoices(self, invoices):
+        before = self.conn.total_changes
+        with self._write(), self.conn:
+            self.conn.executemany(
+                "INSERT INTO invoices (id, client_id, client_name, date, total, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    self._invoice_row(i)
+                    for i in self._emitting("invoice_added", self._versioned(invoices))
+                ),
+            )
+        return self.conn.total_changes - before
+
+    def delete_invoice(self, inv_id):
+        with self._write(), self.conn:
+            inv = self.get_invoice(inv_id)
+            if inv:
+                self.conn.execute(
+                    "DELETE FROM invoices WHERE seq = "
+                    "(SELECT seq FROM invoices WHERE id = ? ORDER BY seq LIMIT 1)",
+                    (inv_id,),
+                )
+                self._emit("invoice_deleted", inv)
+
+    @staticmethod
+    def _invoice_row(invoice):
+        return (
+            invoice["id"],
+            invoice["client_id"],
+            invoice["client_name"],
+            invoice["date"],
+            invoice["total"],
+            json.dumps(invoice),
+        )
+
+    def dedupe_ids(self, new_client_id):
+        """Give records that repeat an earlier id a new one; returns the counts."""
+        with self._write(), self.conn:
+            rows = {
+                table: self.conn.execute(
+                    f"SELECT seq, data FROM {table} ORDER BY seq"
+                ).fetchall()
+                for table in ("clients", "invoices")
+            }
+            clients, invoices = dedupe_records(
+                [json.loads(data) for _, data in rows["clients"]],
+                [json.loads(data) for _, data in rows["invoices"]],
+                new_client_id,
+            )
+            self.conn.executemany(
+                "UPDATE clients SET id = ?, name = ?, data = ? WHERE seq = ?",
+                (
+                    (c["id"], c["name"], json.dumps(c), rows["clients"][pos][0])
+                    for pos, c in clients.items()
+                ),
+            )
+            self.conn.executemany(
+                "UPDATE invoices SET id = ?, client_id = ?, data = ? WHERE seq = ?",
+                (
+                    (i["id"], i["client_id"], json.dumps(i), rows["invoices"][pos][0])
+                    for pos, i in invoices.items()
+                ),
+            )
+        return len(clients), len(invoices)
+
+    def import_json(self):
+        """One-shot migration of the JSON files (journals and archive included)."""
+        clients = DataManager.load(DATA_FILE_CLIENTS, [])
+        invoices = list(InvoiceArchive().invoices()) + DataManager.load(DATA_FILE_INVOICES, [])
+        return self.add_clients(clients), self.add_invoices(invoices)
+
+    def close(self):
+        self.conn.close()
+
+
+STORAGE_BACKENDS = {"json": JsonStore, "sqlite": SQLiteStore}
+
+# Sort keys accepted by the list commands, mapped to record fields.
+INVOICE_SORT_KEYS = {"date": "date", "id": "id", "total": "total", "client": "client_name"}
+CLIENT_SORT_KEYS = {"id": "id", "name": "name"}
+
+
+def paginate(records, field=None, descending=False, limit=None, offset=0):
+    """Sort by ``field`` and slice, holding at most ``offset + limit`` records."""
+    if field is not None:
+        key = lambda r: r[field]
+        if limit is not None:
+            pick = heapq.nlargest if descending else heapq.nsmallest
+            records = pick(offset + limit, records, key=key)
+        else:
+            records = sorted(records, key=key, reverse=descending)
+    return islice(records, offset, None if limit is None else offset + limit)
+
+
+def open_store(backend=None):
+    backend = backend or STORAGE_BACKEND
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}'")
+    return STORAGE_BACKENDS[backend]()
+
+
+# --- ID ALLOCATION ---
+
+
+class _SeqSlot:
+    """Stands in for ``{seq}`` while the rest of an invoice number is formatted."""
+
+    def __format__(self, spec):
+        return f"\0{spec}\0"
+
+
+class IdAllocator:
+    """Sequential client ids and invoice numbers, safe across processes.
+
+    Counters live in SEQUENCE_FILE and are bumped under the data lock, so
+    two sessions never hand out the same number. Invoice numbers follow the
+    ``invoice_number_format`` config template with one counter per distinct
+    prefix, i.e. per fiscal year by default. A counter missing from the
+    file is seeded from the highest number already in the store.
+    """
+
+    def __init__(self, store, config, path=SEQUENCE_FILE):
+        self.store = store
+        self.config = config
+        self.path = path
+        self.counters = None
+
+    @contextmanager
+    def batch(self):
+        """Hold the lock and write the counters once for everything inside.
+
+        Wrap the store write that uses the ids as well, so numbers are
+        consumed in the order the records are saved. Nothing is written if
+        the block fails.
+        """
+        if self.counters is not None:
+            yield
+            return
+        with DataManager.locked():
+            self.counters = DataManager.load(self.path, {})
+            try:
+                yield
+                DataManager.save(self.path, self.counters)
+            finally:
+                self.counters = None
+
+    def _next(self, scope, seed):
+        with self.batch():
+            n = self.counters.get(scope)
+            if n is None:
+                n = seed()
+            self.counters[scope] = n + 1
+            return n + 1
+
+    def next_client_id(self):
+        return self._next(
+            "client", lambda: max((c["id"] for c in self.store.clients()), default=0)
+        )
+
+    def next_plan_id(self, plans):
+        """Recurring invoice ids are never reused: issued invoices refer to them."""
+        return self._next("recurring", lambda: max((p["id"] for p in plans), default=0))
+
+    def next_payment_id(self, payments):
+        return self._next("payment", lambda: max((p["id"] for p in payments), default=0))
+
+    def invoice_format(self, date):
+        """(prefix, seq format spec, suffix) of invoice numbers dated ``date``."""
+        template = self.config.get("invoice_number_format") or DEFAULT_CONFIG[
+            "invoice_number_format"
+        ]
+        try:
+            parts = template.format(
+                fy=fiscal_year(date)[2:], year=date[:4], seq=_SeqSlot()
+            ).split("\0")
+        except (KeyError, IndexError, ValueError) as e:
+            raise ValueError(f"Bad invoice_number_format '{template}': {e}")
+        if len(parts) != 3:
+            raise ValueError(f"invoice_number_format needs exactly one {{seq}}: '{template}'")
+        return tuple(parts)
+
+    def next_invoice_id(self, date):
+        prefix, spec, suffix = self.invoice_format(date)
+
+        def seed():
+            pattern = re.compile(re.escape(prefix) + r"(\d+)" + re.escape(suffix))
+            numbers = (pattern.fullmatch(i["id"]) for i in self.store.invoices())
+            return max((int(m.group(1)) for m in numbers if m), default=0)
+
+        n = self._next(f"invoice:{prefix}{{seq}}{suffix}", seed)
+        return f"{prefix}{format(n, spec)}{suffix}"
+
+
+def dedupe_records(clients, invoices, new_client_id):
+    """Find records whose id repeats an earlier one and rename them.
+
+    A later client with a taken id gets ``new_client_id()`` and takes the
+    invoices that carry its old id and its name along; a later invoice with
+    a taken number gets a ``-2``, ``-3``... suffix. Returns
+    ``({position: client}, {position: invoice})`` of the changed records.
+    """
+    seen, moved, changed_clients = {}, {}, {}
+    for pos, client in enumerate(clients):
+        c_id = client["id"]
+        if c_id not in seen:
+            seen[c_id] = client["name"]
+            continue
+        client = dict(client, id=new_client_id(), version=client.get("version", 0) + 1)
+        changed_clients[pos] = client
+        if client["name"] != seen[c_id]:
+            # Invoices tell the two clients apart only by name
+            moved[(c_id, client["name"])] = client["id"]
+
+    taken = {i["id"] for i in invoices}
+    seen, changed_invoices = set(), {}
+    for pos, invoice in enumerate(invoices):
+        changes = {}
+        owner = moved.get((invoice["client_id"], invoice["client_name"]))
+        if owner is not None:
+            changes["client_id"] = owner
+        if invoice["id"] in seen:
+            n = 2
+            while f"{invoice['id']}-{n}" in taken:
+                n += 1
+            changes["id"] = f"{invoice['id']}-{n}"
+            taken.add(changes["id"])
+        seen.add(invoice["id"])
+        if changes:
+            changes["version"] = invoice.get("version", 0) + 1
+            changed_invoices[pos] = dict(invoice, **changes)
+    return changed_clients, changed_invoices
+
+
+def fiscal_year(date):
+    """Indian fiscal year (April-March) of a YYYY-MM-DD date, e.g. 'FY2026-27'."""
+    year, month = int(date[:4]), int(date[5:7])
+    start = year if month >= 4 else year - 1
+    return f"FY{start}-{(start + 1) % 100:02d}"
+
+
+def fiscal_quarter(date):
+    """Fiscal quarter of a YYYY-MM-DD date, e.g. 'FY2026-27 Q1' for April-June."""
+    month = int(date[5:7])
+    return f"{fiscal_year(date)} Q{(month - 4) % 12 // 3 + 1}"
+
+
+class RevenueReport:
+    """Revenue aggregates kept up to date from store events.
+
+    Totals are bucketed by client, month, fiscal quarter, fiscal year and
+    currency; every bucket holds ``[services, reimbursements, invoices,
+    inr, unconverted]`` per currency, with amounts in integer minor units.
+    ``inr`` is the INR value of the totals at each invoice's date and
+    ``unconverted`` counts invoices with no rate for it. They live in
+    REPORT_FILE and are only rebuilt (one columnar pass) when that file is
+    missing, from an older format, out of step with the store or computed
+    with other rate files.
+    """
+
+    DIMENSIONS = ("client", "month", "quarter", "fiscal_year", "currency")
+    FORMAT = 3
+
+    def __init__(self, store, path=REPORT_FILE):
+        self.store = store
+        self.path = path
+        self.data = None
+        self.pending = None
+        self.rates = None
+        self._currencies = None
+        store.subscribe(self)
+
+    @staticmethod
+    def _empty():
+        return {
+            "format": RevenueReport.FORMAT,
+            "rates": RateTable.digest(RATES_DIR),
+            "invoices": 0,
+            "buckets": {d: {} for d in RevenueReport.DIMENSIONS},
+        }
+
+    def _keys(self, invoice):
+        date = invoice["date"]
+        currency = self.currency_of(invoice)
+        return (
+            str(invoice["client_id"]),
+            date[:7],
+            fiscal_quarter(date),
+            fiscal_year(date),
+            currency,
+        )
+
+    def currency_of(self, invoice):
+        """The invoice's currency, or its client's for invoices that predate the field."""
+        if invoice.get("currency"):
+            return invoice["currency"]
+        if self._currencies is None:
+            self._currencies = {c["id"]: c["currency"] for c in self.store.clients()}
+        return self._currencies.get(invoice["client_id"], "INR")
+
+    @staticmethod
+    def rate_table():
+        """The exchange rates in RATES_DIR, or an empty table if they cannot be read."""
+        try:
+            return RateTable.load(RATES_DIR)
+        except ValueError as e:
+            # A broken rate file must not block invoicing; report it unconverted
+            RetroUI.warn(f"Ignoring exchange rates in {RATES_DIR}/: {e}")
+            return RateTable({})
+
+    def _apply(self, target, invoice, sign):
+        totals = InvoiceTotals.of(invoice)
+        services = to_minor(totals.services_total)
+        reimbursements = to_minor(totals.reimbursements_total)
+        keys = self._keys(invoice)
+        currency = keys[-1]
+        try:
+            inr = self.rates.to_inr(currency, invoice["date"], services + reimbursements)
+            unconverted = 0
+        except RateError:
+            inr, unconverted = 0, 1
+        target["invoices"] += sign
+        for dim, key in zip(self.DIMENSIONS, keys):
+            cell = target["buckets"][dim].setdefault(key, {}).setdefault(
+                currency, [0, 0, 0, 0, 0]
+            )
+            cell[0] += sign * services
+            cell[1] += sign * reimbursements
+            cell[2] += sign
+            cell[3] += sign * inr
+            cell[4] += sign * unconverted
+
+    def _merge(self, delta):
+        self.data["invoices"] += delta["invoices"]
+        for dim, buckets in delta["buckets"].items():
+            mine = self.data["buckets"][dim]
+            for key, per_currency in buckets.items():
+                for currency, values in per_currency.items():
+                    cell = mine.setdefault(key, {}).setdefault(currency, [0, 0, 0, 0, 0])
+                    for i, value in enumerate(values):
+                        cell[i] += value
+                    if cell[2] == 0:
+                        del mine[key][currency]
+                        if not mine[key]:
+                            del mine[key]
+
+    def load(self):
+        if self.data is not None and not DataManager.changed(self.path):
+            return self.data
+        data = DataManager.load(self.path, {}, derived=True)
+        if (
+            data.get("format") != self.FORMAT
+            or data.get("invoices") != self.store.count_invoices()
+            or data.get("rates") != RateTable.digest(RATES_DIR)
+        ):
+            data = self.rebuild()
+        self.data = data
+        return data
+
+    def rebuild(self):
+        with DataManager.locked(), Metrics.phase("report.rebuild"):
+            columns = InvoiceColumns.from_invoices(
+                self.store.invoices(),
+                lambda inv: self._keys(inv) + (inv["date"],),
+                self.DIMENSIONS + ("date",),
+            )
+            # The whole history is converted in one pass over the columns
+            rates = self.rates if self.rates is not None else self.rate_table()
+            converted = rates.to_inr_column(
+                columns.keys["currency"], columns.keys["date"], columns.amounts()
+            )
+            data = self._empty()
+            data["invoices"] = len(columns)
+            for dim in self.DIMENSIONS:
+                buckets = data["buckets"][dim]
+                sums = columns.group_sums(dim, "currency", values=converted)
+                for (key, currency), cell in sums.items():
+                    buckets.setdefault(key, {})[currency] = cell
+            DataManager.save(self.path, data)
+        return data
+
+    # Store listener hooks
+
+    def before_write(self):
+        # One rate table serves the whole write, however many invoices it holds
+        self.rates = self.rate_table()
+        self.load()
+        self.pending = self._empty()
+
+    def invoice_added(self, invoice):
+        self._apply(self.pending, invoice, 1)
+
+    def invoice_deleted(self, invoice):
+        self._apply(self.pending, invoice, -1)
+
+    def client_added(self, client):
+        if self._currencies is not None:
+            self._currencies[client["id"]] = client["currency"]
+
+    def after_write(self):
+        if self.pending["invoices"] or any(self.pending["buckets"].values()):
+            self._merge(self.pending)
+            DataManager.save(self.path, self.data)
+        self.pending = None
+        self.rates = None
+
+    # Queries
+
+    def rows(self, dimension):
+        """Yield report rows for one dimension, sorted by key then currency."""
+        buckets = self.load()["buckets"][dimension]
+        names = {}
+        if dimension == "client":
+            names = {str(c["id"]): c["name"] for c in self.store.clients()}
+        for key in sorted(buckets):
+            for currency in sorted(buckets[key]):
+                services, reimbursements, count, inr, unconverted = buckets[key][currency]
+                yield {
+                    dimension: names.get(key, key),
+                    "currency": currency,
+                    "invoices": count,
+                    "services": float(from_minor(services)),
+                    "reimbursements": float(from_minor(reimbursements)),
+                    "total": float(from_minor(services + reimbursements)),
+                    "inr": float(from_minor(inr)),
+                    "unconverted": unconverted,
+                }
+
+
+# --- SEARCH ---
+
+
+class SearchIndex:
+    """Inverted index over clients and invoices for the ``search`` command.
+
+    Postings map each token to ``{doc: term frequency}``, where documents are
+    ``inv:<id>`` (id, client, line item descriptions) and ``client:<id>``
+    (name, address, country, GSTIN/VAT ID). The index is a snapshot in
+    SEARCH_INDEX_FILE plus a journal of per-document changes fed by store
+    events, so a mutation costs one appended line. Queries match tokens
+    exactly, by prefix, and (when nothing else matches) within a small edit
+    distance, ranked by tf-idf.
+    """
+
+    FORMAT = 1
+    TOKEN_RE = re.compile(r"[a-z0-9]+")
+    PREFIX_WEIGHT = 0.7
+    FUZZY_WEIGHT = 0.4
+
+    def __init__(self, store, path=SEARCH_INDEX_FILE):
+        self.store = store
+        self.path = path
+        self.data = None
+        self.vocab = None
+        self.pending = None
+        store.subscribe(self)
+
+    @staticmethod
+    def tokens(text):
+        return SearchIndex.TOKEN_RE.findall(str(text).lower())
+
+    @staticmethod
+    def invoice_terms(invoice):
+        parts = [invoice["id"], invoice.get("client_name", ""), invoice.get("date", "")]
+        for item in invoice.get("services", []) + invoice.get("reimbursements", []):
+            parts.append(item.get("desc", ""))
+        return SearchIndex._count(parts)
+
+    @staticmethod
+    def client_terms(client):
+        fields = ("name", "address", "country", "gst_id", "vat_id", "currency")
+        return SearchIndex._count(client.get(f, "") for f in fields)
+
+    @staticmethod
+    def _count(parts):
+        terms = {}
+        for part in parts:
+            for token in SearchIndex.tokens(part):
+                terms[token] = terms.get(token, 0) + 1
+        return terms
+
+    # Index maintenance
+
+    @staticmethod
+    def _empty():
+        return {
+            "format": SearchIndex.FORMAT,
+            "counts": {"inv": 0, "client": 0},
+            "docs": {},
+            "postings": {},
+        }
+
+    @staticmethod
+    def _apply(data, entry):
+        docs, postings = data["docs"], data["postings"]
+        doc = entry["doc"]
+        # Counted per event rather than per doc so the consistency check in
+        # load() still holds if a store contains duplicate ids.
+        op = entry["op"]
+        if op != "put":
+            data["counts"][doc.partition(":")[0]] += 1 if op == "add" else -1
+        for token in docs.pop(doc, ()):
+            refs = postings.get(token)
+            if refs is not None:
+                refs.pop(doc, None)
+                if not refs:
+                    del postings[token]
+        if op != "del":
+            docs[doc] = list(entry["terms"])
+            for token, tf in entry["terms"].items():
+                postings.setdefault(token, {})[doc] = tf
+
+    @staticmethod
+    def _replay(data, entries):
+        if data.get("format") != SearchIndex.FORMAT:
+            return data  # load() rebuilds it anyway
+        for entry in entries:
+            SearchIndex._apply(data, entry)
+        return data
+
+    def load(self):
+        if self.data is not None and not DataManager.changed(self.path):
+            return self.data
+        data = DataManager.refresh(
+            self.path, self.data, {}, replay=SearchIndex._replay, derived=True
+        )
+        if data.get("format") != self.FORMAT or data["counts"] != {
+            "inv": self.store.count_invoices(),
+            "client": self.store.count_clients(),
+        }:
+            data = self.rebuild()
+        self.data = data
+        self.vocab = sorted(data["postings"])
+        return data
+
+    def rebuild(self):
+        data = self._empty()
+        with DataManager.locked(), Metrics.phase("search.rebuild"):
+            for client in self.store.clients():
+                self._apply(
+                    data,
+                    {"op": "add", "doc": f"client:{client['id']}", "terms": self.client_terms(client)},
+                )
+            for invoice in self.store.invoices():
+                self._apply(
+                    data,
+                    {"op": "add", "doc": f"inv:{invoice['id']}", "terms": self.invoice_terms(invoice)},
+                )
+            DataManager.compact(self.path, data)
+        return data
+
+    # Store listener hooks
+
+    def before_write(self):
+        self.load()
+        self.pending = []
+
+    def invoice_added(self, invoice):
+        self.pending.append(
+            {"op": "add", "doc": f"inv:{invoice['id']}", "terms": self.invoice_terms(invoice)}
+        )
+
+    def invoice_deleted(self, invoice):
+        self.pending.append({"op": "del", "doc": f"inv:{invoice['id']}"})
+
+    def client_added(self, client):
+        self.pending.append(
+            {"op": "add", "doc": f"client:{client['id']}", "terms": self.client_terms(client)}
+        )
+
+    def client_updated(self, client):
+        self.pending.append(
+            {"op": "put", "doc": f"client:{client['id']}", "terms": self.client_terms(client)}
+        )
+
+    def client_deleted(self, client):
+        self.pending.append({"op": "del", "doc": f"client:{client['id']}"})
+
+    def after_write(self):
+        postings = self.data["postings"]
+        for entry in self.pending:
+            self._apply(self.data, entry)
+            for token in entry.get("terms", ()):
+                pos = bisect.bisect_left(self.vocab, token)
+                if pos == len(self.vocab) or self.vocab[pos] != token:
+                    self.vocab.insert(pos, token)
+        if self.pending:
+            if len(self.vocab) > 2 * len(postings):
+                # Deletes leave tokens without postings behind; prune now and then
+                self.vocab = [t for t in self.vocab if t in postings]
+            DataManager.log(self.path, self.data, *self.pending)
+        self.pending = None
+
+    # Queries
+
+    def _candidates(self, token):
+        """Yield (term, weight) for exact, prefix and fuzzy matches of ``token``."""
+        postings = self.data["postings"]
+        found = False
+        if token in postings:
+            found = True
+            yield token, 1.0
+        pos = bisect.bisect_left(self.vocab, token)
+        while pos < len(self.vocab) and self.vocab[pos].startswith(token):
+            term = self.vocab[pos]
+            if term != token and term in postings:
+                found = True
+                yield term, self.PREFIX_WEIGHT
+            pos += 1
+        if found or len(token) < 4:
+            return
+        max_edits = 1 if len(token) < 8 else 2
+        for term in self.vocab:
+            if (
+                term[0] == token[0]
+                and abs(len(term) - len(token)) <= max_edits
+                and term in postings
+                and edit_distance(token, term, max_edits) <= max_edits
+            ):
+                yield term, self.FUZZY_WEIGHT
+
+    def search(self, query, limit=20):
+        """Return ``[(doc, score)]``, best first; docs matching more query terms win."""
+        data = self.load()
+        n_docs = max(len(data["docs"]), 1)
+        scores = {}
+        matched = {}
+        for token in set(self.tokens(query)):
+            best = {}
+            for term, weight in self._candidates(token):
+                refs = data["postings"][term]
+                idf = math.log(1 + n_docs / len(refs))
+                for doc, tf in refs.items():
+                    score = weight * (1 + math.log(tf)) * idf
+                    if score > best.get(doc, 0):
+                        best[doc] = score
+            for doc, score in best.items():
+                scores[doc] = scores.get(doc, 0) + score
+                matched[doc] = matched.get(doc, 0) + 1
+        return heapq.nlargest(
+            limit, scores.items(), key=lambda kv: (matched[kv[0]], kv[1])
+        )
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance of ``a`` and ``b``, or ``limit + 1`` once it exceeds ``limit``."""
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(
+                min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            )
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+# --- BULK IMPORT ---
+
+
+class BulkImporter:
+    """Streams CSV/JSONL rows into clients or invoices for one batched write.
+
+    Rows flow through generators and are grouped into invoices on the fly,
+    so only the invoice being assembled is held in memory. Invoice rows
+    carry ``client`` (id or exact name), ``date``, ``desc``, ``rate``,
+    ``qty`` and optionally ``type`` (service/reimbursement) and ``invoice``
+    (a grouping key), and on service lines ``sac`` and ``gst_rate``. Rows
+    of one invoice must be contiguous.
+    """
+
+    def __init__(self, store, ids):
+        self.store = store
+        self.ids = ids
+        self.created = []
+
+    @staticmethod
+    def read_rows(path):
+        with open(path, "r", newline="") as f:
+            if path.lower().endswith(".csv"):
+                for lineno, row in enumerate(csv.DictReader(f), 2):
+                    yield lineno, row
+            else:
+                for lineno, line in enumerate(f, 1):
+                    if line.strip():
+                        try:
+                            yield lineno, json.loads(line)
+                        except ValueError as e:
+                            raise ValueError(f"line {lineno}: {e}")
+
+    def invoices(self, rows):
+        by_id = {}
+        by_name = {}
+        for c in self.store.clients():
+            by_id.setdefault(str(c["id"]), c)
+            by_name.setdefault(c["name"].lower(), c)
+
+        def group_key(item):
+            _, row = item
+            return (row.get("invoice") or "", str(row.get("client", "")), row.get("date") or "")
+
+        for (_, client_ref, date), group in groupby(rows, group_key):
+            client = by_id.get(client_ref) or by_name.get(client_ref.lower())
+            services, reimbursements = [], []
+            for lineno, row in group:
+                if not client:
+                    raise ValueError(f"line {lineno}: unknown client '{client_ref}'")
+                is_reimbursement, item = self._line_item(lineno, row)
+                (reimbursements if is_reimbursement else services).append(item)
+            try:
+                invoice = RetroShell._new_invoice(
+                    client, services, reimbursements, date or None, self.ids.config
+                )
+            except ValueError as e:
+                raise ValueError(f"line {lineno}: {e}")
+            invoice["id"] = self.ids.next_invoice_id(invoice["date"])
+            self.created.append(invoice["id"])
+            yield invoice
+
+    @staticmethod
+    def _line_item(lineno, row):
+        try:
+            desc = row["desc"]
+            if (row.get("type") or "service").lower().startswith("reimb"):
+                amount = row.get("amount") or row.get("rate")
+                return True, {"desc": desc, "rate": float(amount), "qty": 1.0}
+            item = {"desc": desc, "rate": float(row["rate"]), "qty": float(row.get("qty") or 1)}
+            # Optional per-line HSN/SAC code and GST rate
+            for key in ("sac", "gst_rate"):
+                if row.get(key):
+                    item[key] = row[key]
+            return False, item
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"line {lineno}: malformed line item ({e})")
+
+    def clients(self, rows):
+        for lineno, row in rows:
+            client_type = (row.get("type") or "").title()
+            if not row.get("name") or client_type not in ("Indian", "Foreign"):
+                raise ValueError(f"line {lineno}: needs a name and type Indian/Foreign")
+            client = {
+                "id": self.ids.next_client_id(),
+                "name": row["name"],
+                "address": row.get("address", ""),
+                "type": client_type,
+            }
+            if client_type == "Indian":
+                client.update(gst_id=row.get("gst_id", ""), currency="INR", country="India")
+                if row.get("state_code"):
+                    client["state_code"] = str(row["state_code"]).zfill(2)
+            else:
+                currency = (row.get("currency") or "").upper()
+                if currency not in FOREIGN_CURRENCIES:
+                    raise ValueError(f"line {lineno}: unsupported currency '{currency}'")
+                client.update(
+                    country=row.get("country", ""),
+                    vat_id=row.get("vat_id", ""),
+                    currency=currency,
+                )
+            self.created.append(client["id"])
+            yield client
+
+
+# --- RECURRING BILLING ---
+
+
+def add_months(day, months):
+    """``day`` moved by whole months, clamped to the end of shorter months."""
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return date(year, month, min(day.day, last.day))
+
+
+class RecurringBilling:
+    """Recurring invoice definitions ("plans") and the billing runs that issue them.
+
+    Plans live in RECURRING_FILE (a journaled record list): a client, a
+    line-item template, a cadence from CADENCES and start/end dates. Each
+    billing date is counted from the start date, so monthly plans starting
+    on the 31st bill on the last day of shorter months. ``{period}`` and
+    ``{month}`` in descriptions become the billing date and its month.
+
+    ``run`` issues every invoice due since a plan's ``billed_through`` date
+    in one batched store write with consecutive numbers, then advances
+    ``billed_through``. Invoices are tagged ``recurring: "<plan>/<date>"``
+    and tagged dates are skipped, so a run interrupted between the two
+    writes does not bill anything twice when repeated.
+    """
+
+    def __init__(self, path=RECURRING_FILE):
+        self.path = path
+        self.plans = None
+
+    def load(self):
+        self.plans = DataManager.refresh(self.path, self.plans)
+        return self.plans
+
+    def get(self, plan_id):
+        return next((p for p in self.load() if p["id"] == plan_id), None)
+
+    def add(self, plan, ids):
+        """Store a new plan, numbered by the IdAllocator ``ids``; returns its id."""
+        if plan["cadence"] not in CADENCES:
+            raise ValueError(f"cadence must be one of {', '.join(CADENCES)}")
+        for key in ("start", "end"):
+            if plan.get(key):
+                date.fromisoformat(plan[key])
+        if plan.get("end") and plan["end"] < plan["start"]:
+            raise ValueError("end date is before the start date")
+        with ids.batch():
+            self.load()
+            plan = dict(plan, id=ids.next_plan_id(self.plans))
+            self.plans.append(plan)
+            DataManager.add(self.path, self.plans, plan)
+        return plan["id"]
+
+    def delete(self, plan_id):
+        """Stop a plan; invoices it already issued are kept. Returns False if unknown."""
+        with DataManager.locked():
+            if self.get(plan_id) is None:
+                return False
+            self.plans = [p for p in self.plans if p["id"] != plan_id]
+            DataManager.delete(self.path, self.plans, plan_id)
+        return True
+
+    @staticmethod
+    def billing_dates(plan, through):
+        """ISO dates the plan bills on after ``billed_through``, up to ``through``."""
+        start = date.fromisoformat(plan["start"])
+        months, days = CADENCES[plan["cadence"]]
+        last = min(through, plan.get("end") or through)
+        after = plan.get("billed_through") or ""
+        for n in count():
+            if months:
+                on = add_months(start, months * n).isoformat()
+            else:
+                on = (start + timedelta(days=days * n)).isoformat()
+            if on > last:
+                return
+            if on > after:
+                yield on
+
+    @staticmethod
+    def next_date(plan):
+        """The next date the plan bills on, or None once it has ended."""
+        return next(RecurringBilling.billing_dates(plan, "9999-12-31"), None)
+
+    @staticmethod
+    def items(template, on):
+        month = date.fromisoformat(on).strftime("%B %Y")
+        return [
+            dict(item, desc=item["desc"].replace("{period}", on).replace("{month}", month))
+            for item in template
+        ]
+
+    def due(self, store, through):
+        """(plan, client, date) of every invoice not yet issued up to ``through``.
+
+        Plans whose client was deleted or archived are returned with client None.
+        """
+        due = [
+            (plan, on) for plan in self.load() for on in self.billing_dates(plan, through)
+        ]
+        if not due:
+            return []
+        clients = {c["id"]: c for c in store.clients() if not c.get("archived")}
+        earliest = min(on for _, on in due)
+        issued = {
+            i["recurring"] for i in store.invoices(date_from=earliest) if i.get("recurring")
+        }
+        due.sort(key=lambda d: (d[1], d[0]["id"]))
+        return [
+            (plan, clients.get(plan["client_id"]), on)
+            for plan, on in due
+            if f"{plan['id']}/{on}" not in issued
+        ]
+
+    def run(self, store, ids, through):
+        """Issue everything due up to ``through``; returns (new invoices, skipped plans).
+
+        The invoices are numbered in date order and saved with one store
+        write, all under the data lock, so their numbers are consecutive.
+        """
+        invoices, skipped = [], []
+        with DataManager.locked():
+            due = self.due(store, through)
+            for plan, client, on in due:
+                if client is None:
+                    skipped.append(plan)
+                    continue
+                invoice = RetroShell._new_invoice(
+                    client,
+                    self.items(plan["services"], on),
+                    self.items(plan["reimbursements"], on),
+                    on,
+                    ids.config,
+                )
+                invoice["recurring"] = f"{plan['id']}/{on}"
+                invoices.append(invoice)
+            with ids.batch():
+                for invoice in invoices:
+                    invoice["id"] = ids.next_invoice_id(invoice["date"])
+                if invoices:
+                    store.add_invoices(invoices)
+            # Plans of deleted or archived clients stay due, in case the client comes back
+            blocked = {p["id"] for p in skipped}
+            changed = []
+            for pos, plan in enumerate(self.plans):
+                if plan["id"] not in blocked and (plan.get("billed_through") or "") < through:
+                    self.plans[pos] = dict(plan, billed_through=through)
+                    changed.append(self.plans[pos])
+            if changed:
+                DataManager.put_many(self.path, self.plans, changed)
+        return invoices, list({p["id"]: p for p in skipped}.values())
+
+
+# --- RECEIVABLES ---
+
+
+class Receivables:
+    """Payments ledger and the balances still outstanding on invoices.
+
+    Payments and credit notes live in PAYMENTS_FILE (a journaled record
+    list), each against one invoice and in its currency. Balances live in
+    RECEIVABLES_FILE, kept up to date from store events and recorded
+    payments the way the search index is: a snapshot plus a journal of
+    ``add``/``del``/``pay`` entries. ``paid`` holds the minor units paid
+    against each invoice and ``open`` maps every invoice with something left
+    to pay to ``[client id, currency, date, total]``, so the outstanding and
+    aging views only ever read the open invoices. The file is rebuilt in one
+    pass when it is missing or out of step with the store or the ledger.
+    """
+
+    FORMAT = 1
+    KINDS = ("payment", "credit")
+
+    def __init__(self, store, reports, path=RECEIVABLES_FILE, ledger=PAYMENTS_FILE):
+        self.store = store
+        self.reports = reports
+        self.path = path
+        self.ledger = ledger
+        self.data = None
+        self.payments = None
+        self.pending = None
+        store.subscribe(self)
+
+    @staticmethod
+    def _empty():
+        return {"format": Receivables.FORMAT, "invoices": 0, "payments": 0, "paid": {}, "open": {}}
+
+    @staticmethod
+    def _apply(data, entry):
+        inv_id, op = entry["id"], entry["op"]
+        paid = data["paid"]
+        if op == "pay":
+            data["payments"] += 1
+            paid[inv_id] = paid.get(inv_id, 0) + entry["amount"]
+            invoice = data["open"].get(inv_id)
+            if invoice and invoice[3] <= paid[inv_id]:
+                del data["open"][inv_id]
+        elif op == "add":
+            data["invoices"] += 1
+            if entry["open"][3] > paid.get(inv_id, 0):
+                data["open"][inv_id] = entry["open"]
+        else:
+            data["invoices"] -= 1
+            data["open"].pop(inv_id, None)
+
+    @staticmethod
+    def _replay(data, entries):
+        if data.get("format") != Receivables.FORMAT:
+            return data  # load() rebuilds it anyway
+        for entry in entries:
+            Receivables._apply(data, entry)
+        return data
+
+    def _added(self, invoice):
+        return {
+            "op": "add",
+            "id": invoice["id"],
+            "open": [
+                invoice["client_id"],
+                self.reports.currency_of(invoice),
+                invoice["date"],
+                to_minor(invoice["total"]),
+            ],
+        }
+
+    def load_payments(self):
+        self.payments = DataManager.refresh(self.ledger, self.payments)
+        return self.payments
+
+    def load(self):
+        if self.data is not None and not DataManager.changed(self.path):
+            return self.data
+        data = DataManager.refresh(
+            self.path, self.data, {}, replay=Receivables._replay, derived=True
+        )
+        if (
+            data.get("format") != self.FORMAT
+            or data["invoices"] != self.store.count_invoices()
+            or data["payments"] != len(self.load_payments())
+        ):
+            data = self.rebuild()
+        self.data = data
+        return data
+
+    def rebuild(self):
+        data = self._empty()
+        with DataManager.locked(), Metrics.phase("receivables.rebuild"):
+            for payment in self.load_payments():
+                amount = to_minor(payment["amount"])
+                self._apply(data, {"op": "pay", "id": payment["invoice_id"], "amount": amount})
+            for invoice in self.store.invoices():
+                self._apply(data, self._added(invoice))
+            DataManager.compact(self.path, data)
+        return data
+
+    def record(self, invoice_id, amount, on, ids, kind="payment", note=""):
+        """Record a payment or credit note; returns it and the balance left (minor units).
+
+        Raises ValueError for an unknown or settled invoice, or an amount that
+        is not positive or more than the balance.
+        """
+        if kind not in self.KINDS:
+            raise ValueError(f"kind must be one of {', '.join(self.KINDS)}")
+        date.fromisoformat(on)
+        minor = to_minor(amount)
+        if minor <= 0:
+            raise ValueError("The amount must be positive.")
+        with ids.batch():
+            data = self.load()
+            invoice = data["open"].get(invoice_id)
+            if invoice is None:
+                if self.store.get_invoice(invoice_id) is None:
+                    raise ValueError(f"Invoice {invoice_id} not found.")
+                raise ValueError(f"Invoice {invoice_id} is already paid in full.")
+            currency, balance = invoice[1], invoice[3] - data["paid"].get(invoice_id, 0)
+            if minor > balance:
+                raise ValueError(
+                    f"Only {currency} {from_minor(balance)} is outstanding on {invoice_id}."
+                )
+            payments = self.load_payments()
+            payment = {
+                "id": ids.next_payment_id(payments),
+                "invoice_id": invoice_id,
+                "kind": kind,
+                "date": on,
+                "currency": currency,
+                "amount": float(from_minor(minor)),
+                "note": note,
+                "version": 1,
+            }
+            payments.append(payment)
+            DataManager.add(self.ledger, payments, payment)
+            entry = {"op": "pay", "id": invoice_id, "amount": minor}
+            self._apply(data, entry)
+            DataManager.log(self.path, data, entry)
+        return payment, balance - minor
+
+    # Store listener hooks
+
+    def before_write(self):
+        self.load()
+        self.pending = []
+
+    def invoice_added(self, invoice):
+        self.pending.append(self._added(invoice))
+
+    def invoice_deleted(self, invoice):
+        self.pending.append({"op": "del", "id": invoice["id"]})
+
+    def after_write(self):
+        for entry in self.pending:
+            self._apply(self.data, entry)
+        if self.pending:
+            DataManager.log(self.path, self.data, *self.pending)
+        self.pending = None
+
+    # Queries
+
+    def outstanding(self, client=None, today=None):
+        """Open invoices, oldest first, optionally of clients whose name contains ``client``."""
+        data = self.load()
+        clients = {c["id"]: c["name"] for c in self.store.clients()}
+        if client:
+            client = client.lower()
+            clients = {c_id: n for c_id, n in clients.items() if client in n.lower()}
+        today = (today or date.today()).toordinal()
+        rows = []
+        for inv_id, (c_id, currency, on, total) in data["open"].items():
+            if client and c_id not in clients:
+                continue
+            paid = data["paid"].get(inv_id, 0)
+            rows.append(
+                {
+                    "invoice": inv_id,
+                    "date": on,
+                    "client": clients.get(c_id, f"#{c_id}"),
+                    "currency": currency,
+                    "total": float(from_minor(total)),
+                    "paid": float(from_minor(paid)),
+                    "balance": float(from_minor(total - paid)),
+                    "days": today - date.fromisoformat(on).toordinal(),
+                }
+            )
+        rows.sort(key=lambda r: (r["date"], r["invoice"]))
+        return rows
+
+    def balance(self, invoice_id):
+        """(currency, total, paid) of an invoice in minor units, or None if unknown."""
+        data = self.load()
+        if invoice_id in data["open"]:
+            _, currency, _, total = data["open"][invoice_id]
+            return currency, total, data["paid"].get(invoice_id, 0)
+        invoice = self.store.get_invoice(invoice_id)
+        if invoice is None:
+            return None
+        added = self._added(invoice)["open"]
+        return added[1], added[3], data["paid"].get(invoice_id, 0)
+
+    @staticmethod
+    def bucket_names():
+        bounds = [0, *(b + 1 for b in AGING_BUCKETS)]
+        names = [f"{lo}-{hi}" for lo, hi in zip(bounds, AGING_BUCKETS)]
+        return names + [f"{AGING_BUCKETS[-1]}+"]
+
+    def aging(self, today=None):
+        """Outstanding balances per currency, split into AGING_BUCKETS by age."""
+        data = self.load()
+        today = (today or date.today()).toordinal()
+        names = self.bucket_names()
+        by_currency, buckets = {}, {}
+        for inv_id, (_, currency, on, total) in data["open"].items():
+            cell = by_currency.setdefault(currency, [0] * (len(names) + 1))
+            bucket = buckets.get(on)
+            if bucket is None:
+                age = today - date.fromisoformat(on).toordinal()
+                bucket = buckets[on] = bisect.bisect_left(AGING_BUCKETS, age)
+            cell[bucket] += total - data["paid"].get(inv_id, 0)
+            cell[-1] += 1
+        rows = []
+        for currency in sorted(by_currency):
+            cell = by_currency[currency]
+            row = {"currency": currency, "invoices": cell[-1]}
+            row.update((name, float(from_minor(v))) for name, v in zip(names, cell))
+            row["total"] = float(from_minor(sum(cell[:-1])))
+            rows.append(row)
+        return rows
+
+
+# --- RENDER QUEUE ---
+
+
+class RenderQueue:
+    """Persistent queue of PDF renders, worked off by background processes.
+
+    Jobs live in RENDER_QUEUE (a journaled record list, one job per invoice
+    id) so they survive the shell exiting. ``submit`` starts detached
+    ``render-worker`` processes, at most one per CPU: each holds one of the
+    RENDER_WORKER_LOCK slots, with its pid written in it while it works, and
+    exits when no work is left. A failed render
+    is retried RENDER_MAX_ATTEMPTS times with a growing delay and then kept
+    as ``failed`` until ``retry``.
+    """
+
+    _spawned = []
+
+    def __init__(self, path=RENDER_QUEUE):
+        self.path = path
+        self.jobs = None
+
+    def load(self):
+        self.jobs = DataManager.refresh(self.path, self.jobs)
+        return self.jobs
+
+    def _find(self, inv_id):
+        return next((j for j in self.jobs if j["id"] == inv_id), None)
+
+    def _put(self, job):
+        pos = next(i for i, j in enumerate(self.jobs) if j["id"] == job["id"])
+        self.jobs[pos] = job
+        DataManager.put(self.path, self.jobs, job)
+
+    def _delete(self, job):
+        self.jobs = [j for j in self.jobs if j["id"] != job["id"]]
+        DataManager.delete(self.path, self.jobs, job["id"])
+
+    def submit(self, invoice_ids, force=False):
+        """Queue renders of ``invoice_ids`` and start workers; returns how many were queued."""
+        now = time.time()
+        queued = []
+        with DataManager.locked():
+            self.load()
+            for inv_id in invoice_ids:
+                job = self._find(inv_id)
+                if job is None:
+                    queued.append(
+                        {
+                            "id": inv_id,
+                            "status": "pending",
+                            "force": force,
+                            "attempts": 0,
+                            "submitted": now,
+                        }
+                    )
+                elif job["status"] == "running":
+                    # The invoice may have changed since the render started
+                    self._put(dict(job, again=True, force=job["force"] or force))
+                else:
+                    job = dict(job, status="pending", attempts=0, retry_at=0, error=None)
+                    self._put(dict(job, force=job["force"] or force))
+            if queued:
+                self.jobs.extend(queued)
+                DataManager.add_many(self.path, self.jobs, queued)
+        RenderQueue.start_workers(len(invoice_ids))
+        return len(invoice_ids)
+
+    def retry(self):
+        """Queue failed and stalled jobs again; returns how many."""
+        with DataManager.locked():
+            self.load()
+            jobs = [j for j in self.jobs if self.state(j) in ("failed", "stalled")]
+            for job in jobs:
+                self._put(dict(job, status="pending", attempts=0, retry_at=0, error=None))
+        RenderQueue.start_workers(len(jobs))
+        return len(jobs)
+
+    def clear_failed(self):
+        with DataManager.locked():
+            self.load()
+            jobs = [j for j in self.jobs if j["status"] == "failed"]
+            for job in jobs:
+                self._delete(job)
+        return len(jobs)
+
+    @staticmethod
+    def state(job):
+        """The job's status, or ``stalled`` for a running job whose worker died."""
+        if job["status"] == "running" and not RenderQueue._alive(job.get("pid")):
+            return "stalled"
+        return job["status"]
+
+    @staticmethod
+    def _alive(pid):
+        if os.name == "nt":  # os.kill(pid, 0) would terminate it
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except (OSError, TypeError):
+            return True
+        return True
+
+    @staticmethod
+    def workers():
+        """Pids of the live workers holding a slot."""
+        pids = set()
+        for n in range(os.cpu_count() or 1):
+            try:
+                with open(RENDER_WORKER_LOCK.format(slot=n)) as f:
+                    pid = f.read().strip()
+            except FileNotFoundError:
+                continue
+            if pid and RenderQueue._alive(int(pid)):
+                pids.add(int(pid))
+        return pids
+
+    @staticmethod
+    def start_workers(jobs):
+        """Start workers for ``jobs`` newly queued jobs, up to one per CPU.
+
+        Workers clear their slot under the data lock before stepping down and
+        a starting worker looks at the queue once it has a slot, so both see
+        a job queued before this check; only the remaining CPUs get a new one.
+        """
+        import subprocess
+
+        running = RenderQueue.workers()
+        # poll() also reaps the children that have exited
+        RenderQueue._spawned = [p for p in RenderQueue._spawned if p.poll() is None]
+        starting = [p for p in RenderQueue._spawned if p.pid not in running]
+        spawn = min(jobs, os.cpu_count() or 1) - len(running) - len(starting)
+        for _ in range(spawn):
+            worker = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "render-worker"],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+            RenderQueue._spawned.append(worker)
+
+    def claim(self, on_idle):
+        """Take the next due job: returns ``(job, None)``, ``(None, seconds)``
+        until a retry is due, or ``(None, None)`` once the queue is drained,
+        after calling ``on_idle`` under the data lock so that no job can be
+        submitted between the check and the worker stepping down.
+        """
+        with DataManager.locked():
+            self.load()
+            now = time.time()
+            for job in self.jobs:
+                if self.state(job) == "stalled":
+                    self._put(dict(job, status="pending"))
+            pending = [j for j in self.jobs if j["status"] == "pending"]
+            due = [j for j in pending if j.get("retry_at", 0) <= now]
+            if due:
+                job = dict(min(due, key=lambda j: j["submitted"]), status="running")
+                job.update(pid=os.getpid(), started=now, again=False)
+                self._put(job)
+                return job, None
+            if pending:
+                return None, min(j["retry_at"] for j in pending) - now
+            on_idle()
+            return None, None
+
+    def finish(self, job, error=None):
+        with DataManager.locked():
+            self.load()
+            current = self._find(job["id"])
+            if current is None:
+                return
+            if current.get("again"):
+                self._put(dict(current, status="pending", attempts=0, again=False))
+            elif error is None:
+                self._delete(current)
+            else:
+                attempts = current["attempts"] + 1
+                job = dict(current, attempts=attempts, error=error)
+                if attempts < RENDER_MAX_ATTEMPTS:
+                    delay = RENDER_RETRY_DELAY * 2 ** (attempts - 1)
+                    job.update(status="pending", retry_at=time.time() + delay)
+                else:
+                    job["status"] = "failed"
+                self._put(job)
+
+
+def run_render_worker(store, config):
+    """Work off the render queue until it is empty; one worker per lock slot."""
+    slot = None
+    for n in range(os.cpu_count() or 1):
+        f = open(RENDER_WORKER_LOCK.format(slot=n), "a")
+        if not fcntl:
+            slot = f
+            break
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            continue
+        slot = f
+        break
+    if slot is None:
+        return  # enough workers are running already
+    slot.truncate(0)
+    slot.write(str(os.getpid()))
+    slot.flush()
+    if hasattr(os, "nice"):
+        os.nice(10)  # yield the CPU to the interactive shell
+
+    def step_down():
+        slot.truncate(0)
+        slot.close()
+
+    queue = RenderQueue()
+    cache = RenderCache()
+    while True:
+        job, wait = queue.claim(on_idle=step_down)
+        if job is None:
+            if wait is None:
+                return
+            time.sleep(min(wait, 1.0))
+            continue
+        error = None
+        try:
+            inv = store.get_invoice(job["id"])
+            # A deleted invoice needs no PDF any more
+            client = store.get_client(inv["client_id"]) if inv else None
+            if inv and not client:
+                raise LookupError("client no longer exists")
+            if inv:
+                cache.render(client, inv, config, job["force"])
+            cache.save()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        queue.finish(job, error)
+
+
+# --- COMMAND PROCESSOR ---
+
+
+class RetroShell:
+    def __init__(self):
+        self.store = open_store()
+        self.reports = RevenueReport(self.store)
+        self.receivables = Receivables(self.store, self.reports)
+        self.search_index = SearchIndex(self.store)
+        self.config = {**DEFAULT_CONFIG, **DataManager.load(DATA_FILE_CONFIG, {})}
+        self.ids = IdAllocator(self.store, self.config)
+        self.render_queue = RenderQueue()
+        self.billing = RecurringBilling()
+        self._failed_renders = None
+        if not os.path.exists(INVOICE_DIR):
+            os.makedirs(INVOICE_DIR)
+
+    # --- CLIENT COMMANDS ---
+
+    def do_add_client(self):
+        from rich.prompt import IntPrompt, Prompt
+
+        console.print("[bold green]>> ADD NEW CLIENT <<[/bold green]")
+        name = Prompt.ask("[green]Company Name[/green]")
+        address = Prompt.ask("[green]Address[/green]")
+
+        console.print("1. Indian (Domestic)\n2. Foreign (International)")
+        choice = IntPrompt.ask("[green]Select Type[/green]", choices=["1", "2"])
+        client_type = "Indian" if choice == 1 else "Foreign"
+
+        extra_data = {}
+        if client_type == "Indian":
+            extra_data["gst_id"] = Prompt.ask("[green]GSTIN/PAN[/green]")
+            home = state_of(self.config.get("gstin"))
+            if home and not state_of(extra_data["gst_id"]):
+                # Unregistered: GST follows the state the client is in
+                while True:
+                    code = Prompt.ask("[green]State code[/green]", default=home).zfill(2)
+                    if code in STATES and code != EXPORT_PLACE:
+                        break
+                    RetroUI.error("Not a GST state code (e.g. 29 for Karnataka).")
+                extra_data["state_code"] = code
+            extra_data["currency"] = "INR"
+            extra_data["country"] = "India"
+        else:
+            extra_data["country"] = Prompt.ask("[green]Country[/green]")
+            extra_data["vat_id"] = Prompt.ask("[green]VAT ID[/green]")
+            currencies = FOREIGN_CURRENCIES
+            for idx, c in enumerate(currencies, 1):
+                console.print(f"{idx}. {c}")
+            c_choice = IntPrompt.ask(
+                "[green]Currency[/green]",
+                choices=[str(i) for i in range(1, len(currencies) + 1)],
+            )
+            extra_data["currency"] = currencies[c_choice - 1]
+
+        client = {
+            "id": None,
+            "name": name,
+            "address": address,
+            "type": client_type,
+            **extra_data,
+        }
+        with self.ids.batch():
+            client["id"] = self.ids.next_client_id()
+            self.store.add_client(client)
+        RetroUI.success(f"Client '{name}' added.")
+
+    def do_list_clients(self, args=()):
+        opts = self._list_options(args, CLIENT_SORT_KEYS)
+        if opts is None:
+            return
+        clients = paginate(
+            self.store.clients(),
+            CLIENT_SORT_KEYS.get(opts["sort"]),
+            opts["desc"],
+            opts["limit"],
+            opts["offset"],
+        )
+        rows = (
+            (
+                str(c["id"]),
+                f"{c['name']} [dim](archived)[/]" if c.get("archived") else c["name"],
+                c["type"],
+                c["currency"],
+            )
+            for c in clients
+        )
+        self._print_paged(
+            "CLIENT DATABASE",
+            [
+                ("ID", {"justify": "right", "style": "cyan", "width": 12}),
+                ("Name", {"style": "green", "width": 32}),
+                ("Type", {"style": "magenta", "width": 8}),
+                ("Currency", {"style": "yellow", "width": 8}),
+            ],
+            rows,
+            opts["pager"],
+        )
+
+    def do_update_client(self):
+        from rich.prompt import Confirm, IntPrompt, Prompt
+
+        self.do_list_clients()
+        c_id = IntPrompt.ask("[green]Enter Client ID to update[/green]")
+        base = self.store.get_client(c_id)
+        if not base:
+            RetroUI.error("Client not found.")
+            return
+        client = dict(base)
+
+        console.print(f"Updating: [bold]{client['name']}[/bold]")
+        if Confirm.ask("Update Name?"):
+            client["name"] = Prompt.ask("New Name", default=client["name"])
+        if Confirm.ask("Update Address?"):
+            client["address"] = Prompt.ask("New Address", default=client["address"])
+
+        # Specific fields
+        if client["type"] == "Foreign":
+            if Confirm.ask("Update VAT ID?"):
+                client["vat_id"] = Prompt.ask(
+                    "New VAT ID", default=client.get("vat_id", "")
+                )
+        else:
+            if Confirm.ask("Update GSTIN?"):
+                client["gst_id"] = Prompt.ask(
+                    "New GSTIN", default=client.get("gst_id", "")
+                )
+
+        try:
+            self.store.update_client(client, base)
+        except ConflictError as e:
+            RetroUI.error(f"Not saved, the client was changed in another session: {e}")
+            return
+        RetroUI.success("Client updated.")
+
+    def _delete_policy(self, opts):
+        """The policy picked by a --refuse/--cascade/--archive flag, else the config's."""
+        chosen = [p for p in CLIENT_DELETE_POLICIES if opts.get(p)]
+        if len(chosen) > 1:
+            raise ValueError("Pick one of --refuse, --cascade or --archive.")
+        policy = chosen[0] if chosen else self.config.get("client_delete_policy") or "refuse"
+        if policy not in CLIENT_DELETE_POLICIES:
+            raise ValueError(
+                f"client_delete_policy must be one of {', '.join(CLIENT_DELETE_POLICIES)}, "
+                f"not '{policy}'"
+            )
+        return policy
+
+    def do_delete_client(self, args=()):
+        from rich.prompt import Confirm, IntPrompt
+
+        try:
+            _, opts = self._split_options(args, flags=CLIENT_DELETE_POLICIES)
+            policy = self._delete_policy(opts)
+        except ValueError as e:
+            RetroUI.error(str(e))
+            return
+
+        self.do_list_clients()
+        c_id = IntPrompt.ask("[green]Enter Client ID to delete[/green]")
+        client = self.store.get_client(c_id)
+        if not client:
+            RetroUI.error("Client not found.")
+            return
+
+        invoices = self.store.client_invoices(c_id)
+        if invoices and policy == "refuse":
+            RetroUI.error(
+                f"{client['name']} has {len(invoices)} invoices. Use 'delete-client --archive' "
+                "to hide the client and keep them, or --cascade to delete them too."
+            )
+            return
+        question = f"Are you sure you want to delete {client['name']}"
+        if invoices and policy == "cascade":
+            question += f" and its {len(invoices)} invoices"
+        elif policy == "archive":
+            question = f"Archive {client['name']}? Its {len(invoices)} invoices are kept"
+        if not Confirm.ask(f"[red]{question}?[/red]"):
+            return
+        try:
+            self.store.delete_client(c_id, policy)
+        except (ClientInUseError, ConflictError) as e:
+            RetroUI.error(f"Client not deleted: {e}")
+            return
+        if policy == "archive":
+            RetroUI.success(f"{client['name']} archived.")
+        elif invoices:
+            RetroUI.success(f"Client and {len(invoices)} invoices deleted.")
+        else:
+            RetroUI.success("Client deleted.")
+
+    # --- INVOICE COMMANDS ---
+
+    def do_create_invoice(self, args):
+        from rich.prompt import IntPrompt
+
+        # Parse args manually or simple logic
+        if not self.store.count_clients():
+            RetroUI.error("No clients found. Add a client first.")
+            return
+
+        # Find client (fuzzy match or list)
+        target_client_name = args[0] if args else None
+        client = None
+
+        if target_client_name:
+            # Simple fuzzy search
+            client = self.store.find_client(target_client_name)
+
+        if not client:
+            self.do_list_clients()
+            c_id = IntPrompt.ask("\n[green]Enter Client ID from list[/green]")
+            client = self.store.get_client(c_id)
+
+        if not client:
+            RetroUI.error("Invalid Client.")
+            return
+        if client.get("archived"):
+            RetroUI.error(f"{client['name']} is archived; no new invoices can be made.")
+            return
+
+        # Generate Invoice
+        console.print(
+            f"\n[bold green]>> NEW INVOICE FOR: {client['name']} <<[/bold green]"
+        )
+        items_service, items_reimburse = self._prompt_items(client)
+        if not items_service and not items_reimburse:
+            RetroUI.error("Empty invoice cancelled.")
+            return
+
+        try:
+            invoice_data = self._new_invoice(
+                client, items_service, items_reimburse, config=self.config
+            )
+        except ValueError as e:
+            RetroUI.error(str(e))
+            return
+        with self.ids.batch():
+            invoice_data["id"] = self.ids.next_invoice_id(invoice_data["date"])
+            self.store.add_invoice(invoice_data)
+
+        # Render in the background so the prompt comes straight back
+        self.render_queue.submit([invoice_data["id"]])
+        RetroUI.success(
+            f"Invoice {invoice_data['id']} saved. PDF queued: "
+            f"{invoice_pdf_path(client, invoice_data)} (see 'jobs')"
+        )
+
+    @staticmethod
+    def _prompt_items(client):
+        """Ask for service and reimbursement lines; returns the two lists."""
+        from rich.prompt import Confirm, FloatPrompt, Prompt
+
+        items_service = []
+        items_reimburse = []
+
+        # Interactive Item Entry
+        while True:
+            console.print("\n[cyan]--- Add Service ---[/cyan]")
+            desc = Prompt.ask("[green]Description (or 'done')[/green]")
+            if desc.lower() == "done":
+                break
+
+            # Simple wizard
+            is_hourly = Confirm.ask("Is this Hourly?")
+            rate = FloatPrompt.ask(f"Rate ({client['currency']})")
+            qty = FloatPrompt.ask("Hours" if is_hourly else "Quantity", default=1.0)
+
+            items_service.append({"desc": desc, "rate": rate, "qty": qty})
+
+        if Confirm.ask("\n[yellow]Add Reimbursements?[/yellow]"):
+            while True:
+                console.print("\n[cyan]--- Add Expense ---[/cyan]")
+                desc = Prompt.ask("[green]Description (or 'done')[/green]")
+                if desc.lower() == "done":
+                    break
+                amt = FloatPrompt.ask(f"Amount ({client['currency']})")
+                items_reimburse.append({"desc": desc, "rate": amt, "qty": 1.0})
+        return items_service, items_reimburse
+
+    @staticmethod
+    def _new_invoice(client, items_service, items_reimburse, date=None, config=None):
+        """Build an invoice; the caller numbers it with IdAllocator when saving.
+
+        Raises ValueError for a ``date`` that is not YYYY-MM-DD and, with a
+        ``config`` (the invoice is then taxed by ``gst.invoice_tax``), for a
+        bad HSN/SAC code or rate.
+        """
+        if date:
+            try:
+                datetime.strptime(date, "%Y-%m-%d")
+            except ValueError:
+                raise ValueError(f"not a YYYY-MM-DD date: '{date}'")
+        invoice = {
+            "id": None,
+            "client_id": client["id"],
+            "client_name": client["name"],
+            "currency": client["currency"],
+            "date": date or datetime.now().strftime("%Y-%m-%d"),
+            "services": items_service,
+            "reimbursements": items_reimburse,
+            "total": None,
+        }
+        tax = invoice_tax(config, client, items_service) if config else None
+        if tax:
+            invoice["tax"] = tax
+        invoice["total"] = float(InvoiceTotals.of(invoice).total)
+        return invoice
+
+    def do_recurring(self, args):
+        from rich import box
+        from rich.prompt import IntPrompt, Prompt
+        from rich.table import Table
+
+        action = args[0] if args else "list"
+        if action == "delete":
+            if len(args) < 2 or not args[1].isdigit():
+                RetroUI.error("Usage: recurring delete <ID>")
+            elif self.billing.delete(int(args[1])):
+                RetroUI.success(f"Recurring invoice {args[1]} stopped; issued invoices are kept.")
+            else:
+                RetroUI.error("Recurring invoice not found.")
+            return
+
+        if action == "add":
+            client = self.store.find_client(args[1]) if len(args) > 1 else None
+            if not client:
+                self.do_list_clients()
+                client = self.store.get_client(
+                    IntPrompt.ask("\n[green]Enter Client ID from list[/green]")
+                )
+            if not client:
+                RetroUI.error("Invalid Client.")
+                return
+            if client.get("archived"):
+                RetroUI.error(f"{client['name']} is archived; no new invoices can be made.")
+                return
+            console.print(
+                f"\n[bold green]>> RECURRING INVOICE FOR: {client['name']} <<[/bold green]"
+            )
+            RetroUI.info("{month} and {period} in a description become the billing month/date.")
+            services, reimbursements = self._prompt_items(client)
+            if not services and not reimbursements:
+                RetroUI.error("Empty invoice cancelled.")
+                return
+            plan = {
+                "client_id": client["id"],
+                "cadence": Prompt.ask("Cadence", choices=list(CADENCES), default="monthly"),
+                "start": Prompt.ask("First invoice date", default=date.today().isoformat()),
+                "end": Prompt.ask("Last date (blank for none)", default="") or None,
+                "services": services,
+                "reimbursements": reimbursements,
+            }
+            try:
+                plan_id = self.billing.add(plan, self.ids)
+            except ValueError as e:
+                RetroUI.error(f"Recurring invoice not saved: {e}")
+                return
+            RetroUI.success(
+                f"Recurring invoice {plan_id} saved; first due {plan['start']}. "
+                "Issue due invoices with 'run-billing'."
+            )
+            return
+
+        if action != "list":
+            RetroUI.error("Usage: recurring [list | add [CLIENT] | delete <ID>]")
+            return
+        plans = self.billing.load()
+        if not plans:
+            RetroUI.info("No recurring invoices. Add one with 'recurring add'.")
+            return
+        clients = {c["id"]: c for c in self.store.clients()}
+        table = Table(title="RECURRING INVOICES", border_style="green", box=box.SIMPLE)
+        table.add_column("ID", justify="right", style="cyan")
+        table.add_column("Client", style="green")
+        table.add_column("Cadence", style="magenta")
+        table.add_column("Start", no_wrap=True)
+        table.add_column("End", no_wrap=True)
+        table.add_column("Amount", justify="right", style="yellow", no_wrap=True)
+        table.add_column("Next", style="bold", no_wrap=True)
+        for plan in plans:
+            client = clients.get(plan["client_id"])
+            total = InvoiceTotals(plan["services"], plan["reimbursements"]).total
+            table.add_row(
+                str(plan["id"]),
+                client["name"] if client else "[red](deleted)[/]",
+                plan["cadence"],
+                plan["start"],
+                plan.get("end") or "-",
+                f"{client['currency'] if client else ''} {total:.2f}",
+                RecurringBilling.next_date(plan) or "ended",
+            )
+        console.print(table)
+
+    def do_run_billing(self, args, background=True):
+        from rich import box
+        from rich.table import Table
+
+        try:
+            _, opts = self._split_options(args, flags=("dry-run", "wait"), options=("through",))
+            through = opts.get("through") or date.today().isoformat()
+            date.fromisoformat(through)
+        except ValueError as e:
+            RetroUI.error(str(e))
+            return
+
+        if opts.get("dry-run"):
+            due = self.billing.due(self.store, through)
+            if not due:
+                RetroUI.info(f"Nothing due through {through}.")
+                return
+            table = Table(title=f"DUE THROUGH {through}", border_style="green", box=box.SIMPLE)
+            for title, justify in (("Date", "left"), ("Plan", "right"), ("Client", "left")):
+                table.add_column(title, justify=justify)
+            table.add_column("Total", justify="right", style="yellow")
+            for plan, client, on in due:
+                services = RecurringBilling.items(plan["services"], on)
+                try:
+                    tax = invoice_tax(self.config, client, services) if client else None
+                    total = InvoiceTotals(
+                        services, plan["reimbursements"], tax["total"] if tax else 0
+                    ).total
+                    total = f"{total:.2f}"
+                except ValueError as e:
+                    total = f"[red]{e}[/]"
+                table.add_row(
+                    on,
+                    str(plan["id"]),
+                    client["name"] if client else "[red](no client, skipped)[/]",
+                    total,
+                )
+            console.print(table)
+            return
+
+        try:
+            invoices, skipped = self.billing.run(self.store, self.ids, through)
+        except ValueError as e:
+            RetroUI.error(f"Billing run aborted, nothing was saved: {e}")
+            return
+        for plan in skipped:
+            RetroUI.error(
+                f"Recurring invoice {plan['id']} skipped: its client was deleted or archived."
+            )
+        if not invoices:
+            RetroUI.info(f"Nothing due through {through}.")
+            return
+        numbers = invoices[0]["id"]
+        if len(invoices) > 1:
+            numbers += f" ... {invoices[-1]['id']}"
+        RetroUI.success(f"Issued {len(invoices)} invoices through {through}: {numbers}.")
+        self._generate_pdf_batch(invoices, background=background and not opts.get("wait"))
+
+    def _generate_pdf_file(self, client, invoice_data, force=False):
+        try:
+            cache = RenderCache()
+            filename, rendered = cache.render(client, invoice_data, self.config, force)
+            cache.save()
+        except Exception as e:
+            RetroUI.error(f"PDF Generation Failed: {e}")
+            return
+        if rendered:
+            RetroUI.success(f"Invoice Saved & PDF Generated: {filename}")
+        else:
+            RetroUI.info(f"PDF already up to date: {filename}")
+
+    def do_list_invoices(self, args):
+        opts = self._list_options(args, INVOICE_SORT_KEYS, ("since",))
+        if opts is None:
+            return
+
+        # Filter by client if arg provided
+        filter_name = opts["args"][0] if opts["args"] else None
+
+        invoices = self.store.invoices(
+            filter_name,
+            date_from=opts.get("since"),
+            sort=opts["sort"],
+            descending=opts["desc"],
+            limit=opts["limit"],
+            offset=opts["offset"],
+        )
+        rows = (
+            (inv["id"], inv["date"], inv["client_name"], f"{inv['total']:.2f}", inr)
+            for inv, inr in self._with_inr(invoices)
+        )
+        self._print_paged(
+            "INVOICE HISTORY",
+            [
+                ("INV #", {"style": "cyan", "width": 18}),
+                ("Date", {"style": "dim", "width": 10}),
+                ("Client", {"style": "green", "width": 14}),
+                ("Total", {"justify": "right", "style": "bold yellow", "width": 12}),
+                ("INR", {"justify": "right", "width": 12}),
+            ],
+            rows,
+            opts["pager"],
+        )
+
+    LIST_PAGE_SIZE = 50
+
+    def _with_inr(self, invoices):
+        """Pair invoices with their totals in INR at their dates' rates.
+
+        The rate table is resolved once for the listing and each page of
+        invoices is converted as a column; totals without a rate show "-".
+        """
+        rates = self.reports.rate_table()
+        invoices = iter(invoices)
+        while True:
+            page = list(islice(invoices, self.LIST_PAGE_SIZE))
+            if not page:
+                return
+            inr, unconverted = rates.to_inr_column(
+                [self.reports.currency_of(inv) for inv in page],
+                [inv["date"] for inv in page],
+                [to_minor(inv["total"]) for inv in page],
+            )
+            for inv, value, missing in zip(page, inr, unconverted):
+                yield inv, "-" if missing else f"{from_minor(value):.2f}"
+
+    def _list_options(self, args, sort_keys, extra_options=()):
+        """Parse the shared --limit/--offset/--sort/--desc/--pager options."""
+        try:
+            args, opts = self._split_options(
+                args,
+                flags=("desc", "pager"),
+                options=("limit", "offset", "sort") + tuple(extra_options),
+            )
+        except ValueError as e:
+            RetroUI.error(str(e))
+            return None
+        try:
+            limit = int(opts["limit"]) if "limit" in opts else None
+            offset = int(opts.get("offset", 0))
+        except ValueError:
+            RetroUI.error("--limit and --offset expect whole numbers.")
+            return None
+
+        parsed = {
+            "args": args,
+            "limit": limit,
+            "offset": offset,
+            "sort": opts.get("sort"),
+            "desc": opts.get("desc", False),
+            "pager": opts.get("pager", False),
+        }
+        if parsed["sort"] and parsed["sort"] not in sort_keys:
+            RetroUI.error(f"--sort must be one of: {', '.join(sort_keys)}")
+            return None
+        for name in extra_options:
+            if name in opts:
+                parsed[name] = opts[name]
+        return parsed
+
+    def _print_paged(self, title, columns, rows, pager=False):
+        """Print rows in fixed-width tables of LIST_PAGE_SIZE as they arrive.
+
+        The first rows appear without waiting for the rest; in pager mode the
+        header repeats on every page and the user is asked before the next.
+        """
+        from rich import box
+        from rich.prompt import Prompt
+        from rich.table import Table
+
+        page = 0
+        while True:
+            chunk = list(islice(rows, self.LIST_PAGE_SIZE))
+            if not chunk and page:
+                break
+            table = Table(
+                title=title if page == 0 else None,
+                show_header=pager or page == 0,
+                border_style="green",
+                box=box.SIMPLE,
+            )
+            for name, kwargs in columns:
+                table.add_column(name, no_wrap=True, **kwargs)
+            for row in chunk:
+                table.add_row(*row)
+            console.print(table)
+            page += 1
+            if len(chunk) < self.LIST_PAGE_SIZE:
+                break
+            if pager:
+                answer = Prompt.ask("[dim]-- more (Enter) / q to stop --[/dim]", default="")
+                if answer.lower().startswith("q"):
+                    break
+
+    def do_view_invoice(self, args):
+        from rich.panel import Panel
+
+        if not args:
+            RetroUI.error("Usage: view-invoice <INV_NUM>")
+            return
+
+        inv_id = args[0]
+        inv = self.store.get_invoice(inv_id)
+        if not inv:
+            RetroUI.error("Invoice not found.")
+            return
+
+        console.print(
+            Panel(
+                json.dumps(inv, indent=2),
+                title=f"INVOICE {inv_id}",
+                border_style="green",
+            )
+        )
+        tax = inv.get("tax")
+        if tax:
+            RetroUI.info(f"{self._tax_line(tax)}, place of supply {place_name(tax['place'])}.")
+        currency, total, paid = self.receivables.balance(inv_id)
+        if paid == total:
+            RetroUI.info("Paid in full.")
+        elif paid:
+            RetroUI.info(
+                f"Paid {currency} {from_minor(paid)} of {from_minor(total)}; "
+                f"{from_minor(total - paid)} outstanding."
+            )
+
+    @staticmethod
+    def _tax_line(tax):
+        if tax["regime"] == "intra":
+            return f"CGST {tax['cgst']:.2f} + SGST {tax['sgst']:.2f}"
+        if tax["regime"] == "inter":
+            return f"IGST {tax['igst']:.2f}"
+        return "Zero-rated export" + (f" under LUT {tax['lut']}" if tax.get("lut") else "")
+
+    def do_delete_invoice(self, args):
+        from rich.prompt import Confirm
+
+        if not args:
+            RetroUI.error("Usage: delete-invoice <INV_NUM>")
+            return
+
+        inv_id = args[0]
+        inv = self.store.get_invoice(inv_id)
+
+        if inv:
+            if Confirm.ask(f"[red]Delete invoice {inv_id}?[/red]"):
+                try:
+                    self.store.delete_invoice(inv_id)
+                except ValueError as e:
+                    RetroUI.error(str(e))
+                    return
+                RetroUI.success("Invoice deleted.")
+        else:
+            RetroUI.error("Invoice not found.")
+
+    def do_generate_pdf(self, args, background=True):
+        try:
+            args, opts = self._split_options(
+                args, flags=("all", "force", "wait"), options=("client", "from", "to")
+            )
+        except ValueError as e:
+            RetroUI.error(str(e))
+            return
+
+        force = opts.pop("force", False)
+        background = background and not opts.pop("wait", False)
+        if opts:
+            invoices = self.store.invoices(
+                opts.get("client"), opts.get("from"), opts.get("to")
+            )
+            self._generate_pdf_batch(invoices, force, background)
+            return
+
+        if not args:
+            RetroUI.error(
+                "Usage: generate-pdf <INV_NUM> | --all | --client <NAME> "
+                "[--from YYYY-MM-DD] [--to YYYY-MM-DD] [--force] [--wait]"
+            )
+            return
+
+        inv_id = args[0]
+        inv = self.store.get_invoice(inv_id)
+        if not inv:
+            RetroUI.error("Invoice not found.")
+            return
+
+        client = self.store.get_client(inv["client_id"])
+        if not client:
+            RetroUI.error("Client associated with invoice no longer exists.")
+            return
+
+        if not background:
+            self._generate_pdf_file(client, inv, force)
+            return
+        filename = invoice_pdf_path(client, inv)
+        digest = RenderCache.fingerprint(client, inv, self.config)
+        if not force and RenderCache().is_fresh(filename, digest):
+            RetroUI.info(f"PDF already up to date: {filename}")
+            return
+        self.render_queue.submit([inv_id], force)
+        RetroUI.success(f"PDF queued: {filename} (see 'jobs')")
+
+    REPORT_DIMENSIONS = {
+        "client": "client",
+        "month": "month",
+        "quarter": "quarter",
+        "fy": "fiscal_year",
+        "currency": "currency",
+    }
+
+    def do_report(self, args):
+        from rich import box
+        from rich.table import Table
+
+        try:
+            args, opts = self._split_options(args, flags=("json",), options=("by",))
+        except ValueError as e:
+            RetroUI.error(str(e))
+            return
+        by = opts.get("by", "fy")
+        if by not in self.REPORT_DIMENSIONS:
+            RetroUI.error(f"--by must be one of: {', '.join(self.REPORT_DIMENSIONS)}")
+            return
+
+        dimension = self.REPORT_DIMENSIONS[by]
+        rows = self.reports.rows(dimension)
+        if opts.get("json"):
+            console.print_json(json.dumps(list(rows)))
+            return
+
+        table = Table(
+            title=f"REVENUE BY {by.upper()}", border_style="green", box=box.SIMPLE
+        )
+        table.add_column(by.title(), style="green")
+        table.add_column("Cur", style="yellow")
+        table.add_column("Invoices", justify="right", style="cyan")
+        table.add_column("Services", justify="right")
+        table.add_column("Reimb.", justify="right")
+        table.add_column("Total", justify="right", style="bold yellow")
+        table.add_column("INR", justify="right")
+        inr, unconverted = 0.0, 0
+        for row in rows:
+            table.add_row(
+                str(row[dimension]),
+                row["currency"],
+                str(row["invoices"]),
+                f"{row['services']:.2f}",
+                f"{row['reimbursements']:.2f}",
+                f"{row['total']:.2f}",
+                f"{row['inr']:.2f}" + ("*" if row["unconverted"] else ""),
+            )
+            inr += row["inr"]
+            unconverted += row["unconverted"]
+        console.print(table)
+        RetroUI.info(f"Total in INR at invoice-date rates: {inr:.2f}")
+        if unconverted:
+            RetroUI.info(
+                f"* {unconverted} invoices have no exchange rate within "
+                f"{MAX_RATE_AGE_DAYS} days of their date; add rate files to {RATES_DIR}/."
+            )
+
+    def do_record_payment(self, args):
+        from rich.prompt import FloatPrompt
+
+        try:
+            args, opts = self._split_options(args, flags=("credit",), options=("date", "note"))
+        except ValueError as e:
+            RetroUI.error(str(e))
+            return
+        try:
+            amount = float(args[1]) if len(args) > 1 else None
+        except ValueError:
+            RetroUI.error(f"Not an amount: '{args[1]}'")
+            return
+        if not args:
+            RetroUI.error(
+                "Usage: record-payment <INV_ID> [AMOUNT] [--date YYYY-MM-DD] [--credit] "
+                "[--note TEXT]"
+            )
+            return
+
+        inv_id = args[0]
+        balance = self.receivables.balance(inv_id)
+        if balance is None:
+            RetroUI.error("Invoice not found.")
+            return
+        currency, total, paid = balance
+        if amount is None:
+            amount = FloatPrompt.ask(
+                f"[green]Amount ({currency})[/green]", default=float(from_minor(total - paid))
+            )
+        kind = "credit" if opts.get("credit") else "payment"
+        try:
+            payment, left = self.receivables.record(
+                inv_id,
+                amount,
+                opts.get("date") or date.today().isoformat(),
+                self.ids,
+                kind,
+                opts.get("note", ""),
+            )
+        except ValueError as e:
+            RetroUI.error(str(e))
+            return
+        status = f"{currency} {from_minor(left)} outstanding" if left else "paid in full"
+        RetroUI.success(
+            f"{'Credit note' if kind == 'credit' else 'Payment'} {payment['id']} of "
+            f"{currency} {payment['amount']:.2f} recorded; {inv_id} is {status}."
+        )
+
+    def do_outstanding(self, args):
+        from rich import box
+        from rich.table import Table
+
+        try:
+            args, opts = self._split_options(args, flags=("json",))
+        except ValueError as e:
+            RetroUI.error(str(e))
+            return
+        rows = self.receivables.outstanding(args[0] if args else None)
+        if opts.get("json"):
+            console.print_json(json.dumps(rows))
+            return
+        if not rows:
+            RetroUI.info("Nothing outstanding.")
+            return
+
+        table = Table(title="OUTSTANDING INVOICES", border_style="green", box=box.SIMPLE)
+        table.add_column("INV #", style="cyan", no_wrap=True)
+        table.add_column("Date", no_wrap=True)
+        table.add_column("Client", style="green")
+        table.add_column("Cur", style="yellow")
+        for name in ("Total", "Balance", "Days"):
+            table.add_column(name, justify="right", no_wrap=True)
+        totals = {}
+        for row in rows:
+            table.add_row(
+                row["invoice"],
+                row["date"],
+                row["client"],
+                row["currency"],
+                f"{row['total']:.2f}",
+                f"[bold yellow]{row['balance']:.2f}[/]",
+                str(row["days"]),
+            )
+            totals[row["currency"]] = totals.get(row["currency"], 0) + to_minor(row["balance"])
+        console.print(table)
+        for currency in sorted(totals):
+            RetroUI.info(f"Outstanding {currency}: {from_minor(totals[currency])}")
+
+    def do_aging(self, args):
+        from rich import box
+        from rich.table import Table
+
+        try:
+            _, opts = self._split_options(args, flags=("json",))
+        except ValueError as e:
+            RetroUI.error(str(e))
+            return
+        rows = self.receivables.aging()
+        if opts.get("json"):
+            console.print_json(json.dumps(rows))
+            return
+        if not rows:
+            RetroUI.info("Nothing outstanding.")
+            return
+
+        names = Receivables.bucket_names()
+        table = Table(title="RECEIVABLES AGING (DAYS)", border_style="green", box=box.SIMPLE)
+        table.add_column("Cur", style="yellow")
+        table.add_column("Invoices", justify="right", style="cyan")
+        for name in names:
+            table.add_column(name, justify="right")
+        table.add_column("Total", justify="right", style="bold yellow")
+        for row in rows:
+            table.add_row(
+                row["currency"],
+                str(row["invoices"]),
+                *(f"{row[name]:.2f}" for name in names),
+                f"{row['total']:.2f}",
+            )
+        console.print(table)
+
+    GSTR1_SECTIONS = {
+        "b2b": "B2B",
+        "b2cl": "B2C large",
+        "b2cs": "B2C small",
+        "exp": "Exports",
+    }
+
+    @staticmethod
+    def _return_period(period=None, date_from=None, date_to=None):
+        """(from, to) of a return: a YYYY-MM month, an FY, or by default last month."""
+        if period and RetroShell.FISCAL_YEAR_RE.fullmatch(period.upper()):
+            start = int(period[2:6])
+            first, last = f"{start}-04-01", f"{start + 1}-03-31"
+        else:
+            if period:
+                try:
+                    month = date.fromisoformat(f"{period}-01")
+                except ValueError:
+                    raise ValueError(f"Not a return period: '{period}' (e.g. 2026-04 or FY2025-26)")
+            else:
+                month = (date.today().replace(day=1) - timedelta(days=1)).replace(day=1)
+            first = month.isoformat()
+            last = (add_months(month, 1) - timedelta(days=1)).isoformat()
+        first, last = date_from or first, date_to or last
+        for day in (first, last):
+            date.fromisoformat(day)
+        return first, last
+
+    def _gstr1(self, period=None, date_from=None, date_to=None):
+        """The Gstr1 of a return period; raises ValueError without a GSTIN."""
+        if not state_of(self.config.get("gstin")):
+            raise ValueError("No GSTIN configured; set 'gstin' with update-config.")
+        first, last = self._return_period(period, date_from, date_to)
+        with Metrics.phase("gstr1.build"):
+            return Gstr1.from_invoices(
+                self.store.invoices(date_from=first, date_to=last),
+                self.reports.rate_table(),
+                self.config["gstin"].strip().upper(),
+                first,
+                last,
+            )
+
+    def do_gstr1(self, args):
+        from rich import box
+        from rich.table import Table
+
+        try:
+            args, opts = self._split_options(
+                args, flags=("json",), options=("from", "to", "out")
+            )
+            gstr1 = self._gstr1(args[0] if args else None, opts.get("from"), opts.get("to"))
+        except ValueError as e:
+            RetroUI.error(f"{e}\nUsage: gstr1 [YYYY-MM|FY] [--from D --to D] [--json|--out F]")
+            return
+        if opts.get("json"):
+            console.print_json(json.dumps(gstr1.to_dict()))
+            return
+        if opts.get("out"):
+            try:
+                with open(opts["out"], "w") as f:
+                    json.dump(gstr1.to_dict(), f, indent=2)
+            except OSError as e:
+                RetroUI.error(f"Cannot write {opts['out']}: {e}")
+                return
+            RetroUI.success(f"Return data written to {opts['out']}.")
+
+        table = Table(
+            title=f"GSTR-1 {gstr1.date_from} TO {gstr1.date_to} (INR)",
+            border_style="green",
+            box=box.SIMPLE,
+        )
+        table.add_column("Section", style="green")
+        for name in ("Invoices", "Value", "Taxable", "IGST", "CGST", "SGST"):
+            table.add_column(name, justify="right")
+        for section, cell in gstr1.totals().items():
+            table.add_row(
+                self.GSTR1_SECTIONS[section],
+                str(cell[0]),
+                *(f"{from_minor(v)}" for v in cell[1:]),
+            )
+        console.print(table)
+
+        hsn = Table(title="HSN/SAC SUMMARY", border_style="green", box=box.SIMPLE)
+        for name in ("HSN/SAC", "Rate", "Taxable", "IGST", "CGST", "SGST"):
+            hsn.add_column(name, justify="left" if name == "HSN/SAC" else "right")
+        for row in gstr1.to_dict()["hsn"]["data"]:
+            hsn.add_row(
+                row["hsn_sc"],
+                f"{row['rt']}%",
+                *(f"{row[k]:.2f}" for k in ("txval", "iamt", "camt", "samt")),
+            )
+        console.print(hsn)
+        if gstr1.untaxed:
+            RetroUI.info(f"{gstr1.untaxed} invoices in the period carry no GST and are left out.")
+        if gstr1.unconverted:
+            RetroUI.info(
+                f"No exchange rate for {len(gstr1.unconverted)} export invoices "
+                f"({', '.join(gstr1.unconverted[:3])}{', ...' if len(gstr1.unconverted) > 3 else ''}); "
+                f"add rate files to {RATES_DIR}/."
+            )
+
+    def do_rates(self, args):
+        from rich import box
+        from rich.table import Table
+
+        rates = self.reports.rate_table()
+        if args:
+            if len(args) != 2:
+                RetroUI.error("Usage: rates [<CURRENCY> <YYYY-MM-DD>]")
+                return
+            try:
+                RetroUI.info(self._rate_line(rates, args[0].upper(), args[1]))
+            except (RateError, ValueError) as e:
+                RetroUI.error(str(e))
+            return
+
+        if not rates.series:
+            RetroUI.info(f"No exchange rates loaded. Put rate CSVs in {RATES_DIR}/.")
+            return
+        table = Table(title="EXCHANGE RATES (INR)", border_style="green", box=box.SIMPLE)
+        for name in ("Cur", "From", "To", "Days", "Latest"):
+            table.add_column(name, justify="right" if name in ("Days", "Latest") else "left")
+        for row in self._rate_summary(rates):
+            table.add_row(*(str(v) for v in row))
+        console.print(table)
+
+    @staticmethod
+    def _rate_summary(rates):
+        for currency in sorted(rates.series):
+            days, values = rates.series[currency]
+            yield (
+                currency,
+                date.fromordinal(days[0]).isoformat(),
+                date.fromordinal(days[-1]).isoformat(),
+                len(days),
+                f"{values[-1] / RATE_SCALE:.4f}",
+            )
+
+    @staticmethod
+    def _rate_line(rates, currency, on):
+        rate = rates.rate(currency, date.fromisoformat(on).toordinal())
+        return f"1 {currency} = {rate / RATE_SCALE:.4f} INR on {on}"
+
+    SEARCH_FIELDS = ("type", "id", "date", "name", "detail", "score")
+
+    def _search_results(self, query, limit):
+        """Resolve search hits to rows of SEARCH_FIELDS."""
+        for doc, score in self.search_index.search(query, limit):
+            kind, _, key = doc.partition(":")
+            if kind == "inv":
+                inv = self.store.get_invoice(key)
+                if inv:
+                    yield (
+                        "invoice",
+                        inv["id"],
+                        inv["date"],
+                        inv["client_name"],
+                        f"{inv['total']:.2f}",
+                        round(score, 2),
+                    )
+            else:
+                client = self.store.get_client(int(key))
+                if client:
+                    yield (
+                        "client",
+                        str(client["id"]),
+                        "",
+                        client["name"],
+                        client["type"],
+                        round(score, 2),
+                    )
+
+    def do_search(self, args):
+        from rich import box
+        from rich.table import Table
+
+        try:
+            args, opts = self._split_options(args, flags=("json",), options=("limit",))
+            limit = int(opts.get("limit", 20))
+        except ValueError as e:
+            RetroUI.error(str(e))
+            return
+        if not args:
+            RetroUI.error("Usage: search <TERMS...> [--limit N] [--json]")
+            return
+
+        results = list(self._search_results(" ".join(args), limit))
+        if opts.get("json"):
+            rows = [dict(zip(self.SEARCH_FIELDS, r)) for r in results]
+            console.print_json(json.dumps(rows))
+            return
+        if not results:
+            RetroUI.info("No matches.")
+            return
+
+        table = Table(
+            title=f"SEARCH: {' '.join(args)}", border_style="green", box=box.SIMPLE
+        )
+        table.add_column("Type", style="magenta")
+        table.add_column("ID", style="cyan")
+        table.add_column("Date", style="dim")
+        table.add_column("Name", style="green")
+        table.add_column("Detail", justify="right", style="yellow")
+        table.add_column("Score", justify="right", style="dim")
+        for kind, key, date, name, detail, score in results:
+            table.add_row(kind, key, date, name, detail, f"{score:.2f}")
+        console.print(table)
+
+    def do_import(self, args):
+        try:
+            args, opts = self._split_options(args, flags=("clients", "pdf"))
+        except ValueError as e:
+            RetroUI.error(str(e))
+            return
+        if not args:
+            RetroUI.error("Usage: import <FILE.csv|FILE.jsonl> [--clients] [--pdf]")
+            return
+
+        path = args[0]
+        importer = BulkImporter(self.store, self.ids)
+        try:
+            rows = importer.read_rows(path)
+            with self.ids.batch():
+                if opts.get("clients"):
+                    count = self.store.add_clients(importer.clients(rows))
+                else:
+                    count = self.store.add_invoices(importer.invoices(rows))
+        except (OSError, ValueError) as e:
+            RetroUI.error(f"Import aborted, nothing was saved: {e}")
+            return
+        if opts.get("clients"):
+            RetroUI.success(f"Imported {count} clients from {path}.")
+            return
+        RetroUI.success(f"Imported {count} invoices from {path}.")
+
+        if opts.get("pdf") and importer.created:
+            self._generate_pdf_batch(self.store.get_invoice(i) for i in importer.created)
+
+    def _generate_pdf_batch(self, invoices, force=False, background=False):
+        from rich import box
+        from rich.table import Table
+
+        cache = RenderCache()
+        clients = {c["id"]: c for c in self.store.clients()}
+        jobs, failures = [], []
+        matched = fresh = 0
+        for inv in invoices:
+            matched += 1
+            client = clients.get(inv["client_id"])
+            if not client:
+                failures.append((inv["id"], "Client no longer exists"))
+                continue
+            filename = invoice_pdf_path(client, inv)
+            digest = RenderCache.fingerprint(client, inv, self.config)
+            if not force and cache.is_fresh(filename, digest):
+                fresh += 1
+            else:
+                jobs.append((client, inv, filename, digest))
+
+        if not matched:
+            RetroUI.info("No invoices matched.")
+            return
+
+        if background:
+            if jobs:
+                self.render_queue.submit([inv["id"] for _, inv, _, _ in jobs], force)
+            RetroUI.success(
+                f"{len(jobs)} PDFs queued for {INVOICE_DIR}/ (see 'jobs'), "
+                f"{fresh} already up to date."
+            )
+        else:
+            self._render_pdf_jobs(jobs, cache, failures, fresh)
+        if failures:
+            table = Table(title="FAILED RENDERS", border_style="red", box=box.SIMPLE)
+            table.add_column("INV #", style="cyan")
+            table.add_column("Error", style="red")
+            for inv_id, error in failures:
+                table.add_row(inv_id, error)
+            console.print(table)
+
+    def _render_pdf_jobs(self, jobs, cache, failures, fresh):
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        from rich.progress import Progress
+
+        rendered = 0
+        workers = min(os.cpu_count() or 1, len(jobs))
+        if jobs:
+            with Progress(console=console.get()) as progress, ProcessPoolExecutor(
+                max_workers=workers
+            ) as pool:
+                task = progress.add_task("[green]Rendering PDFs", total=len(jobs))
+                futures = {
+                    pool.submit(render_invoice_pdf, client, inv, self.config): (
+                        inv["id"],
+                        filename,
+                        digest,
+                    )
+                    for client, inv, filename, digest in jobs
+                }
+                for future in as_completed(futures):
+                    inv_id, filename, digest = futures[future]
+                    try:
+                        future.result()
+                        cache.record(filename, digest)
+                        rendered += 1
+                    except Exception as e:
+                        failures.append((inv_id, str(e)))
+                    progress.advance(task)
+            cache.save()
+
+        RetroUI.success(
+            f"{rendered} PDFs generated in {INVOICE_DIR}/ using {workers} workers, "
+            f"{fresh} already up to date."
+        )
+
+    def do_jobs(self, args):
+        from rich import box
+        from rich.table import Table
+
+        try:
+            _, opts = self._split_options(args, flags=("retry", "clear"))
+        except ValueError as e:
+            RetroUI.error(str(e))
+            return
+        if opts.get("retry"):
+            RetroUI.success(f"{self.render_queue.retry()} renders queued again.")
+        if opts.get("clear"):
+            RetroUI.success(f"{self.render_queue.clear_failed()} failed renders cleared.")
+
+        jobs = self.render_queue.load()
+        if not jobs:
+            RetroUI.info("No PDF renders queued.")
+            return
+        styles = {"pending": "yellow", "running": "cyan", "failed": "red", "stalled": "red"}
+        table = Table(title="PDF RENDER JOBS", border_style="green", box=box.SIMPLE)
+        table.add_column("INV #", style="cyan")
+        table.add_column("Status")
+        table.add_column("Tries", justify="right")
+        table.add_column("Age", justify="right", style="dim")
+        table.add_column("Error", style="red")
+        for job in jobs:
+            state = RenderQueue.state(job)
+            table.add_row(
+                job["id"],
+                f"[{styles[state]}]{state}[/]",
+                str(job["attempts"]),
+                self._ago(job["submitted"]),
+                job.get("error") or "",
+            )
+        console.print(table)
+        if any(RenderQueue.state(j) in ("failed", "stalled") for j in jobs):
+            RetroUI.info("'jobs --retry' queues failed renders again, 'jobs --clear' drops them.")
+
+    @staticmethod
+    def _ago(timestamp):
+        seconds = int(time.time() - timestamp)
+        if seconds < 120:
+            return f"{seconds}s"
+        if seconds < 7200:
+            return f"{seconds // 60}m"
+        return f"{seconds // 3600}h"
+
+    def _render_notices(self):
+        """Report renders that failed in the background since the last prompt."""
+        failed = {j["id"] for j in self.render_queue.load() if j["status"] == "failed"}
+        if self._failed_renders is not None and failed - self._failed_renders:
+            new = ", ".join(sorted(failed - self._failed_renders))
+            RetroUI.error(f"PDF render failed for {new}; see 'jobs'.")
+        self._failed_renders = failed
+
+    @staticmethod
+    def _split_options(args, flags=(), options=()):
+        """Split shell args into positionals and ``--flag`` / ``--option value``."""
+        positional, opts = [], {}
+        args = iter(args)
+        for arg in args:
+            if not arg.startswith("--"):
+                positional.append(arg)
+                continue
+            name = arg[2:]
+            if name in flags:
+                opts[name] = True
+            elif name in options:
+                value = next(args, None)
+                if value is None:
+                    raise ValueError(f"Option {arg} expects a value.")
+                opts[name] = value
+            else:
+                raise ValueError(f"Unknown option: {arg}")
+        return positional, opts
+
+    # --- HEADLESS COMMANDS ---
+
+    def cli_list_clients(self, opts):
+        clients = paginate(
+            self.store.clients(),
+            CLIENT_SORT_KEYS.get(opts.sort),
+            opts.desc,
+            opts.limit,
+            opts.offset,
+        )
+        self._stream(
+            clients,
+            opts.format,
+            lambda c: (c["id"], c["name"], c["type"], c["currency"]),
+        )
+
+    def cli_list_invoices(self, opts):
+        invoices = self.store.invoices(
+            opts.client,
+            opts.date_from,
+            opts.date_to,
+            sort=opts.sort,
+            descending=opts.desc,
+            limit=opts.limit,
+            offset=opts.offset,
+        )
+        if opts.format == "tsv":
+            self._stream(
+                self._with_inr(invoices),
+                opts.format,
+                lambda r: (
+                    r[0]["id"], r[0]["date"], r[0]["client_name"], f"{r[0]['total']:.2f}", r[1]
+                ),
+            )
+        else:
+            self._stream(invoices, opts.format, None)
+
+    @staticmethod
+    def _stream(records, fmt, tsv_row):
+        """Write records to stdout one at a time as TSV, JSON lines or a JSON array."""
+        out = sys.stdout
+        if fmt == "json":
+            out.write("[")
+            for n, record in enumerate(records):
+                out.write(",\n" if n else "\n")
+                out.write(json.dumps(record))
+            out.write("\n]\n")
+        elif fmt == "jsonl":
+            for record in records:
+                out.write(json.dumps(record) + "\n")
+        else:
+            for record in records:
+                out.write("\t".join(str(v) for v in tsv_row(record)) + "\n")
+
+    def cli_view_invoice(self, opts):
+        inv = self.store.get_invoice(opts.invoice_id)
+        if not inv:
+            raise CommandError(f"Invoice {opts.invoice_id} not found.")
+        print(json.dumps(inv, indent=2))
+
+    def cli_delete_invoice(self, opts):
+        if not self.store.get_invoice(opts.invoice_id):
+            raise CommandError(f"Invoice {opts.invoice_id} not found.")
+        try:
+            self.store.delete_invoice(opts.invoice_id)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+    def _cli_client(self, ref):
+        """The client with id ``ref``, or else the first whose name contains it."""
+        client = self.store.get_client(int(ref)) if ref.isdigit() else None
+        if not client:
+            client = self.store.find_client(ref)
+        if not client:
+            raise CommandError(f"No client matches '{ref}'.")
+        if client.get("archived"):
+            raise CommandError(f"{client['name']} is archived; no new invoices can be made.")
+        return client
+
+    @staticmethod
+    def _read_items(path):
+        """(services, reimbursements) from a JSON items file, "-" meaning stdin."""
+        try:
+            if path == "-":
+                items = json.load(sys.stdin)
+            else:
+                with open(path, "r") as f:
+                    items = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read items from {path}: {e}")
+
+        # A bare list is shorthand for {"services": [...]}
+        if isinstance(items, list):
+            items = {"services": items}
+        try:
+            items_service = [
+                {
+                    "desc": i["desc"],
+                    "rate": float(i["rate"]),
+                    "qty": float(i.get("qty", 1)),
+                    **{k: i[k] for k in ("sac", "gst_rate") if k in i},
+                }
+                for i in items.get("services", [])
+            ]
+            items_reimburse = [
+                {"desc": i["desc"], "rate": float(i.get("amount", i.get("rate"))), "qty": 1.0}
+                for i in items.get("reimbursements", [])
+            ]
+        except (KeyError, TypeError, ValueError) as e:
+            raise CommandError(f"Malformed line item in {path}: {e}")
+        if not items_service and not items_reimburse:
+            raise CommandError("Empty invoice cancelled.")
+        return items_service, items_reimburse
+
+    def cli_delete_client(self, opts):
+        flags = {p: getattr(opts, p) for p in CLIENT_DELETE_POLICIES}
+        try:
+            policy = self._delete_policy(flags)
+            count = self.store.delete_client(opts.client_id, policy)
+        except (ValueError, ClientInUseError, ConflictError) as e:
+            raise CommandError(str(e))
+        if policy == "cascade" and count:
+            print(f"{count} invoices deleted", file=sys.stderr)
+
+    def cli_create_invoice(self, opts):
+        client = self._cli_client(opts.client)
+        items_service, items_reimburse = self._read_items(opts.items)
+        try:
+            invoice_data = self._new_invoice(
+                client, items_service, items_reimburse, opts.date, self.config
+            )
+            with self.ids.batch():
+                invoice_data["id"] = self.ids.next_invoice_id(invoice_data["date"])
+                self.store.add_invoice(invoice_data)
+        except ValueError as e:
+            raise CommandError(str(e))
+        if opts.background:
+            self.render_queue.submit([invoice_data["id"]])
+        elif not opts.no_pdf:
+            cache = RenderCache()
+            cache.render(client, invoice_data, self.config)
+            cache.save()
+        print(invoice_data["id"])
+
+    def cli_report(self, opts):
+        rows = self.reports.rows(self.REPORT_DIMENSIONS[opts.by])
+        if opts.json:
+            print(json.dumps(list(rows), indent=2))
+            return
+        for row in rows:
+            print("\t".join(str(v) for v in row.values()))
+
+    def cli_record_payment(self, opts):
+        try:
+            payment, left = self.receivables.record(
+                opts.invoice_id,
+                opts.amount,
+                opts.date or date.today().isoformat(),
+                self.ids,
+                "credit" if opts.credit else "payment",
+                opts.note or "",
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        print(f"{payment['id']}\t{from_minor(left)}")
+
+    def cli_outstanding(self, opts):
+        self._stream(
+            self.receivables.outstanding(opts.client), opts.format, lambda r: r.values()
+        )
+
+    def cli_aging(self, opts):
+        rows = self.receivables.aging()
+        if opts.json:
+            print(json.dumps(rows, indent=2))
+            return
+        for row in rows:
+            print("\t".join(str(v) for v in row.values()))
+
+    def cli_gstr1(self, opts):
+        try:
+            gstr1 = self._gstr1(opts.period, opts.date_from, opts.date_to)
+        except ValueError as e:
+            raise CommandError(str(e))
+        if opts.format == "json":
+            print(json.dumps(gstr1.to_dict(), indent=2))
+            return
+        for section, cell in gstr1.totals().items():
+            print("\t".join([section, str(cell[0]), *(str(from_minor(v)) for v in cell[1:])]))
+
+    def cli_rates(self, opts):
+        rates = self.reports.rate_table()
+        if opts.currency:
+            if not opts.date:
+                raise CommandError("rates expects a currency and a date.")
+            try:
+                print(self._rate_line(rates, opts.currency.upper(), opts.date))
+            except (RateError, ValueError) as e:
+                raise CommandError(str(e))
+            return
+        for row in self._rate_summary(rates):
+            print("\t".join(str(v) for v in row))
+
+    def cli_search(self, opts):
+        results = self._search_results(" ".join(opts.terms), opts.limit)
+        rows = (dict(zip(self.SEARCH_FIELDS, r)) for r in results)
+        self._stream(rows, opts.format, lambda r: r.values())
+
+    def cli_import(self, opts):
+        importer = BulkImporter(self.store, self.ids)
+        try:
+            rows = importer.read_rows(opts.file)
+            with self.ids.batch():
+                if opts.clients:
+                    count = self.store.add_clients(importer.clients(rows))
+                else:
+                    count = self.store.add_invoices(importer.invoices(rows))
+        except (OSError, ValueError) as e:
+            raise CommandError(f"import aborted, nothing was saved: {e}")
+        print(f"{count} {'clients' if opts.clients else 'invoices'} imported")
+        if opts.pdf and not opts.clients and importer.created:
+            self._generate_pdf_batch(self.store.get_invoice(i) for i in importer.created)
+
+    def cli_recurring(self, opts):
+        if opts.action == "add":
+            client = self._cli_client(opts.client)
+            services, reimbursements = self._read_items(opts.items)
+            plan = {
+                "client_id": client["id"],
+                "cadence": opts.cadence,
+                "start": opts.start or date.today().isoformat(),
+                "end": opts.end,
+                "services": services,
+                "reimbursements": reimbursements,
+            }
+            try:
+                print(self.billing.add(plan, self.ids))
+            except ValueError as e:
+                raise CommandError(str(e))
+        elif opts.action == "delete":
+            if not self.billing.delete(opts.plan_id):
+                raise CommandError(f"No recurring invoice {opts.plan_id}.")
+        else:
+            plans = (dict(p, next=RecurringBilling.next_date(p)) for p in self.billing.load())
+            self._stream(
+                plans,
+                opts.format,
+                lambda p: (
+                    p["id"],
+                    p["client_id"],
+                    p["cadence"],
+                    p["start"],
+                    p.get("end") or "",
+                    p["next"] or "",
+                ),
+            )
+
+    def cli_run_billing(self, opts):
+        through = opts.through or date.today().isoformat()
+        if opts.dry_run:
+            for plan, client, on in self.billing.due(self.store, through):
+                print(f"{on}\t{plan['id']}\t{client['name'] if client else ''}")
+            return
+        try:
+            invoices, skipped = self.billing.run(self.store, self.ids, through)
+        except ValueError as e:
+            raise CommandError(f"billing run aborted, nothing was saved: {e}")
+        for plan in skipped:
+            print(
+                f"retro-khaata: recurring invoice {plan['id']} skipped: "
+                "client deleted or archived",
+                file=sys.stderr,
+            )
+        for invoice in invoices:
+            print(invoice["id"])
+        if invoices and not opts.no_pdf:
+            self._generate_pdf_batch(invoices, background=opts.background)
+
+    def cli_archive(self, opts):
+        if opts.action:
+            try:
+                print(self._archive_years(opts.action, opts.years))
+            except ValueError as e:
+                raise CommandError(str(e))
+            return
+        if not isinstance(self.store, JsonStore):
+            raise CommandError("Only the JSON backend archives invoices.")
+        segments = (
+            dict(segment, year=fy) for fy, segment in sorted(self.store.archive.load().items())
+        )
+        self._stream(
+            segments,
+            opts.format,
+            lambda s: (s["year"], s["invoices"], s["from"], s["to"], s["bytes"]),
+        )
+
+    def cli_generate_pdf(self, opts):
+        if opts.invoice_id and not self.store.get_invoice(opts.invoice_id):
+            raise CommandError(f"Invoice {opts.invoice_id} not found.")
+        args = [opts.invoice_id] if opts.invoice_id else []
+        for flag in ("all", "force"):
+            if getattr(opts, flag):
+                args.append(f"--{flag}")
+        for option, value in (
+            ("client", opts.client),
+            ("from", opts.date_from),
+            ("to", opts.date_to),
+        ):
+            if value:
+                args += [f"--{option}", value]
+        self.do_generate_pdf(args, background=opts.background)
+
+    def cli_jobs(self, opts):
+        if opts.retry:
+            self.render_queue.retry()
+        if opts.clear:
+            self.render_queue.clear_failed()
+        jobs = (dict(j, status=RenderQueue.state(j)) for j in self.render_queue.load())
+        self._stream(
+            jobs,
+            opts.format,
+            lambda j: (j["id"], j["status"], j["attempts"], j.get("error") or ""),
+        )
+
+    def cli_stats(self, opts):
+        records = Metrics.read(opts.last)
+        if opts.command_name:
+            records = [r for r in records if r["command"] == opts.command_name]
+        rows = Metrics.summary(records)
+        if opts.json:
+            print(json.dumps(rows, indent=2))
+            return
+        fields = ("command", "runs", "failed", "median_ms", "p95_ms", "max_ms", "recent_ms")
+        for row in rows:
+            print("\t".join(str(row[k]) for k in fields))
+
+    def cli_render_worker(self, opts):
+        run_render_worker(self.store, self.config)
+
+    # --- CONFIG COMMANDS ---
+
+    def do_config(self):
+        from rich import box
+        from rich.table import Table
+
+        table = Table(
+            title="SYSTEM CONFIGURATION", border_style="blue", box=box.ROUNDED
+        )
+        table.add_column("Key", style="cyan")
+        table.add_column("Value", style="white")
+
+        for k, v in self.config.items():
+            table.add_row(k.replace("_", " ").title(), str(v))
+        console.print(table)
+
+    def do_update_config(self):
+        from rich.prompt import Prompt
+
+        console.print(
             "[bold yellow]Update Configuration (Press Enter to keep current)[/bold yellow]"
         )
         for k in self.config.keys():
@@ -556,7 +4570,170 @@ class RetroShell:
         DataManager.save(DATA_FILE_CONFIG, self.config)
         RetroUI.success("Configuration updated.")
 
+    def do_dedupe_ids(self):
+        with self.ids.batch():
+            n_clients, n_invoices = self.store.dedupe_ids(self.ids.next_client_id)
+        if not (n_clients or n_invoices):
+            RetroUI.info("No duplicate ids found.")
+            return
+        # Renames keep the record counts, so the indexes would not notice
+        for index in (self.reports, self.search_index, self.receivables):
+            index.rebuild()
+            index.data = None
+        RetroUI.success(
+            f"Renumbered {n_clients} clients and {n_invoices} invoices with duplicate ids."
+        )
+
+    def do_stats(self, args):
+        from rich import box
+        from rich.table import Table
+
+        try:
+            args, opts = self._split_options(args, flags=("json",), options=("last",))
+            last = int(opts.get("last", 1000))
+        except ValueError as e:
+            RetroUI.error(str(e))
+            return
+        records = Metrics.read(last)
+        if args:
+            records = [r for r in records if r["command"] == args[0]]
+        rows = Metrics.summary(records)
+        if opts.get("json"):
+            console.print_json(json.dumps(rows))
+            return
+        if not rows:
+            RetroUI.info(f"No metrics recorded yet in {METRICS_FILE}.")
+            return
+
+        table = Table(
+            title=f"COMMAND STATS (last {len(records)} runs)",
+            border_style="green",
+            box=box.SIMPLE,
+        )
+        table.add_column("Command", style="cyan")
+        table.add_column("Runs", justify="right")
+        table.add_column("Median", justify="right", style="bold yellow")
+        table.add_column("p95", justify="right")
+        table.add_column("Recent", justify="right")
+        table.add_column("Slowest phases (ms/run)", style="dim")
+        for row in rows:
+            phases = ", ".join(f"{name} {ms:g}" for name, ms in row["phases"].items())
+            table.add_row(
+                row["command"] + (f" [red]({row['failed']} failed)[/]" if row["failed"] else ""),
+                str(row["runs"]),
+                f"{row['median_ms']:g} ms",
+                f"{row['p95_ms']:g} ms",
+                f"{row['recent_ms']:g} ms",
+                phases,
+            )
+        console.print(table)
+        if args:
+            for name, n in sorted(rows[0]["counters"].items()):
+                RetroUI.info(f"{name}: {n:,} in total, {n / rows[0]['runs']:,.0f} per run")
+
+    def do_migrate_db(self):
+        store = SQLiteStore(DATA_FILE_DB)
+        try:
+            if store.count_clients() or store.count_invoices():
+                RetroUI.error(f"{DATA_FILE_DB} already contains data.")
+                return
+            n_clients, n_invoices = store.import_json()
+        finally:
+            store.close()
+        RetroUI.success(
+            f"Migrated {n_clients} clients and {n_invoices} invoices into {DATA_FILE_DB}."
+        )
+        RetroUI.info("Set KHAATA_BACKEND=sqlite to use the new database.")
+
+    def do_data_format(self, args):
+        if not isinstance(self.store, JsonStore):
+            RetroUI.error("Only the JSON backend keeps snapshot files.")
+            return
+        if not args:
+            for filename in (DATA_FILE_CLIENTS, DATA_FILE_INVOICES):
+                if os.path.exists(filename):
+                    kind = "binary" if snapshot.is_snapshot(filename) else "json"
+                    size = os.path.getsize(filename)
+                    RetroUI.info(f"{filename}: {kind}, {size / 1024:,.0f} KB")
+            return
+        if args[0] not in ("json", "binary"):
+            RetroUI.error("Usage: data-format [json|binary]")
+            return
+        sizes = self.store.compact(args[0] == "binary")
+        RetroUI.success(
+            f"Rewrote {DATA_FILE_CLIENTS} ({sizes[0] / 1024:,.0f} KB) and "
+            f"{DATA_FILE_INVOICES} ({sizes[1] / 1024:,.0f} KB) as {args[0]}."
+        )
+
+    FISCAL_YEAR_RE = re.compile(r"FY\d{4}-\d{2}")
+
+    def _archive_years(self, action, years):
+        """Run an ``archive`` action; returns a message, or raises ValueError."""
+        if not isinstance(self.store, JsonStore):
+            raise ValueError(
+                "Only the JSON backend archives invoices; SQLite reads them on demand."
+            )
+        years = [y.upper() for y in years]
+        for fy in years:
+            if not self.FISCAL_YEAR_RE.fullmatch(fy):
+                raise ValueError(f"Not a fiscal year: '{fy}' (e.g. FY2024-25)")
+        if action == "restore":
+            if len(years) != 1 or years[0] not in self.store.archive.load():
+                raise ValueError("Usage: archive restore <FY> (an archived fiscal year)")
+            count = self.store.restore_year(years[0])
+            return f"Restored {count} invoices of {years[0]}."
+        current = fiscal_year(date.today().isoformat())
+        if any(fy >= current for fy in years):
+            raise ValueError(f"Only closed fiscal years (before {current}) can be archived.")
+        moved = self.store.archive_years(years)
+        if not moved:
+            return "No invoices to archive."
+        segments = self.store.archive.load()
+        return "Archived " + ", ".join(
+            f"{n} invoices of {fy} ({segments[fy]['bytes'] / 1024:,.0f} KB)"
+            for fy, n in sorted(moved.items())
+        )
+
+    def do_archive(self, args):
+        from rich import box
+        from rich.table import Table
+
+        action = args[0] if args else "list"
+        if action in ("close", "restore"):
+            try:
+                RetroUI.success(self._archive_years(action, args[1:]))
+            except ValueError as e:
+                RetroUI.error(str(e))
+            return
+        if action != "list" or not isinstance(self.store, JsonStore):
+            RetroUI.error("Usage: archive [list | close [FY...] | restore FY] (JSON backend)")
+            return
+
+        segments = self.store.archive.load()
+        if not segments:
+            RetroUI.info("No fiscal years archived.")
+            return
+        table = Table(title="ARCHIVED FISCAL YEARS", border_style="green", box=box.SIMPLE)
+        table.add_column("Year", style="green")
+        table.add_column("Invoices", justify="right", style="cyan")
+        table.add_column("From")
+        table.add_column("To")
+        table.add_column("Size", justify="right", style="yellow")
+        for fy, segment in sorted(segments.items()):
+            table.add_row(
+                fy,
+                str(segment["invoices"]),
+                segment["from"],
+                segment["to"],
+                f"{segment['bytes'] / 1024:,.0f} KB",
+            )
+        console.print(table)
+
     def do_help(self):
+        from rich import box
+        from rich.panel import Panel
+        from rich.table import Table
+
         table = Table(
             box=box.DOUBLE,
             border_style="bold green",
@@ -571,22 +4748,46 @@ class RetroShell:
         table.add_section()
         table.add_row("[bold white]CLIENTS[/]", "", "")
         table.add_row("add-client", "", "Initialize new client entity")
-        table.add_row("list-clients", "", "Display client database")
+        table.add_row("list-clients", "[--sort id|name]", "Display client database")
         table.add_row("update-client", "", "Modify client registry")
-        table.add_row("delete-client", "", "Purge client from memory")
+        table.add_row("delete-client", "[--cascade|--archive]", "Purge client from memory")
 
         table.add_section()
         table.add_row("[bold white]INVOICING[/]", "", "")
         table.add_row("create-invoice", "<CLIENT>", "Execute billing protocol")
         table.add_row("list-invoices", "[CLIENT]", "Access transaction logs")
+        table.add_row("", "--limit N --offset N", "Page through results")
+        table.add_row("", "--since DATE --sort K", "Filter / sort (date|id|total|client)")
+        table.add_row("", "--desc --pager", "Reverse order / pause per page")
         table.add_row("view-invoice", "<INV_ID>", "Decode invoice data")
         table.add_row("delete-invoice", "<INV_ID>", "Erase transaction record")
         table.add_row("generate-pdf", "<INV_ID>", "Compile PDF artifact")
+        table.add_row("search", "<TERMS...>", "Find invoices/clients (prefix+fuzzy)")
+        table.add_row("report", "[--by X] [--json]", "Revenue: client/month/quarter/fy/currency")
+        table.add_row("rates", "[CUR DATE]", "Exchange rates to INR (rates/*.csv)")
+        table.add_row("record-payment", "<INV_ID> [AMOUNT]", "Log payment (--credit for a note)")
+        table.add_row("outstanding", "[CLIENT] [--json]", "Unpaid invoices and balances")
+        table.add_row("aging", "[--json]", "Balances by age, per currency")
+        table.add_row("gstr1", "[YYYY-MM|FY] [--out F]", "GST return summary (B2B/B2C/export/HSN)")
+        table.add_row("import", "<FILE> [--pdf]", "Bulk load CSV/JSONL invoices")
+        table.add_row("", "<FILE> --clients", "Bulk load CSV/JSONL clients")
+        table.add_row("generate-pdf", "--all|--client X", "Batch compile (--from/--to)")
+        table.add_row("", "--force / --wait", "Ignore the render cache / render now")
+        table.add_row("jobs", "[--retry|--clear]", "Background PDF renders")
+        table.add_row("recurring", "[add [CLIENT]|delete ID]", "Retainer invoice schedules")
+        table.add_row("run-billing", "[--through DATE]", "Issue due recurring invoices")
+        table.add_row("", "--dry-run / --wait", "Preview only / render PDFs now")
 
         table.add_section()
         table.add_row("[bold white]SYSTEM[/]", "", "")
         table.add_row("config", "", "Display bio/bank info")
         table.add_row("update-config", "", "Reconfigure user details")
+        table.add_row("migrate-db", "", "Transfer JSON records to SQLite")
+        table.add_row("dedupe-ids", "", "Renumber records sharing an id")
+        table.add_row("data-format", "[json|binary]", "Snapshot file format")
+        table.add_row("archive", "[close [FY]|restore FY]", "Move closed years to cold storage")
+        table.add_row("stats", "[CMD] [--last N]", "Command timings and counters")
+        table.add_row("", "<ANY CMD> --profile", "Run a command under cProfile")
         table.add_row("clear", "", "Refresh CRT display")
         table.add_row("exit", "", "Power down system")
 
@@ -601,12 +4802,88 @@ class RetroShell:
 
     # --- MAIN LOOP ---
 
+    def _dispatch(self, command, args):
+        if command == "exit":
+            console.print("[bold red]Shutting down system...[/bold red]")
+            sys.exit()
+        elif command == "clear":
+            RetroUI.clear_screen()
+            RetroUI.print_banner()
+        elif command == "help":
+            self.do_help()
+
+        # Client Mapping
+        elif command == "add-client":
+            self.do_add_client()
+        elif command == "list-clients":
+            self.do_list_clients(args)
+        elif command == "update-client":
+            self.do_update_client()
+        elif command == "delete-client":
+            self.do_delete_client(args)
+
+        # Invoice Mapping
+        elif command == "create-invoice":
+            self.do_create_invoice(args)
+        elif command == "list-invoices":
+            self.do_list_invoices(args)
+        elif command == "view-invoice":
+            self.do_view_invoice(args)
+        elif command == "delete-invoice":
+            self.do_delete_invoice(args)
+        elif command == "generate-pdf":
+            self.do_generate_pdf(args)
+        elif command == "import":
+            self.do_import(args)
+        elif command == "recurring":
+            self.do_recurring(args)
+        elif command == "run-billing":
+            self.do_run_billing(args)
+        elif command == "report":
+            self.do_report(args)
+        elif command == "search":
+            self.do_search(args)
+        elif command == "rates":
+            self.do_rates(args)
+        elif command == "record-payment":
+            self.do_record_payment(args)
+        elif command == "outstanding":
+            self.do_outstanding(args)
+        elif command == "aging":
+            self.do_aging(args)
+        elif command == "gstr1":
+            self.do_gstr1(args)
+        elif command == "jobs":
+            self.do_jobs(args)
+
+        # Config Mapping
+        elif command == "config":
+            self.do_config()
+        elif command == "update-config":
+            self.do_update_config()
+        elif command == "migrate-db":
+            self.do_migrate_db()
+        elif command == "dedupe-ids":
+            self.do_dedupe_ids()
+        elif command == "data-format":
+            self.do_data_format(args)
+        elif command == "archive":
+            self.do_archive(args)
+        elif command == "stats":
+            self.do_stats(args)
+
+        else:
+            RetroUI.error(f"Unknown command: {command}")
+
     def run(self):
+        from rich.prompt import Prompt
+
         RetroUI.print_banner()
         self.do_help()
 
         while True:
             try:
+                self._render_notices()
                 user_input = Prompt.ask("\n[bold green]RETRO-OS >[/bold green]")
                 if not user_input.strip():
                     continue
@@ -615,45 +4892,11 @@ class RetroShell:
                 command = parts[0].lower()
                 args = parts[1:]
 
-                if command == "exit":
-                    console.print("[bold red]Shutting down system...[/bold red]")
-                    sys.exit()
-                elif command == "clear":
-                    RetroUI.clear_screen()
-                    RetroUI.print_banner()
-                elif command == "help":
-                    self.do_help()
-
-                # Client Mapping
-                elif command == "add-client":
-                    self.do_add_client()
-                elif command == "list-clients":
-                    self.do_list_clients()
-                elif command == "update-client":
-                    self.do_update_client()
-                elif command == "delete-client":
-                    self.do_delete_client()
-
-                # Invoice Mapping
-                elif command == "create-invoice":
-                    self.do_create_invoice(args)
-                elif command == "list-invoices":
-                    self.do_list_invoices(args)
-                elif command == "view-invoice":
-                    self.do_view_invoice(args)
-                elif command == "delete-invoice":
-                    self.do_delete_invoice(args)
-                elif command == "generate-pdf":
-                    self.do_generate_pdf(args)
-
-                # Config Mapping
-                elif command == "config":
-                    self.do_config()
-                elif command == "update-config":
-                    self.do_update_config()
-
-                else:
-                    RetroUI.error(f"Unknown command: {command}")
+                # "--profile" after any command runs it under cProfile
+                profile = "--profile" in args
+                args = [a for a in args if a != "--profile"]
+                with Metrics.command(command, profile):
+                    self._dispatch(command, args)
 
             except KeyboardInterrupt:
                 console.print("\n[yellow]Use 'exit' to quit.[/yellow]")
@@ -661,7 +4904,237 @@ class RetroShell:
                 RetroUI.error(f"System Failure: {e}")
 
 
+# --- HEADLESS CLI ---
+
+
+class CommandError(Exception):
+    """A headless command failed; reported on stderr with a non-zero exit."""
+
+
+def _add_listing_arguments(parser, sort_keys):
+    parser.add_argument("--limit", type=int, help="at most N rows")
+    parser.add_argument("--offset", type=int, default=0, help="skip the first N rows")
+    parser.add_argument("--sort", choices=list(sort_keys), help="sort key")
+    parser.add_argument("--desc", action="store_true", help="descending order")
+    parser.add_argument(
+        "--format", choices=("tsv", "jsonl", "json"), default="tsv", help="output format"
+    )
+    parser.add_argument(
+        "--json", dest="format", action="store_const", const="json", help="same as --format json"
+    )
+
+
+def _iso_date(text):
+    try:
+        return date.fromisoformat(text).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a YYYY-MM-DD date: '{text}'")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="retro-khaata",
+        description="Retro Khaata invoicing. Run without a command for the interactive shell.",
+    )
+    parser.add_argument(
+        "--profile", action="store_true", help="run under cProfile and print the hot spots"
+    )
+    sub = parser.add_subparsers(dest="command", metavar="COMMAND")
+
+    p = sub.add_parser("list-clients", help="print all clients")
+    _add_listing_arguments(p, CLIENT_SORT_KEYS)
+
+    p = sub.add_parser("list-invoices", help="print invoice history")
+    p.add_argument("client", nargs="?", help="filter by client name")
+    p.add_argument("--from", "--since", dest="date_from", type=_iso_date, metavar="YYYY-MM-DD")
+    p.add_argument("--to", dest="date_to", type=_iso_date, metavar="YYYY-MM-DD")
+    _add_listing_arguments(p, INVOICE_SORT_KEYS)
+
+    p = sub.add_parser("view-invoice", help="print one invoice as JSON")
+    p.add_argument("invoice_id")
+
+    p = sub.add_parser("delete-invoice", help="delete one invoice")
+    p.add_argument("invoice_id")
+
+    p = sub.add_parser("delete-client", help="delete (or archive) one client")
+    p.add_argument("client_id", type=int)
+    policy = p.add_mutually_exclusive_group()
+    policy.add_argument(
+        "--refuse", action="store_true", help="fail if the client has invoices"
+    )
+    policy.add_argument("--cascade", action="store_true", help="delete its invoices too")
+    policy.add_argument(
+        "--archive", action="store_true", help="keep the client and invoices, hidden"
+    )
+
+    p = sub.add_parser("create-invoice", help="create an invoice from a JSON file")
+    p.add_argument("--client", required=True, help="client id or name")
+    p.add_argument(
+        "--items",
+        required=True,
+        help='JSON file ("-" for stdin) with "services" and "reimbursements" lists',
+    )
+    p.add_argument(
+        "--date", type=_iso_date, metavar="YYYY-MM-DD", help="invoice date (default: today)"
+    )
+    p.add_argument("--no-pdf", action="store_true", help="do not render the PDF")
+    p.add_argument(
+        "--background", action="store_true", help="queue the PDF for a background worker"
+    )
+
+    p = sub.add_parser("generate-pdf", help="render invoice PDFs")
+    target = p.add_mutually_exclusive_group(required=True)
+    target.add_argument("invoice_id", nargs="?")
+    target.add_argument("--all", action="store_true", help="every invoice")
+    target.add_argument("--client", help="invoices of matching clients")
+    p.add_argument("--from", dest="date_from", type=_iso_date, metavar="YYYY-MM-DD")
+    p.add_argument("--to", dest="date_to", type=_iso_date, metavar="YYYY-MM-DD")
+    p.add_argument("--force", action="store_true", help="ignore the render cache")
+    when = p.add_mutually_exclusive_group()
+    when.add_argument(
+        "--background", action="store_true", help="queue the renders and return at once"
+    )
+    when.add_argument("--wait", action="store_true", help="render now (the default)")
+
+    p = sub.add_parser("jobs", help="background PDF render jobs")
+    p.add_argument("--retry", action="store_true", help="queue failed renders again")
+    p.add_argument("--clear", action="store_true", help="drop failed renders")
+    p.add_argument(
+        "--format", choices=("tsv", "jsonl", "json"), default="tsv", help="output format"
+    )
+
+    p = sub.add_parser("stats", help="timings and counters of recent commands")
+    p.add_argument("command_name", nargs="?", metavar="COMMAND", help="only this command")
+    p.add_argument("--last", type=int, default=1000, help="look at the last N runs")
+    p.add_argument("--json", action="store_true", help="emit JSON")
+
+    # Started by RenderQueue.start_workers
+    sub.add_parser("render-worker")
+
+    p = sub.add_parser("archive", help="move closed fiscal years into compressed segments")
+    actions = p.add_subparsers(dest="action", metavar="ACTION")
+    p.add_argument(
+        "--format", choices=("tsv", "jsonl", "json"), default="tsv", help="output format"
+    )
+    a = actions.add_parser("close", help="archive fiscal years (default: every closed one)")
+    a.add_argument("years", nargs="*", metavar="FY", help="e.g. FY2024-25")
+    a = actions.add_parser("restore", help="move an archived fiscal year back")
+    a.add_argument("years", nargs=1, metavar="FY")
+
+    p = sub.add_parser("report", help="revenue aggregates")
+    p.add_argument(
+        "--by", choices=list(RetroShell.REPORT_DIMENSIONS), default="fy", help="group by"
+    )
+    p.add_argument("--json", action="store_true", help="emit JSON")
+
+    p = sub.add_parser("record-payment", help="record a payment or credit note on an invoice")
+    p.add_argument("invoice_id")
+    p.add_argument("amount", type=float, help="in the invoice currency")
+    p.add_argument("--date", type=_iso_date, help="payment date (default: today)")
+    p.add_argument("--credit", action="store_true", help="record a credit note")
+    p.add_argument("--note", help="free text, e.g. a bank reference")
+
+    p = sub.add_parser("outstanding", help="unpaid invoices and their balances")
+    p.add_argument("client", nargs="?", help="filter by client name")
+    p.add_argument(
+        "--format", choices=("tsv", "jsonl", "json"), default="tsv", help="output format"
+    )
+
+    p = sub.add_parser("aging", help="outstanding balances by age, per currency")
+    p.add_argument("--json", action="store_true", help="emit JSON")
+
+    p = sub.add_parser("gstr1", help="GSTR-1 summary of outward supplies for a period")
+    p.add_argument(
+        "period", nargs="?", help="YYYY-MM or a fiscal year like FY2025-26 (default: last month)"
+    )
+    p.add_argument("--from", dest="date_from", type=_iso_date, metavar="YYYY-MM-DD")
+    p.add_argument("--to", dest="date_to", type=_iso_date, metavar="YYYY-MM-DD")
+    p.add_argument(
+        "--format", choices=("json", "tsv"), default="json", help="return JSON or section totals"
+    )
+
+    p = sub.add_parser("rates", help="loaded exchange rates, or one rate at a date")
+    p.add_argument("currency", nargs="?")
+    p.add_argument("date", nargs="?", metavar="YYYY-MM-DD")
+
+    p = sub.add_parser("search", help="full-text search over invoices and clients")
+    p.add_argument("terms", nargs="+")
+    p.add_argument("--limit", type=int, default=20, help="at most N results")
+    p.add_argument(
+        "--format", choices=("tsv", "jsonl", "json"), default="tsv", help="output format"
+    )
+    p.add_argument(
+        "--json", dest="format", action="store_const", const="json", help="same as --format json"
+    )
+
+    p = sub.add_parser("recurring", help="recurring invoice definitions")
+    actions = p.add_subparsers(dest="action", metavar="ACTION")
+    p.add_argument(
+        "--format", choices=("tsv", "jsonl", "json"), default="tsv", help="output format"
+    )
+    a = actions.add_parser("add", help="define a recurring invoice")
+    a.add_argument("--client", required=True, help="client id or name")
+    a.add_argument(
+        "--items",
+        required=True,
+        help='JSON file ("-" for stdin) with "services" and "reimbursements" lists; '
+        "{month} and {period} in descriptions become the billing month and date",
+    )
+    a.add_argument("--cadence", choices=list(CADENCES), default="monthly")
+    a.add_argument("--start", metavar="YYYY-MM-DD", help="first invoice date (default: today)")
+    a.add_argument("--end", metavar="YYYY-MM-DD", help="no invoices after this date")
+    a = actions.add_parser("delete", help="stop a recurring invoice")
+    a.add_argument("plan_id", type=int)
+
+    p = sub.add_parser("run-billing", help="issue every recurring invoice that is due")
+    p.add_argument(
+        "--through", metavar="YYYY-MM-DD", type=_iso_date, help="bill up to this date (today)"
+    )
+    p.add_argument("--dry-run", action="store_true", help="only list what is due")
+    p.add_argument("--no-pdf", action="store_true", help="do not render PDFs")
+    p.add_argument(
+        "--background", action="store_true", help="queue the PDFs for background workers"
+    )
+
+    p = sub.add_parser("import", help="bulk load invoices or clients from CSV/JSONL")
+    p.add_argument("file", help="a .csv file, or JSON lines otherwise")
+    p.add_argument("--clients", action="store_true", help="rows are clients")
+    p.add_argument("--pdf", action="store_true", help="render PDFs for new invoices")
+
+    return parser
+
+
+def main(argv=None):
+    opts = build_parser().parse_args(argv)
+    if opts.command is None:
+        RetroUI.boot_sequence()
+        try:
+            with Metrics.command("startup", opts.profile):
+                with Metrics.phase("shell.init"):
+                    shell = RetroShell()
+        except CorruptDataError as e:
+            RetroUI.error(str(e))
+            return 1
+        shell.run()
+        return 0
+
+    RetroUI.headless = True
+    try:
+        with Metrics.command(opts.command, opts.profile):
+            with Metrics.phase("shell.init"):
+                shell = RetroShell()
+            handler = getattr(shell, "cli_" + opts.command.replace("-", "_"))
+            handler(opts)
+    except (CommandError, CorruptDataError) as e:
+        print(f"retro-khaata: error: {e}", file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        # The reader went away (`| head`); point stdout at devnull so the
+        # interpreter's final flush does not fail again, and stop quietly.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    return 0
+
+
 if __name__ == "__main__":
-    RetroUI.boot_sequence()
-    shell = RetroShell()
-    shell.run()
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""Exact money arithmetic for invoices.
+
+Every line amount is a ``Decimal`` rounded half-up to the cent exactly once;
+subtotals and totals are plain sums of those rounded lines, plus the GST
+already worked out to the paisa by ``gst.invoice_tax``. Both the stored
+invoice ``total`` and the PDF are computed through ``InvoiceTotals``, so
+they agree by construction.
+"""
+
+from array import array
+from decimal import ROUND_HALF_UP, Decimal
+
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+
+def to_decimal(value):
+    # str() first so 0.1 becomes Decimal("0.1"), not its binary expansion
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def round_money(amount):
+    return to_decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def to_minor(amount):
+    """Amount in integer minor units (paise, cents)."""
+    return int(round_money(amount) * 100)
+
+
+def from_minor(units):
+    return Decimal(units).scaleb(-2)
+
+
+class LineItem:
+    """One service or reimbursement line with its rounded amount."""
+
+    __slots__ = ("desc", "rate", "qty", "amount")
+
+    def __init__(self, desc, rate, qty):
+        self.desc = desc
+        self.rate = to_decimal(rate)
+        self.qty = to_decimal(qty)
+        self.amount = round_money(self.rate * self.qty)
+
+    @classmethod
+    def from_dict(cls, item):
+        return cls(item["desc"], item["rate"], item["qty"])
+
+
+class InvoiceTotals:
+    """Line items, subtotals and grand total of one invoice."""
+
+    __slots__ = (
+        "services",
+        "reimbursements",
+        "services_total",
+        "reimbursements_total",
+        "tax",
+        "total",
+    )
+
+    def __init__(self, services, reimbursements, tax=ZERO):
+        self.services = [LineItem.from_dict(i) for i in services]
+        self.reimbursements = [LineItem.from_dict(i) for i in reimbursements]
+        self.services_total = sum((i.amount for i in self.services), ZERO)
+        self.reimbursements_total = sum((i.amount for i in self.reimbursements), ZERO)
+        self.tax = round_money(tax)
+        self.total = self.services_total + self.reimbursements_total + self.tax
+
+    @classmethod
+    def of(cls, invoice_data):
+        tax = invoice_data.get("tax")
+        return cls(
+            invoice_data.get("services", []),
+            invoice_data.get("reimbursements", []),
+            tax["total"] if tax else ZERO,
+        )
+
+
+class InvoiceColumns:
+    """Amounts of many invoices as integer minor-unit columns.
+
+    Building the columns prices each invoice once; totals and group-bys then
+    run over compact ``array`` columns of ints instead of invoice dicts and
+    Decimals.
+    """
+
+    __slots__ = ("keys", "services", "reimbursements")
+
+    def __init__(self, key_names):
+        self.keys = {name: [] for name in key_names}
+        self.services = array("q")
+        self.reimbursements = array("q")
+
+    @classmethod
+    def from_invoices(cls, invoices, key_func, key_names):
+        """``key_func(invoice)`` returns one group key per name in ``key_names``."""
+        columns = cls(key_names)
+        key_columns = [columns.keys[name] for name in key_names]
+        for invoice in invoices:
+            totals = InvoiceTotals.of(invoice)
+            columns.services.append(to_minor(totals.services_total))
+            columns.reimbursements.append(to_minor(totals.reimbursements_total))
+            for column, key in zip(key_columns, key_func(invoice)):
+                column.append(key)
+        return columns
+
+    def __len__(self):
+        return len(self.services)
+
+    def total(self):
+        return sum(self.services) + sum(self.reimbursements)
+
+    def amounts(self):
+        """Column of invoice totals in minor units."""
+        return array("q", map(int.__add__, self.services, self.reimbursements))
+
+    def group_sums(self, *names, values=()):
+        """{(key, ...): [services, reimbursements, count, *values]} over the named key columns.
+
+        ``values`` are extra per-invoice columns, summed after the count.
+        """
+        groups = {}
+        for key, services, reimbursements, *extra in zip(
+            zip(*(self.keys[n] for n in names)), self.services, self.reimbursements, *values
+        ):
+            cell = groups.get(key)
+            if cell is None:
+                groups[key] = [services, reimbursements, 1, *extra]
+            else:
+                cell[0] += services
+                cell[1] += reimbursements
+                cell[2] += 1
+                for i, value in enumerate(extra, 3):
+                    cell[i] += value
+        return groups
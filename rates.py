@@ -0,0 +1,206 @@
+"""Offline exchange rates for converting invoice amounts to INR.
+
+Rates are read from CSV files in a local directory, such as the RBI
+reference-rate downloads, and never fetched from the network. An amount is
+converted at the rate of its invoice date, or of the last published date
+before it (no rates are published on holidays), as long as that rate is at
+most MAX_RATE_AGE_DAYS old.
+
+Rates are held as integers scaled by RATE_SCALE, so converting a minor-unit
+amount is exact integer arithmetic with a single half-up rounding.
+"""
+
+import csv
+import hashlib
+import os
+import re
+from array import array
+from bisect import bisect_right
+from datetime import date, datetime
+from functools import lru_cache
+
+RATE_SCALE = 10**6
+MAX_RATE_AGE_DAYS = 10
+DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%d-%b-%Y", "%d %b %Y", "%d %B %Y")
+# "USD", "INR / 1 USD", "100 JPY": the currency and how many units a rate is for
+RATE_HEADER = re.compile(r"(?:(\d+)\s*)?\b([A-Z]{3})\b\s*$")
+
+
+class RateError(LookupError):
+    """No usable rate for a currency at a date."""
+
+
+def parse_date(text):
+    """Ordinal of a date written in any of DATE_FORMATS."""
+    text = text.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).toordinal()
+        except ValueError:
+            pass
+    raise ValueError(f"unrecognised date '{text}'")
+
+
+def to_rate(text, unit=1):
+    """Scaled INR rate of one unit from a rate quoted for ``unit`` units."""
+    whole, _, frac = text.strip().replace(",", "").partition(".")
+    frac = (frac + "0" * 6)[:6]
+    return (int(whole) * RATE_SCALE + int(frac)) // unit
+
+
+def convert(minor, rate):
+    """``minor`` units at a scaled ``rate``, rounded half-up to INR paise."""
+    units, rest = divmod(minor * rate, RATE_SCALE)
+    return units + (2 * rest >= RATE_SCALE)
+
+
+class RateTable:
+    """Dated INR rates per currency, loaded from every CSV in a directory.
+
+    Wide files have a date column and one column per currency, the way the
+    RBI publishes them (``Date, INR / 1 USD, INR / 100 JPY, ...``); long
+    files have ``date``, ``currency``, ``rate`` and optionally ``unit``
+    columns. Files are read in name order and later files win on the same
+    currency and date.
+    """
+
+    _cache = {}
+
+    def __init__(self, series):
+        # {currency: (array of date ordinals, array of scaled rates)}, by date
+        self.series = series
+        self.rate = lru_cache(maxsize=4096)(self._rate)
+
+    @staticmethod
+    def files(directory):
+        try:
+            names = sorted(n for n in os.listdir(directory) if n.lower().endswith(".csv"))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(directory, n) for n in names]
+
+    @staticmethod
+    def digest(directory):
+        """Changes whenever a rate file is added, removed or modified."""
+        h = hashlib.sha256()
+        for path in RateTable.files(directory):
+            st = os.stat(path)
+            h.update(f"{path}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+        return h.hexdigest()[:16]
+
+    @classmethod
+    def load(cls, directory):
+        """The table for ``directory``, re-read only when its files change."""
+        key = (os.path.abspath(directory), cls.digest(directory))
+        table = cls._cache.get(key)
+        if table is None:
+            rates = {}
+            for path in cls.files(directory):
+                with open(path, "r", newline="", encoding="utf-8-sig") as f:
+                    try:
+                        cls._read(csv.reader(f), rates)
+                    except ValueError as e:
+                        raise ValueError(f"{path}: {e}")
+            series = {}
+            for currency, by_date in rates.items():
+                days = sorted(by_date)
+                series[currency] = (
+                    array("l", days),
+                    array("q", (by_date[d] for d in days)),
+                )
+            cls._cache.clear()
+            table = cls._cache[key] = cls(series)
+        return table
+
+    @staticmethod
+    def _read(rows, rates):
+        header = [h.strip() for h in next(rows, [])]
+        lower = [h.lower() for h in header]
+        if "currency" in lower and "rate" in lower:
+            at = {name: lower.index(name) for name in ("date", "currency", "rate")}
+            unit_at = lower.index("unit") if "unit" in lower else None
+            for lineno, row in enumerate(rows, 2):
+                if not row or not row[at["rate"]].strip():
+                    continue
+                try:
+                    unit = int(row[unit_at]) if unit_at is not None else 1
+                    rate = to_rate(row[at["rate"]], unit)
+                    day = parse_date(row[at["date"]])
+                except (ValueError, IndexError) as e:
+                    raise ValueError(f"line {lineno}: {e}")
+                rates.setdefault(row[at["currency"]].strip().upper(), {})[day] = rate
+            return
+
+        date_at = next((i for i, h in enumerate(lower) if "date" in h), None)
+        if date_at is None:
+            raise ValueError("no date column")
+        columns = []
+        for i, name in enumerate(header):
+            match = RATE_HEADER.search(name)
+            if i != date_at and match and match.group(2) != "INR":
+                columns.append((i, match.group(2), int(match.group(1) or 1)))
+        for lineno, row in enumerate(rows, 2):
+            if not row or not row[date_at].strip():
+                continue
+            try:
+                day = parse_date(row[date_at])
+                for i, currency, unit in columns:
+                    # Blank or "NA" where a currency was not quoted that day
+                    value = row[i].strip() if i < len(row) else ""
+                    if value and value[0].isdigit():
+                        rates.setdefault(currency, {})[day] = to_rate(value, unit)
+            except ValueError as e:
+                raise ValueError(f"line {lineno}: {e}")
+
+    def _rate(self, currency, day):
+        if currency == "INR":
+            return RATE_SCALE
+        days, rates = self.series.get(currency, ((), ()))
+        # Last published rate on or before the day
+        lo = bisect_right(days, day)
+        if lo == 0 or day - days[lo - 1] > MAX_RATE_AGE_DAYS:
+            raise RateError(
+                f"no {currency} rate within {MAX_RATE_AGE_DAYS} days before "
+                f"{date.fromordinal(day).isoformat()}"
+            )
+        return rates[lo - 1]
+
+    def to_inr(self, currency, on, minor):
+        """INR paise for ``minor`` units of ``currency`` on the YYYY-MM-DD date ``on``."""
+        return convert(minor, self.rate(currency, date.fromisoformat(on).toordinal()))
+
+    def to_inr_column(self, currencies, dates, amounts):
+        """Convert parallel columns of currencies, YYYY-MM-DD dates and minor units.
+
+        Rows are grouped by currency and walked in date order alongside that
+        currency's rate series, so each series is scanned once for the whole
+        column. Returns ``(inr, unconverted)``: INR paise per row, and 1 for
+        rows without a usable rate (whose INR amount is left at 0).
+        """
+        inr = array("q", bytes(8 * len(amounts)))
+        unconverted = array("q", bytes(8 * len(amounts)))
+        by_currency = {}
+        for row, currency in enumerate(currencies):
+            by_currency.setdefault(currency, []).append(row)
+        for currency, rows in by_currency.items():
+            if currency == "INR":
+                for row in rows:
+                    inr[row] = amounts[row]
+                continue
+            days, rates = self.series.get(currency, ((), ()))
+            ordinals = {}
+            for row in rows:
+                on = dates[row]
+                if on not in ordinals:
+                    ordinals[on] = date.fromisoformat(on).toordinal()
+            rows.sort(key=lambda row: ordinals[dates[row]])
+            at = -1
+            for row in rows:
+                day = ordinals[dates[row]]
+                while at + 1 < len(days) and days[at + 1] <= day:
+                    at += 1
+                if at < 0 or day - days[at] > MAX_RATE_AGE_DAYS:
+                    unconverted[row] = 1
+                else:
+                    inr[row] = convert(amounts[row], rates[at])
+        return inr, unconverted
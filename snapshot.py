@@ -0,0 +1,249 @@
+"""Compact binary snapshots of record lists.
+
+A snapshot stores a list of JSON-like records column by column: records
+are grouped by their set of keys, and each key becomes one typed column
+(``array`` of ints, floats, bools, or indexes into a shared string table).
+Repeated strings such as client names, currencies and line item
+descriptions are stored, and loaded, once. Lists of records nested in a
+field (an invoice's services) are flattened into a table of their own.
+Values a column cannot hold natively are kept as JSON text.
+
+Loading rebuilds plain dicts and lists with bulk ``map`` calls over whole
+columns instead of parsing text value by value, so records come back exactly
+as they were written and callers cannot tell the two formats apart.
+
+Layout: MAGIC, a little-endian u32 header length, the JSON header (the
+column schema and buffer sizes), the UTF-8 string blob, then the raw
+column buffers in header order.
+"""
+
+import gc
+import json
+import struct
+import sys
+from array import array
+from itertools import accumulate, islice
+
+MAGIC = b"KHAATA-SNAPSHOT\n"
+VERSION = 1
+INT_MIN, INT_MAX = -(2**63), 2**63 - 1
+EXACT_FLOAT = 2**53  # ints up to this size survive a round trip through a double
+
+
+def encodable(data):
+    """Whether ``data`` is a list of records this format can hold."""
+    return isinstance(data, list) and all(type(r) is dict for r in data)
+
+
+def is_snapshot(path):
+    """Whether the file at ``path`` is a binary snapshot (rather than JSON)."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+class _Writer:
+    def __init__(self):
+        self.strings = {}
+        self.buffers = []
+
+    def buffer(self, values):
+        self.buffers.append(values)
+        return len(self.buffers) - 1
+
+    def intern(self, values):
+        strings = self.strings
+        return array("I", [strings.setdefault(v, len(strings)) for v in values])
+
+    def table(self, records):
+        shapes, groups = {}, []
+        shape_of = array("I")
+        for record in records:
+            keys = tuple(record)
+            shape = shapes.get(keys)
+            if shape is None:
+                shape = shapes[keys] = len(groups)
+                groups.append([])
+            groups[shape].append(record)
+            shape_of.append(shape)
+        return {
+            "rows": len(records),
+            "shapes": [
+                {
+                    "rows": len(group),
+                    "keys": list(keys),
+                    "columns": [self.column([r[k] for r in group]) for k in keys],
+                }
+                for keys, group in zip(shapes, groups)
+            ],
+            # Row order across shapes; not needed when all records look alike
+            "order": self.buffer(shape_of) if len(groups) > 1 else None,
+        }
+
+    def column(self, values):
+        types = set(map(type, values))
+        if types == {str}:
+            return {"type": "str", "buf": self.buffer(self.intern(values))}
+        if types == {int} and INT_MIN <= min(values) and max(values) <= INT_MAX:
+            return {"type": "int", "buf": self.buffer(array("q", values))}
+        if types == {float}:
+            return {"type": "float", "buf": self.buffer(array("d", values))}
+        if types == {int, float} and all(
+            type(v) is float or -EXACT_FLOAT <= v <= EXACT_FLOAT for v in values
+        ):
+            # Numbers like totals that are sometimes whole: doubles plus a flag
+            return {
+                "type": "number",
+                "buf": self.buffer(array("d", values)),
+                "ints": self.buffer(array("b", [type(v) is int for v in values])),
+            }
+        if types == {bool}:
+            return {"type": "bool", "buf": self.buffer(array("b", values))}
+        if types == {type(None)}:
+            return {"type": "null"}
+        if types == {dict}:
+            return {"type": "record", "table": self.table(values)}
+        if types == {list} and all(type(i) is dict for v in values for i in v):
+            return {
+                "type": "records",
+                "counts": self.buffer(array("I", map(len, values))),
+                "table": self.table([i for v in values for i in v]),
+            }
+        texts = [json.dumps(v, separators=(",", ":")) for v in values]
+        return {"type": "json", "buf": self.buffer(self.intern(texts))}
+
+
+def dumps(records):
+    """Encode a list of records (see ``encodable``) as snapshot bytes."""
+    writer = _Writer()
+    table = writer.table(records)
+    strings = list(writer.strings)
+    blob = "".join(strings).encode("utf-8")
+    lengths = writer.buffer(array("I", map(len, strings)))
+    chunks = []
+    for values in writer.buffers:
+        if sys.byteorder == "big":
+            values.byteswap()
+        chunks.append(values.tobytes())
+    header = json.dumps(
+        {
+            "version": VERSION,
+            "strings": {"bytes": len(blob), "lengths": lengths},
+            "buffers": [
+                [values.typecode, len(chunk)] for values, chunk in zip(writer.buffers, chunks)
+            ],
+            "table": table,
+        },
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return b"".join([MAGIC, struct.pack("<I", len(header)), header, blob, *chunks])
+
+
+def _builder(keys):
+    """``f(*values)`` returning ``{keys[0]: values[0], ...}`` as a dict display.
+
+    A compiled display is about twice as fast as ``dict(zip(keys, values))``.
+    Keys are only ever embedded as ``repr`` literals.
+    """
+    args = ", ".join(f"_{i}" for i in range(len(keys)))
+    items = ", ".join(f"{key!r}: _{i}" for i, key in enumerate(keys))
+    return eval(f"lambda {args}: {{{items}}}")
+
+
+class _Reader:
+    def __init__(self, data):
+        view = memoryview(data)
+        start = len(MAGIC)
+        if bytes(view[:start]) != MAGIC:
+            raise ValueError("not a snapshot")
+        (size,) = struct.unpack_from("<I", view, start)
+        start += 4
+        header = json.loads(bytes(view[start : start + size]))
+        if not isinstance(header, dict) or "version" not in header:
+            raise ValueError("snapshot header is not an object with a version")
+        if header["version"] != VERSION:
+            raise ValueError(f"unsupported snapshot version {header['version']}")
+        start += size
+        blob = header["strings"]["bytes"]
+        text = str(view[start : start + blob], "utf-8")
+        start += blob
+
+        self.buffers = []
+        for typecode, length in header["buffers"]:
+            values = array(typecode)
+            values.frombytes(view[start : start + length])
+            if sys.byteorder == "big":
+                values.byteswap()
+            self.buffers.append(values)
+            start += length
+        if start != len(view):
+            raise ValueError("truncated snapshot")
+
+        ends = list(accumulate(self.buffers[header["strings"]["lengths"]]))
+        self.strings = [text[a:b] for a, b in zip([0] + ends, ends)]
+        self.table_spec = header["table"]
+
+    def table(self, spec):
+        groups = []
+        for shape in spec["shapes"]:
+            keys = shape["keys"]
+            if not all(type(key) is str for key in keys):
+                raise ValueError("snapshot keys must be strings")
+            columns = [self.column(c, shape["rows"]) for c in shape["columns"]]
+            if columns:
+                groups.append(list(map(_builder(keys), *columns)))
+            else:
+                groups.append([{} for _ in range(shape["rows"])])
+        if spec["order"] is None:
+            return groups[0] if groups else []
+        rows = [iter(group) for group in groups]
+        return [next(rows[shape]) for shape in self.buffers[spec["order"]]]
+
+    def column(self, spec, rows):
+        kind = spec["type"]
+        if kind == "str":
+            return list(map(self.strings.__getitem__, self.buffers[spec["buf"]]))
+        if kind in ("int", "float"):
+            return self.buffers[spec["buf"]].tolist()
+        if kind == "number":
+            values = self.buffers[spec["buf"]].tolist()
+            ints = self.buffers[spec["ints"]]
+            return [int(v) if i else v for v, i in zip(values, ints)]
+        if kind == "bool":
+            return list(map(bool, self.buffers[spec["buf"]]))
+        if kind == "null":
+            return [None] * rows
+        if kind == "record":
+            return self.table(spec["table"])
+        if kind == "records":
+            items = iter(self.table(spec["table"]))
+            return [list(islice(items, n)) for n in self.buffers[spec["counts"]]]
+        if kind == "json":
+            texts = map(self.strings.__getitem__, self.buffers[spec["buf"]])
+            return list(map(json.loads, texts))
+        raise ValueError(f"unknown column type '{kind}'")
+
+
+def loads(data):
+    """Decode snapshot bytes back into the list of records.
+
+    Raises ValueError for anything that is not a well-formed snapshot; a
+    damaged header or buffer fails in whatever way the lookup into it does,
+    so those failures are reported as ValueError too.
+    """
+    # Nothing decoded can form a cycle; don't let the collector rescan the
+    # growing heap of new dicts over and over.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        reader = _Reader(data)
+        return reader.table(reader.table_spec)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"corrupt snapshot: {type(e).__name__}: {e}") from e
+    finally:
+        if enabled:
+            gc.enable()